@@ -0,0 +1,329 @@
+"""
+Нагрузочный бенчмарк эндпоинтов catalog/urls.py.
+
+Запуск:
+    python -m benchmarks.api --output bench.json
+    python -m benchmarks.api --baseline bench.json --threshold 0.15
+
+Каждый эндпоинт прогоняется в процессе (django.test.Client) и через
+локальный HTTP-сервер при разной конкурентности. В отчет попадают
+пропускная способность, p50/p95/p99 и число SQL-запросов на запрос
+(из заголовка Server-Timing, который ставит PerformanceMiddleware).
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from socketserver import ThreadingMixIn
+from typing import Callable, Optional
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from .common import percentile, setup_django, test_database
+from .compare import compare
+
+QUERIES_RE = re.compile(r'desc="(\d+) queries"')
+
+
+@dataclass
+class Scenario:
+    """
+    Один эндпоинт: как построить запрос и что подготовить перед ним (вне замера).
+    
+    build возвращает (path, body) или (path, body, headers).
+    """
+    name: str
+    method: str
+    build: Callable
+    auth: bool = False
+    prepare: Optional[Callable] = None
+
+
+def _cart_item_id(user, product_ids):
+    from catalog.models import CartItem
+    item, _ = CartItem.objects.get_or_create(cart_id=user['cart_id'], product_id=product_ids[0])
+    return item.pk
+
+
+def _fresh_cart_item(user, product_ids, rng):
+    from catalog.models import CartItem
+    product_id = rng.choice(product_ids)
+    CartItem.objects.filter(cart_id=user['cart_id'], product_id=product_id).delete()
+    return CartItem.objects.create(cart_id=user['cart_id'], product_id=product_id).pk
+
+
+def _fill_cart(user, product_ids, rng):
+    from catalog.models import CartItem
+    CartItem.objects.bulk_create(
+        [CartItem(cart_id=user['cart_id'], product_id=product_id)
+         for product_id in rng.sample(product_ids, min(3, len(product_ids)))],
+        ignore_conflicts=True,
+    )
+
+
+def _product_slug(product_ids, rng):
+    from catalog.models import Product
+    return Product.objects.values_list('slug', flat=True).get(pk=rng.choice(product_ids))
+
+
+def scenarios(data):
+    product_ids = data['product_ids']
+    pages = max(1, len(product_ids) // 10)
+    return [
+        Scenario('category-list', 'GET', lambda user, i, rng, prep: ('/api/categories/', None)),
+        Scenario('product-list', 'GET',
+                 lambda user, i, rng, prep: (f'/api/products/?page={i % pages + 1}', None)),
+        Scenario('product-detail', 'GET', lambda user, i, rng, prep: (f'/api/products/{prep}/', None),
+                 prepare=lambda user, rng: _product_slug(product_ids, rng)),
+        Scenario('product-multi-get', 'GET',
+                 lambda user, i, rng, prep: ('/api/products/?ids=' + ','.join(
+                     str(pk) for pk in rng.sample(product_ids, min(20, len(product_ids)))), None)),
+        Scenario('product-related', 'GET',
+                 lambda user, i, rng, prep: (f'/api/products/{rng.choice(product_ids)}/related/', None)),
+        Scenario('catalog-changes', 'GET',
+                 lambda user, i, rng, prep: (f'/api/catalog/changes/?after={i * 50}&limit=100', None)),
+        Scenario('login', 'POST',
+                 lambda user, i, rng, prep: ('/api/login/', {'username': user['username'],
+                                                           'password': data['password']})),
+        Scenario('cart-detail', 'GET', lambda user, i, rng, prep: ('/api/cart/', None), auth=True),
+        Scenario('cart-summary', 'GET', lambda user, i, rng, prep: ('/api/cart/summary/', None), auth=True),
+        Scenario('cart-add', 'POST',
+                 lambda user, i, rng, prep: ('/api/cart/add/', {'product_id': rng.choice(product_ids),
+                                                              'quantity': 1}),
+                 auth=True),
+        Scenario('cart-item-update', 'PUT',
+                 lambda user, i, rng, prep: (f'/api/cart/item/{prep}/', {'quantity': i % 5 + 1}),
+                 auth=True, prepare=lambda user, rng: _cart_item_id(user, product_ids)),
+        Scenario('cart-item-remove', 'DELETE',
+                 lambda user, i, rng, prep: (f'/api/cart/item/{prep}/remove/', None),
+                 auth=True, prepare=lambda user, rng: _fresh_cart_item(user, product_ids, rng)),
+        Scenario('cart-clear', 'DELETE', lambda user, i, rng, prep: ('/api/cart/clear/', None),
+                 auth=True, prepare=lambda user, rng: _fill_cart(user, product_ids, rng)),
+        # Ключ не зависит от --seed: повторный прогон с тем же seed не должен получить
+        # сохраненные ответы прошлого прогона вместо оформления заказа
+        Scenario('cart-checkout', 'POST',
+                 lambda user, i, rng, prep: ('/api/cart/checkout/', None,
+                                             {'Idempotency-Key': str(uuid.uuid4())}),
+                 auth=True, prepare=lambda user, rng: _fill_cart(user, product_ids, rng)),
+    ]
+
+
+class InProcessDriver:
+    """Запросы через django.test.Client, без сети"""
+    mode = 'inprocess'
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def request(self, method, path, body, token, headers=None):
+        from django.test import Client
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = Client()
+        headers = dict(headers or {})
+        if token:
+            headers['Authorization'] = f'Token {token}'
+        response = getattr(client, method.lower())(
+            path, data=json.dumps(body) if body is not None else None,
+            content_type='application/json', headers=headers
+        )
+        return response.status_code, response.get('Server-Timing', '')
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class HttpDriver:
+    """Запросы по HTTP к локальному многопоточному WSGI-серверу"""
+    mode = 'http'
+
+    def __init__(self):
+        from django.core.wsgi import get_wsgi_application
+        self.server = make_server('127.0.0.1', 0, get_wsgi_application(),
+                                  server_class=_ThreadingWSGIServer, handler_class=_QuietHandler)
+        self.server.request_queue_size = 128
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def request(self, method, path, body, token, headers=None):
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+        headers = {'Content-Type': 'application/json', **(headers or {})}
+        if token:
+            headers['Authorization'] = f'Token {token}'
+        try:
+            conn.request(method, path, body=json.dumps(body) if body is not None else None,
+                         headers=headers)
+            response = conn.getresponse()
+            response.read()
+            return response.status, response.getheader('Server-Timing', '')
+        finally:
+            conn.close()
+
+
+def run_scenario(driver, scenario, data, concurrency, total_requests, seed):
+    """Прогоняет сценарий и возвращает строку отчета"""
+    users = data['users']
+    per_worker = max(1, total_requests // concurrency)
+
+    def worker(index):
+        rng = random.Random(seed + index)
+        # Каждый поток работает со своим пользователем, как разные покупатели
+        user = users[index % len(users)]
+        timings, queries, errors = [], [], 0
+        for i in range(per_worker):
+            prep = scenario.prepare(user, rng) if scenario.prepare else None
+            path, body, *headers = scenario.build(user, i, rng, prep)
+            token = user['token'] if scenario.auth else None
+            start = time.perf_counter()
+            try:
+                status_code, server_timing = driver.request(
+                    scenario.method, path, body, token, headers[0] if headers else None
+                )
+            except OSError:
+                errors += 1
+                continue
+            timings.append(time.perf_counter() - start)
+            if status_code >= 400:
+                errors += 1
+            match = QUERIES_RE.search(server_timing)
+            if match:
+                queries.append(int(match.group(1)))
+        return timings, queries, errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(worker, range(concurrency)))
+    wall = time.perf_counter() - started
+
+    timings = [t for result in results for t in result[0]]
+    queries = [q for result in results for q in result[1]]
+    errors = sum(result[2] for result in results)
+    to_ms = lambda value: round(value * 1000, 3) if value is not None else None
+    return {
+        'endpoint': scenario.name,
+        'mode': driver.mode,
+        'concurrency': concurrency,
+        'requests': len(timings),
+        'errors': errors,
+        'throughput_rps': round(len(timings) / wall, 2) if wall else None,
+        'p50_ms': to_ms(percentile(timings, 50)),
+        'p95_ms': to_ms(percentile(timings, 95)),
+        'p99_ms': to_ms(percentile(timings, 99)),
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--categories', type=int, default=5)
+    parser.add_argument('--subcategories', type=int, default=4, help='на одну категорию')
+    parser.add_argument('--products', type=int, default=50, help='на одну подкатегорию')
+    parser.add_argument('--users', type=int, default=32)
+    parser.add_argument('--cart-items', type=int, default=5, help='товаров в каждой корзине')
+    parser.add_argument('--requests', type=int, default=200, help='запросов на сценарий')
+    parser.add_argument('--concurrency', default='1,4,16')
+    parser.add_argument('--modes', default='inprocess,http')
+    parser.add_argument('--endpoints', default='', help='через запятую; по умолчанию все')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='файл для JSON-отчета (по умолчанию stdout)')
+    parser.add_argument('--baseline', help='отчет для сравнения')
+    parser.add_argument('--threshold', type=float, default=0.15)
+    args = parser.parse_args(argv)
+
+    # Построчный лог запросов исказил бы замеры
+    os.environ.setdefault('REQUEST_LOG_LEVEL', 'WARNING')
+    os.environ.setdefault('CATALOG_LOG_LEVEL', 'ERROR')
+    setup_django()
+    from django.conf import settings
+    from benchmarks.data import generate
+
+    settings.ALLOWED_HOSTS = ['127.0.0.1', 'testserver']
+    concurrency_levels = [int(value) for value in args.concurrency.split(',')]
+    modes = args.modes.split(',')
+    wanted = set(filter(None, args.endpoints.split(',')))
+
+    db_dir = tempfile.mkdtemp()
+    with test_database(os.path.join(db_dir, 'bench.sqlite3')):
+        data = generate(args.categories, args.subcategories, args.products,
+                        args.users, args.cart_items, seed=args.seed)
+        from catalog.recommendations import build_related
+        build_related()
+        results = []
+        for mode in modes:
+            driver = HttpDriver() if mode == 'http' else InProcessDriver()
+            try:
+                for scenario in scenarios(data):
+                    if wanted and scenario.name not in wanted:
+                        continue
+                    for concurrency in concurrency_levels:
+                        result = run_scenario(driver, scenario, data, concurrency,
+                                              args.requests, args.seed)
+                        results.append(result)
+                        print(f"{result['endpoint']:<18} {mode:<9} c={concurrency:<3} "
+                              f"{result['throughput_rps']:>9} rps  p95={result['p95_ms']} ms  "
+                              f"q/req={result['queries_per_request']}", file=sys.stderr)
+            finally:
+                if mode == 'http':
+                    driver.close()
+    os.rmdir(db_dir)
+
+    report = {
+        'meta': {
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'data': {
+                'categories': args.categories, 'subcategories': args.subcategories,
+                'products': args.products, 'users': args.users, 'cart_items': args.cart_items,
+            },
+            'requests': args.requests,
+            'seed': args.seed,
+        },
+        'results': results,
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
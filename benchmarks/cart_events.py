@@ -0,0 +1,189 @@
+"""
+Нагрузочный тест SSE-потока корзины (/api/cart/events/).
+
+Запуск: python -m benchmarks.cart_events --connections 50,200,500
+
+ASGI-приложение config.asgi вызывается напрямую, без сетевого сервера:
+открывается N одновременных потоков, затем меняется цена товара, который
+лежит во всех корзинах. В отчете — время до первого снимка, прирост
+памяти на соединение, задержка доставки уведомления всем подписчикам,
+число неудачных подключений (не 200 или без снимка за --timeout),
+пропущенных уведомлений и подписок, оставшихся после отключения клиентов
+(все три должны быть 0).
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+from .common import percentile, setup_django, test_database
+
+
+def rss_bytes():
+    """Текущий RSS процесса (Linux); None, если недоступно"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+class Connection:
+    """Один SSE-клиент поверх прямого вызова ASGI-приложения"""
+    
+    def __init__(self, app, token):
+        self.app = app
+        self.token = token
+        self.started = None
+        self.status = None
+        self.events = []
+        self.received = asyncio.Event()
+        # Первый снимок, ответ не 200 или завершение обработчика
+        self.settled = asyncio.Event()
+        self.closed = asyncio.Event()
+        self._body_sent = False
+    
+    async def receive(self):
+        if not self._body_sent:
+            self._body_sent = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await self.closed.wait()
+        return {'type': 'http.disconnect'}
+    
+    @property
+    def connected(self):
+        return self.status == 200 and bool(self.events)
+    
+    async def send(self, message):
+        if message['type'] == 'http.response.start':
+            self.status = message['status']
+            if self.status != 200:
+                self.settled.set()
+        elif message['type'] == 'http.response.body' and message.get('body', b'').startswith(b'event:'):
+            self.events.append(time.perf_counter())
+            self.received.set()
+            self.settled.set()
+    
+    async def run(self):
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+            'method': 'GET', 'scheme': 'http', 'root_path': '',
+            'path': '/api/cart/events/', 'raw_path': b'/api/cart/events/',
+            'query_string': f'token={self.token}'.encode(),
+            'headers': [(b'host', b'127.0.0.1')],
+            'client': ('127.0.0.1', 0), 'server': ('127.0.0.1', 80),
+        }
+        self.started = time.perf_counter()
+        try:
+            await self.app(scope, self.receive, self.send)
+        finally:
+            self.settled.set()
+
+
+async def wait_all(events, timeout):
+    """Ждет события не дольше timeout; неуспевшие остаются не установленными"""
+    if not events:
+        return
+    waiters = [asyncio.create_task(event.wait()) for event in events]
+    _, pending = await asyncio.wait(waiters, timeout=timeout)
+    for waiter in pending:
+        waiter.cancel()
+
+
+async def run_level(app, users, product_id, new_price, timeout):
+    from catalog.events import get_broker
+    from catalog.pricing import bulk_update_prices
+    
+    rss_before = rss_bytes()
+    connections = [Connection(app, user['token']) for user in users]
+    tasks = [asyncio.create_task(connection.run()) for connection in connections]
+    await wait_all([c.settled for c in connections], timeout)
+    rss_after = rss_bytes()
+    # Отказ в подключении или снимок, не пришедший за timeout, — ошибка уровня, а не падение
+    connected = [c for c in connections if c.connected]
+    connect = [c.events[0] - c.started for c in connected]
+    
+    for connection in connected:
+        connection.received.clear()
+    published = time.perf_counter()
+    # Изменение цены — обычный синхронный код, как в админке или API
+    await asyncio.to_thread(bulk_update_prices, [{'id': product_id, 'price': new_price}])
+    await wait_all([c.received for c in connected], timeout)
+    fanout = [c.events[-1] - published for c in connected if len(c.events) > 1]
+    
+    for connection in connections:
+        connection.closed.set()
+    await asyncio.wait(tasks, timeout=timeout)
+    # Обработчик отключения снимает подписки асинхронно
+    await asyncio.sleep(0.1)
+    
+    to_ms = lambda value: round(value * 1000, 3) if value is not None else None
+    return {
+        'connections': len(connections),
+        'connect_p50_ms': to_ms(percentile(connect, 50)),
+        'connect_p95_ms': to_ms(percentile(connect, 95)),
+        'memory_per_connection_kb': (
+            round((rss_after - rss_before) / len(connections) / 1024, 1)
+            if rss_before is not None else None
+        ),
+        'failed_connects': len(connections) - len(connected),
+        'delivered': len(fanout),
+        'missed_events': len(connected) - len(fanout),
+        'fanout_p50_ms': to_ms(percentile(fanout, 50)),
+        'fanout_p95_ms': to_ms(percentile(fanout, 95)),
+        'fanout_max_ms': to_ms(max(fanout) if fanout else None),
+        'leaked_subscriptions': get_broker().subscription_count,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--connections', default='50,200')
+    parser.add_argument('--products', type=int, default=20, help='на одну подкатегорию')
+    parser.add_argument('--cart-items', type=int, default=3)
+    parser.add_argument('--timeout', type=float, default=60.0)
+    args = parser.parse_args(argv)
+    
+    os.environ.setdefault('REQUEST_LOG_LEVEL', 'WARNING')
+    os.environ.setdefault('CATALOG_LOG_LEVEL', 'ERROR')
+    setup_django()
+    from django.conf import settings
+    from django.core.asgi import get_asgi_application
+    from benchmarks.data import generate
+    from catalog.models import CartItem
+    
+    settings.ALLOWED_HOSTS = ['127.0.0.1', 'testserver']
+    levels = [int(value) for value in args.connections.split(',')]
+    db_dir = tempfile.mkdtemp()
+    report = []
+    with test_database(os.path.join(db_dir, 'bench.sqlite3')):
+        data = generate(products=args.products, users=max(levels), cart_items=args.cart_items)
+        product_id = data['product_ids'][0]
+        CartItem.objects.bulk_create(
+            [CartItem(cart_id=user['cart_id'], product_id=product_id) for user in data['users']],
+            ignore_conflicts=True,
+        )
+        app = get_asgi_application()
+        for index, level in enumerate(levels):
+            result = asyncio.run(run_level(app, data['users'][:level], product_id,
+                                           f'{100 + index}.00', args.timeout))
+            report.append(result)
+            print(f"c={level:<5} connect p95={result['connect_p95_ms']} ms  "
+                  f"fanout p95={result['fanout_p95_ms']} ms  "
+                  f"delivered={result['delivered']}/{level}  "
+                  f"failed connects={result['failed_connects']}  "
+                  f"missed={result['missed_events']}", file=sys.stderr)
+    os.rmdir(db_dir)
+    
+    print(json.dumps(report, indent=2))
+    failed = any(
+        row['failed_connects'] or row['missed_events'] or row['leaked_subscriptions'] for row in report
+    )
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
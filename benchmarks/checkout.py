@@ -0,0 +1,97 @@
+"""
+Пропускная способность оформления заказов.
+
+Запуск: python -m benchmarks.checkout --users 200 --concurrency 1,8 --retries 2
+
+Каждый пользователь с заполненной корзиной оформляет заказ; каждый запрос
+повторяется --retries раз с тем же Idempotency-Key, как это делает
+клиент при обрыве связи. Отчет показывает заказы в секунду, задержки
+и число дублей (должно быть 0).
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from .api import HttpDriver, InProcessDriver
+from .common import percentile, setup_django, test_database
+
+
+def run(driver, users, concurrency, retries):
+    def worker(user):
+        key = uuid.uuid4().hex
+        timings, statuses = [], []
+        for _ in range(retries):
+            start = time.perf_counter()
+            status_code, _ = driver.request('POST', '/api/cart/checkout/', None, user['token'],
+                                            {'Idempotency-Key': key})
+            timings.append(time.perf_counter() - start)
+            statuses.append(status_code)
+        return timings, statuses
+    
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(worker, users))
+    wall = time.perf_counter() - started
+    
+    timings = [t for result in results for t in result[0]]
+    statuses = [s for result in results for s in result[1]]
+    return timings, statuses, wall
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--cart-items', type=int, default=5)
+    parser.add_argument('--products', type=int, default=50, help='на одну подкатегорию')
+    parser.add_argument('--concurrency', default='1,8')
+    parser.add_argument('--retries', type=int, default=2, help='запросов с одним ключом')
+    parser.add_argument('--mode', choices=['inprocess', 'http'], default='inprocess')
+    args = parser.parse_args(argv)
+    
+    os.environ.setdefault('REQUEST_LOG_LEVEL', 'WARNING')
+    os.environ.setdefault('CATALOG_LOG_LEVEL', 'ERROR')
+    setup_django()
+    from django.conf import settings
+    from benchmarks.data import generate
+    from catalog.models import Order
+    
+    settings.ALLOWED_HOSTS = ['127.0.0.1', 'testserver']
+    report = []
+    for concurrency in [int(value) for value in args.concurrency.split(',')]:
+        db_dir = tempfile.mkdtemp()
+        with test_database(os.path.join(db_dir, 'bench.sqlite3')):
+            data = generate(products=args.products, users=args.users, cart_items=args.cart_items)
+            driver = HttpDriver() if args.mode == 'http' else InProcessDriver()
+            try:
+                timings, statuses, wall = run(driver, data['users'], concurrency, args.retries)
+            finally:
+                if args.mode == 'http':
+                    driver.close()
+            orders = Order.objects.count()
+        os.rmdir(db_dir)
+        
+        report.append({
+            'mode': args.mode,
+            'concurrency': concurrency,
+            'users': args.users,
+            'requests': len(timings),
+            'orders': orders,
+            'duplicates': max(0, orders - args.users),
+            'errors': sum(1 for status_code in statuses if status_code >= 400),
+            'orders_per_second': round(orders / wall, 2),
+            'p50_ms': round(percentile(timings, 50) * 1000, 3),
+            'p95_ms': round(percentile(timings, 95) * 1000, 3),
+            'p99_ms': round(percentile(timings, 99) * 1000, 3),
+        })
+    
+    print(json.dumps(report, indent=2))
+    return 1 if any(row['duplicates'] for row in report) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,50 @@
+import os
+import sys
+from contextlib import contextmanager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_django():
+    """Настраивает Django для запуска бенчмарков как обычных скриптов"""
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    import django
+    django.setup()
+    # Бенчмарки меряют обработку запросов, а не ограничители частоты
+    from django.conf import settings
+    settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'] = {}
+    settings.CONCURRENCY_LIMIT = None
+
+
+@contextmanager
+def test_database(path=None):
+    """
+    Отдельная тестовая БД на время бенчмарка, рабочая БД не затрагивается.
+    
+    path задает файл SQLite — он нужен, когда к БД обращаются из нескольких
+    потоков (HTTP-сервер); по умолчанию используется БД в памяти.
+    """
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+    
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    if path:
+        connection.settings_dict['TEST']['NAME'] = path
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def percentile(values, pct):
+    """Перцентиль по методу ближайшего ранга"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
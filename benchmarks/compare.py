@@ -0,0 +1,74 @@
+"""
+Сравнение двух отчетов benchmarks.api.
+
+Запуск: python -m benchmarks.compare baseline.json current.json --threshold 0.15
+"""
+import argparse
+import json
+import sys
+
+
+def _key(result):
+    return result['endpoint'], result['mode'], result['concurrency']
+
+
+def compare(baseline, current, threshold):
+    """
+    Возвращает список регрессий относительно baseline.
+    
+    Время (p95) и пропускная способность сравниваются с допуском threshold,
+    число запросов к БД детерминировано и сравнивается строго. Сценарий,
+    в котором все запросы завершились ошибкой, не имеет p95 и пропускной
+    способности (None) — это регрессия, если в baseline они были.
+    """
+    previous = {_key(result): result for result in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        old = previous.get(_key(result))
+        if old is None:
+            continue
+        name = '{} [{}, c={}]'.format(*_key(result))
+        missing = [
+            field for field in ('p95_ms', 'throughput_rps')
+            if old[field] is not None and result[field] is None
+        ]
+        if missing:
+            regressions.append(
+                f"{name}: нет {', '.join(missing)} (ошибок: {result.get('errors')}), "
+                f"в baseline p95 {old['p95_ms']} ms, throughput {old['throughput_rps']} rps"
+            )
+            continue
+        if old['p95_ms'] and result['p95_ms'] > old['p95_ms'] * (1 + threshold):
+            regressions.append(f"{name}: p95 {old['p95_ms']} -> {result['p95_ms']} ms")
+        if old['throughput_rps'] and result['throughput_rps'] < old['throughput_rps'] * (1 - threshold):
+            regressions.append(
+                f"{name}: throughput {old['throughput_rps']} -> {result['throughput_rps']} rps"
+            )
+        old_queries, new_queries = old['queries_per_request'], result['queries_per_request']
+        if old_queries is not None and new_queries is not None and new_queries > old_queries:
+            regressions.append(f"{name}: queries/request {old_queries} -> {new_queries}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=0.15)
+    args = parser.parse_args(argv)
+    
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    
+    regressions = compare(baseline, current, args.threshold)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    if not regressions:
+        print("Регрессий не найдено")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
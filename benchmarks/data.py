@@ -0,0 +1,62 @@
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from rest_framework.authtoken.models import Token
+
+from catalog.models import Category, SubCategory, Product, Cart, CartItem
+
+PASSWORD = 'bench-pass-123'
+
+
+def generate(categories=5, subcategories=4, products=50, users=20, cart_items=5, seed=42):
+    """
+    Создает синтетический каталог и корзины через bulk_create.
+    
+    subcategories и products задаются на одну категорию/подкатегорию.
+    Возвращает словарь с id товаров и данными пользователей для сценариев.
+    """
+    rng = random.Random(seed)
+    
+    category_objs = Category.objects.bulk_create(
+        Category(name=f'Категория {c}', slug=f'bench-category-{c}')
+        for c in range(categories)
+    )
+    subcategory_objs = SubCategory.objects.bulk_create(
+        SubCategory(name=f'Подкатегория {c}-{s}', slug=f'bench-subcategory-{c}-{s}', category=category)
+        for c, category in enumerate(category_objs)
+        for s in range(subcategories)
+    )
+    product_objs = Product.objects.bulk_create(
+        Product(
+            name=f'Товар {sub.pk}-{p}',
+            slug=f'bench-product-{sub.pk}-{p}',
+            price=rng.randint(1000, 100000) / 100,
+            subcategory=sub,
+        )
+        for sub in subcategory_objs
+        for p in range(products)
+    )
+    product_ids = [product.pk for product in product_objs]
+    
+    # Один хэш на всех пользователей: хэширование пароля — самая медленная часть генерации
+    password = make_password(PASSWORD)
+    user_objs = User.objects.bulk_create(
+        User(username=f'bench-user-{u}', password=password) for u in range(users)
+    )
+    tokens = Token.objects.bulk_create(Token(user=user, key=Token.generate_key()) for user in user_objs)
+    carts = Cart.objects.bulk_create(Cart(user=user) for user in user_objs)
+    CartItem.objects.bulk_create(
+        CartItem(cart=cart, product_id=product_id, quantity=rng.randint(1, 5))
+        for cart in carts
+        for product_id in rng.sample(product_ids, min(cart_items, len(product_ids)))
+    )
+    
+    return {
+        'product_ids': product_ids,
+        'users': [
+            {'username': user.username, 'token': token.key, 'cart_id': cart.pk}
+            for user, token, cart in zip(user_objs, tokens, carts)
+        ],
+        'password': PASSWORD,
+    }
@@ -0,0 +1,158 @@
+"""
+Накладные расходы PerformanceMiddleware.
+
+Запуск: python -m benchmarks.instrumentation_overhead --requests 2000
+
+Сравнивает медианное время запроса к /api/products/ с middleware и без
+него. Middleware замеряется как в продакшене — со структурированной
+JSON-строкой catalog.requests на каждый запрос; вывод идет в /dev/null
+(или в --log-file), чтобы не мерять скорость терминала. Отдельно в отчете
+накладные расходы без строки лога и стоимость одной строки (log_line_us).
+
+Разница медиан в 1–2% сравнима с шумом машины, поэтому накладные расходы
+считаются в каждом из --rounds раундов отдельно, а в отчете — среднее по
+раундам и его 95% доверительный интервал. Код возврата 1, только если
+весь интервал выше --max-overhead (превышение не объясняется шумом).
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+
+from .common import setup_django, test_database
+
+MIDDLEWARE_PATH = 'catalog.middleware.PerformanceMiddleware'
+
+# Квантиль 0.975 распределения Стьюдента по числу степеней свободы;
+# для промежуточных значений берется ближайшее меньшее (интервал шире)
+T_975 = {1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306,
+         9: 2.262, 10: 2.228, 15: 2.131, 20: 2.086, 30: 2.042, 60: 2.000, 120: 1.980}
+
+
+def measure(client, url, count):
+    timings = []
+    for _ in range(count):
+        start = time.perf_counter()
+        client.get(url)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def log_line_cost(logger, count=10000):
+    """Среднее время одной строки лога запроса (как в PerformanceMiddleware), мкс"""
+    extra = {
+        'event': 'request', 'view': 'product-list', 'status': 200, 'duration_ms': 1.0,
+        'db_queries': 2, 'db_ms': 0.1, 'serialize_ms': 0.5, 'response_bytes': 1500,
+    }
+    start = time.perf_counter()
+    for _ in range(count):
+        logger.info("%s %s", 'GET', '/api/products/', extra=extra)
+    return (time.perf_counter() - start) / count * 1e6
+
+
+def confidence_interval(values):
+    """Среднее и 95% доверительный интервал среднего (None при одном значении)"""
+    mean = statistics.mean(values)
+    if len(values) < 2:
+        return mean, None
+    df = len(values) - 1
+    t = T_975[max(key for key in T_975 if key <= df)]
+    half = t * statistics.stdev(values) / len(values) ** 0.5
+    return mean, (mean - half, mean + half)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--products', type=int, default=50)
+    parser.add_argument('--max-overhead', type=float, default=0.02)
+    parser.add_argument('--log-file', help='куда писать лог запросов (по умолчанию /dev/null)')
+    args = parser.parse_args(argv)
+    
+    os.environ.setdefault('CATALOG_LOG_LEVEL', 'ERROR')
+    setup_django()
+    # Те же обработчик и JSON-форматтер, что в продакшене, но без вывода в консоль
+    sink = open(args.log_file or os.devnull, 'a')
+    for handler in logging.getLogger('catalog').handlers:
+        if isinstance(handler, logging.StreamHandler):
+            handler.setStream(sink)
+    request_logger = logging.getLogger('catalog.requests')
+    from django.conf import settings
+    from django.test import Client, override_settings
+    from catalog.models import Category, SubCategory, Product
+    
+    url = '/api/products/'
+    
+    with test_database():
+        category = Category.objects.create(name='Бенчмарк', slug='bench')
+        subcategory = SubCategory.objects.create(name='Бенчмарк', slug='bench', category=category)
+        Product.objects.bulk_create(
+            Product(name=f'Товар {i}', slug=f'bench-{i}', price=i, subcategory=subcategory)
+            for i in range(args.products)
+        )
+        
+        without = [m for m in settings.MIDDLEWARE if m != MIDDLEWARE_PATH]
+        with_mw = without + [MIDDLEWARE_PATH]
+        per_round = args.requests // args.rounds
+        configs = (
+            ('without', without, logging.WARNING),
+            ('with', with_mw, logging.INFO),
+            ('with_no_log', with_mw, logging.WARNING),
+        )
+        results = {label: [] for label, _, _ in configs}
+        rounds = []
+        
+        # Чередуем конфигурации, чтобы дрейф машины влиял на все одинаково
+        for _ in range(args.rounds):
+            medians = {}
+            for label, middleware, log_level in configs:
+                request_logger.setLevel(log_level)
+                with override_settings(MIDDLEWARE=middleware):
+                    client = Client()
+                    measure(client, url, 20)
+                    timings = measure(client, url, per_round)
+                results[label].extend(timings)
+                medians[label] = statistics.median(timings)
+            rounds.append(medians)
+        request_logger.setLevel(logging.INFO)
+        log_line_us = log_line_cost(request_logger)
+    sink.close()
+    
+    base = statistics.median(results['without'])
+    instrumented = statistics.median(results['with'])
+    no_log = statistics.median(results['with_no_log'])
+    overhead = instrumented / base - 1
+    overhead_mean, overhead_ci = confidence_interval(
+        [medians['with'] / medians['without'] - 1 for medians in rounds]
+    )
+    no_log_mean, no_log_ci = confidence_interval(
+        [medians['with_no_log'] / medians['without'] - 1 for medians in rounds]
+    )
+    to_list = lambda interval: [round(value, 4) for value in interval] if interval else None
+    report = {
+        'url': url,
+        'requests': per_round * args.rounds,
+        'median_ms_without': round(base * 1000, 4),
+        'median_ms_with': round(instrumented * 1000, 4),
+        'median_ms_with_no_log': round(no_log * 1000, 4),
+        'overhead': round(overhead, 4),
+        'overhead_no_log': round(no_log / base - 1, 4),
+        'rounds': args.rounds,
+        'overhead_mean': round(overhead_mean, 4),
+        'overhead_ci95': to_list(overhead_ci),
+        'overhead_no_log_mean': round(no_log_mean, 4),
+        'overhead_no_log_ci95': to_list(no_log_ci),
+        'log_line_us': round(log_line_us, 2),
+        'max_overhead': args.max_overhead,
+    }
+    print(json.dumps(report, indent=2))
+    lower = overhead_ci[0] if overhead_ci else overhead_mean
+    return 0 if lower <= args.max_overhead else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""
+Размер ответов /api/products/ и /api/cart/ с ?fields= и ?images= и без них.
+
+Запуск: python -m benchmarks.payload_size --page-size 100
+
+Для каждого варианта печатает размер тела (как есть и после gzip), число
+SQL-запросов и медианное время запроса.
+"""
+import argparse
+import gzip
+import json
+import os
+import statistics
+import sys
+import time
+
+from .common import setup_django, test_database
+
+VARIANTS = [
+    ('products', '/api/products/?page_size={page_size}'),
+    ('products', '/api/products/?page_size={page_size}&images=small'),
+    ('products', '/api/products/?page_size={page_size}&fields=id,name,price,images&images=small'),
+    ('cart', '/api/cart/'),
+    ('cart', '/api/cart/?images=small'),
+    ('cart', '/api/cart/?fields=product,quantity,product_images&images=small'),
+]
+QUERIES_PREFIX = 'desc="'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--cart-items', type=int, default=30)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args(argv)
+    
+    os.environ.setdefault('REQUEST_LOG_LEVEL', 'WARNING')
+    os.environ.setdefault('CATALOG_LOG_LEVEL', 'ERROR')
+    setup_django()
+    from django.conf import settings
+    from django.test import Client
+    from benchmarks.data import generate
+    from catalog.models import Product
+    
+    settings.ALLOWED_HOSTS = ['testserver']
+    report = []
+    with test_database():
+        data = generate(users=1, cart_items=args.cart_items)
+        # У сгенерированных товаров нет файлов; пути нужны только для размера ответа
+        for size in ('small', 'medium', 'large', 'original'):
+            Product.objects.update(**{f'image_{size}': f'products/sample/sample_{size}.jpg'})
+        client = Client(headers={'Authorization': f"Token {data['users'][0]['token']}"})
+        for endpoint, template in VARIANTS:
+            url = template.format(page_size=args.page_size)
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                response = client.get(url)
+                timings.append(time.perf_counter() - start)
+            server_timing = response.get('Server-Timing', '')
+            queries = server_timing.split(QUERIES_PREFIX)[1].split(' ')[0] if QUERIES_PREFIX in server_timing else None
+            report.append({
+                'endpoint': endpoint,
+                'url': url,
+                'status': response.status_code,
+                'bytes': len(response.content),
+                'gzip_bytes': len(gzip.compress(response.content)),
+                'queries': int(queries) if queries else None,
+                'median_ms': round(statistics.median(timings) * 1000, 3),
+            })
+    
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
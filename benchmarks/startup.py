@@ -0,0 +1,95 @@
+"""
+Время холодного старта WSGI/ASGI-приложения по данным python -X importtime.
+
+Запуск: python -m benchmarks.startup --runs 5 --top 15
+
+Каждый прогон — новый процесс, который импортирует config.wsgi или
+config.asgi и загружает URLconf (как это происходит при первом запросе).
+В отчете — медиана времени старта, суммарное время импортов, самые
+дорогие модули и то, загрузились ли тяжелые необязательные модули
+(Pillow, генератор OpenAPI).
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+from .common import ROOT
+
+# Модули, которые не нужны для обработки обычного API-запроса
+HEAVY_MODULES = ('PIL.Image', 'drf_yasg.views', 'drf_yasg.generators')
+
+STARTUP_CODE = """
+import time
+start = time.perf_counter()
+import {module}
+from django.urls import get_resolver
+get_resolver().url_patterns
+print('STARTUP_MS', (time.perf_counter() - start) * 1000)
+"""
+IMPORTTIME_RE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)')
+
+
+def run_once(module):
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'config.settings'}
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', STARTUP_CODE.format(module=module)],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    startup_ms = float(result.stdout.split('STARTUP_MS')[1])
+    imports = {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            imports[name] = (int(self_us), int(cumulative_us), len(indent))
+    return startup_ms, imports
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help='самых дорогих модулей в отчете')
+    parser.add_argument('--apps', default='config.wsgi,config.asgi')
+    args = parser.parse_args(argv)
+    
+    report = []
+    for module in args.apps.split(','):
+        startups, totals = [], []
+        self_times = defaultdict(list)
+        loaded = set()
+        for _ in range(args.runs):
+            startup_ms, imports = run_once(module)
+            startups.append(startup_ms)
+            # Импорты верхнего уровня (наименьший отступ) в сумме дают все время импорта
+            top_level = min((depth for _, _, depth in imports.values()), default=0)
+            totals.append(sum(cum for _, cum, depth in imports.values() if depth == top_level) / 1000)
+            for name, (self_us, _, _) in imports.items():
+                self_times[name].append(self_us / 1000)
+            loaded.update(name for name in HEAVY_MODULES if name in imports)
+        slowest = sorted(
+            ((name, statistics.median(times)) for name, times in self_times.items()),
+            key=lambda item: item[1], reverse=True,
+        )[:args.top]
+        row = {
+            'app': module,
+            'runs': args.runs,
+            'startup_ms': round(statistics.median(startups), 1),
+            'import_ms': round(statistics.median(totals), 1),
+            'heavy_modules_loaded': sorted(loaded),
+            'slowest_imports_ms': {name: round(ms, 2) for name, ms in slowest},
+        }
+        report.append(row)
+        print(f"{module:<12} startup={row['startup_ms']} ms  imports={row['import_ms']} ms  "
+              f"heavy={','.join(row['heavy_modules_loaded']) or '-'}", file=sys.stderr)
+    
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,170 @@
+"""
+Сравнение конфигураций gunicorn (процессы x потоки) на одних и тех же данных.
+
+Запуск:
+    python -m benchmarks.workers --configs 1x1,2x4,4x4 --concurrency 16
+    python -m benchmarks.workers --configs 4x4 --no-preload --no-warm
+    python -m benchmarks.workers --cache locmem  # кэш у каждого воркера свой
+
+Для каждой конфигурации поднимается gunicorn с config/gunicorn.conf.py
+поверх временной БД и общего файлового кэша (профиль не запускает несколько
+воркеров с locmem); в отчете — время до готовности сервера и, по
+эндпоинтам, пропускная способность и p50/p95/p99 (как в benchmarks.api).
+"""
+import argparse
+import http.client
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from .api import HttpDriver, run_scenario, scenarios
+from .common import ROOT, setup_django, test_database
+
+READ_ENDPOINTS = 'category-list,product-list,product-detail,product-multi-get'
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class GunicornDriver(HttpDriver):
+    """Запросы по HTTP к gunicorn в отдельном процессе"""
+
+    def __init__(self, workers, threads, db_path, preload=True, warm=True, cache='file', cache_dir=None):
+        self.mode = f'{workers}x{threads}'
+        self.port = _free_port()
+        command = [
+            sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'config', 'gunicorn.conf.py'),
+            '--bind', f'127.0.0.1:{self.port}', '--workers', str(workers), '--threads', str(threads),
+        ]
+        if not preload:
+            command.append('--no-preload')
+        env = {
+            **os.environ,
+            'DJANGO_SETTINGS_MODULE': 'config.settings',
+            'SQLITE_PATH': db_path,
+            'DISABLE_THROTTLING': '1',
+            'WARM_CACHES': '1' if warm else '0',
+            'CACHE_BACKEND': cache,
+            'CACHE_LOCATION': cache_dir if cache == 'file' else '',
+            # Замер только чтения: устаревание кэша на нем не сказывается
+            'GUNICORN_ALLOW_LOCAL_CACHE': '1' if cache == 'locmem' else '0',
+            'REQUEST_LOG_LEVEL': 'WARNING',
+            'CATALOG_LOG_LEVEL': 'ERROR',
+        }
+        started = time.perf_counter()
+        self.process = subprocess.Popen(command, cwd=ROOT, env=env,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self._wait_ready(workers)
+        self.ready_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    def _wait_ready(self, workers, timeout=60):
+        """Ждет, пока ответят все воркеры (по запросу на каждый в отдельном соединении)"""
+        deadline = time.monotonic() + timeout
+        answered = 0
+        while answered < workers:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"gunicorn завершился с кодом {self.process.returncode}")
+            if time.monotonic() > deadline:
+                self.close()
+                raise RuntimeError("gunicorn не запустился за отведенное время")
+            try:
+                conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=5)
+                conn.request('GET', '/api/categories/')
+                conn.getresponse().read()
+                conn.close()
+                answered += 1
+            except OSError:
+                time.sleep(0.05)
+
+    def close(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--configs', default='1x1,2x4,4x4', help='процессы x потоки, через запятую')
+    parser.add_argument('--categories', type=int, default=5)
+    parser.add_argument('--subcategories', type=int, default=4, help='на одну категорию')
+    parser.add_argument('--products', type=int, default=50, help='на одну подкатегорию')
+    parser.add_argument('--users', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=400, help='запросов на сценарий')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--endpoints', default=READ_ENDPOINTS, help='через запятую')
+    parser.add_argument('--no-preload', action='store_true', help='загружать приложение в каждом воркере')
+    parser.add_argument('--no-warm', action='store_true', help='не прогревать кэш при старте')
+    parser.add_argument('--cache', choices=['file', 'locmem'], default='file',
+                        help='file — общий кэш воркеров, locmem — свой у каждого')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='файл для JSON-отчета (по умолчанию stdout)')
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from django.db import connections
+    from benchmarks.data import generate
+
+    wanted = set(filter(None, args.endpoints.split(',')))
+    db_dir = tempfile.mkdtemp()
+    db_path = os.path.join(db_dir, 'bench.sqlite3')
+    results = []
+    with test_database(db_path):
+        data = generate(args.categories, args.subcategories, args.products, args.users, seed=args.seed)
+        # gunicorn открывает ту же БД в своих процессах
+        connections.close_all()
+        for config in args.configs.split(','):
+            workers, threads = (int(value) for value in config.split('x'))
+            # Свежий кэш на конфигурацию: прогрев и промахи не переходят между замерами
+            cache_dir = tempfile.mkdtemp(dir=db_dir)
+            driver = GunicornDriver(workers, threads, db_path, preload=not args.no_preload,
+                                    warm=not args.no_warm, cache=args.cache, cache_dir=cache_dir)
+            try:
+                print(f"{driver.mode:<6} готов за {driver.ready_ms} ms", file=sys.stderr)
+                for scenario in scenarios(data):
+                    if scenario.name not in wanted:
+                        continue
+                    result = run_scenario(driver, scenario, data, args.concurrency,
+                                          args.requests, args.seed)
+                    result['ready_ms'] = driver.ready_ms
+                    results.append(result)
+                    print(f"{result['endpoint']:<18} {driver.mode:<6} c={args.concurrency:<3} "
+                          f"{result['throughput_rps']:>9} rps  p95={result['p95_ms']} ms  "
+                          f"errors={result['errors']}", file=sys.stderr)
+            finally:
+                driver.close()
+                shutil.rmtree(cache_dir, ignore_errors=True)
+    os.rmdir(db_dir)
+
+    report = {
+        'meta': {
+            'cores': os.cpu_count(),
+            'preload': not args.no_preload,
+            'warm': not args.no_warm,
+            'cache': args.cache,
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+        },
+        'results': results,
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
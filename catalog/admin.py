@@ -1,6 +1,73 @@
-from django.contrib import admin
+import os
+from django import forms
+from django.contrib import admin, messages
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.core.exceptions import PermissionDenied
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404, redirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils.functional import cached_property
 from django.utils.html import format_html
-from .models import Category, SubCategory, Product
+from .models import Category, SubCategory, Product, RequestProfile, Stock, Order, OrderItem
+from .pricing import bulk_update_prices, parse_price_rows
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор, который для больших нефильтрованных таблиц берет оценку
+    числа строк вместо точного COUNT(*)
+    """
+    exact_count_limit = 10000
+    
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is None or query.where:
+            return super().count
+        estimate = self.estimate(self.object_list)
+        if estimate is None or estimate < self.exact_count_limit:
+            return super().count
+        return estimate
+    
+    @staticmethod
+    def estimate(queryset):
+        connection = connections[queryset.db]
+        table = queryset.model._meta.db_table
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s', [table])
+            elif connection.vendor == 'sqlite':
+                # MAX(rowid) берется из индекса первичного ключа без обхода таблицы
+                cursor.execute(f'SELECT MAX(rowid) FROM {connection.ops.quote_name(table)}')
+            else:
+                return None
+            row = cursor.fetchone()
+        return int(row[0]) if row and row[0] is not None and row[0] >= 0 else None
+
+
+class BulkPriceForm(forms.Form):
+    """Форма пакетного обновления цен: текст или CSV-файл"""
+    rows = forms.CharField(
+        label='Цены',
+        required=False,
+        widget=forms.Textarea(attrs={'rows': 15, 'cols': 60}),
+        help_text='По строке на товар: «slug_или_id;цена»',
+    )
+    file = forms.FileField(label='Или CSV-файл', required=False)
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        text = cleaned_data.get('rows') or ''
+        if cleaned_data.get('file'):
+            text = cleaned_data['file'].read().decode('utf-8-sig')
+        if not text.strip():
+            raise ValidationError('Укажите цены или загрузите файл')
+        cleaned_data['parsed'] = parse_price_rows(text)
+        return cleaned_data
+
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -20,6 +87,7 @@ class CategoryAdmin(admin.ModelAdmin):
 class SubCategoryAdmin(admin.ModelAdmin):
     list_display = ['name', 'category', 'slug', 'image_preview', 'created_at']
     list_display_links = ['name']
+    list_select_related = ['category']
     list_filter = ['category']
     search_fields = ['name', 'slug']
     prepopulated_fields = {'slug': ('name',)}
@@ -31,17 +99,144 @@ class SubCategoryAdmin(admin.ModelAdmin):
         return "Нет изображения"
     image_preview.short_description = 'Превью'
 
+class StockInline(admin.StackedInline):
+    model = Stock
+    can_delete = False
+    fields = ['available']
+
+
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
     list_display = ['name', 'subcategory', 'price', 'image_preview', 'created_at']
     list_display_links = ['name']
-    list_filter = ['subcategory__category', 'subcategory']
-    search_fields = ['name', 'slug']
+    list_select_related = ['subcategory__category']
+    list_filter = ['subcategory__category']
+    # Поиск по точному slug и по началу названия — оба варианта идут по индексу
+    search_fields = ['slug', 'name']
+    search_help_text = 'Точный slug или начало названия'
+    autocomplete_fields = ['subcategory']
+    inlines = [StockInline]
     prepopulated_fields = {'slug': ('name',)}
     readonly_fields = ['created_at', 'updated_at', 'image_preview']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    change_list_template = 'admin/catalog/product/change_list.html'
+    
+    def get_urls(self):
+        urls = [
+            path(
+                'bulk-prices/',
+                self.admin_site.admin_view(self.bulk_prices_view),
+                name='catalog_product_bulk_prices',
+            ),
+        ]
+        return urls + super().get_urls()
+    
+    def bulk_prices_view(self, request):
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        form = BulkPriceForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            try:
+                result = bulk_update_prices(form.cleaned_data['parsed'])
+            except ValidationError as e:
+                form.add_error(None, e)
+            else:
+                self.message_user(
+                    request,
+                    f"Цены обновлены: {result['updated']}, без изменений: {result['unchanged']}, "
+                    f"не найдено: {len(result['not_found'])}",
+                    messages.SUCCESS,
+                )
+                return redirect('admin:catalog_product_changelist')
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Пакетное обновление цен',
+            'form': form,
+        }
+        return TemplateResponse(request, 'admin/catalog/product/bulk_prices.html', context)
+    
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        condition = Q(slug=term)
+        for prefix in {term, term[:1].upper() + term[1:]}:
+            # Диапазон вместо LIKE: индекс по name работает в любой СУБД
+            condition |= Q(name__gte=prefix, name__lt=prefix + '\U0010ffff')
+        return queryset.filter(condition), False
     
     def image_preview(self, obj):
-        if obj.image_original:
-            return format_html('<img src="{}" style="max-height: 50px;" />', obj.image_original.url)
+        image = obj.image_small or obj.image_medium
+        if image:
+            return format_html('<img src="{}" style="max-height: 50px;" loading="lazy" />', image.url)
         return "Нет изображения"
-    image_preview.short_description = 'Превью'
\ No newline at end of file
+    image_preview.short_description = 'Превью'
+
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    fields = ['product', 'product_name', 'price', 'quantity']
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+
+@admin.register(Order)
+class OrderAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'total_items', 'total_price', 'created_at']
+    list_select_related = ['user']
+    search_fields = ['user__username']
+    readonly_fields = ['user', 'idempotency_key', 'total_price', 'total_items', 'created_at']
+    inlines = [OrderItemInline]
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ['path', 'method', 'view_name', 'status_code', 'duration_ms', 'created_at', 'downloads']
+    list_filter = ['view_name', 'method']
+    search_fields = ['path']
+    ordering = ['-duration_ms']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def get_urls(self):
+        urls = [
+            path(
+                '<int:pk>/download/<str:ext>/',
+                self.admin_site.admin_view(self.download_view),
+                name='catalog_requestprofile_download',
+            ),
+        ]
+        return urls + super().get_urls()
+    
+    def download_view(self, request, pk, ext):
+        if ext not in ('prof', 'folded'):
+            raise Http404
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        file_path = profile.file_path(ext)
+        if not os.path.exists(file_path):
+            raise Http404
+        return FileResponse(open(file_path, 'rb'), as_attachment=True,
+                            filename=os.path.basename(file_path))
+    
+    def downloads(self, obj):
+        return format_html(
+            '<a href="{}">.prof</a> | <a href="{}">flamegraph</a>',
+            reverse('admin:catalog_requestprofile_download', args=[obj.pk, 'prof']),
+            reverse('admin:catalog_requestprofile_download', args=[obj.pk, 'folded']),
+        )
+    downloads.short_description = 'Файлы'
+    
+    def delete_model(self, request, obj):
+        obj.delete_files()
+        super().delete_model(request, obj)
+    
+    def delete_queryset(self, request, queryset):
+        for obj in queryset:
+            obj.delete_files()
+        super().delete_queryset(request, queryset)
@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class CatalogConfig(AppConfig):
     name = 'catalog'
+    
+    def ready(self):
+        # Подключает обработчики сигналов журнала изменений, push-уведомлений, кэша
+        # товаров и итогов корзин
+        from . import carts, changelog, events, product_cache  # noqa: F401
@@ -0,0 +1,189 @@
+"""
+Быстрая загрузка фикстур каталога (замена loaddata для catalog/fixtures).
+
+Файлы читаются потоково, по одному объекту, и вставляются через
+bulk_create пачками в порядке зависимостей (категории -> подкатегории ->
+товары) в одной транзакции. save() моделей и сигналы не вызываются, поэтому
+изображения не обрабатываются; история цен и итоги корзин обновляются
+попачечно, как в bulk_update_prices, журнал изменений и кэш — одним
+проходом в конце. Повторная загрузка обновляет строки с теми же pk, как loaddata.
+"""
+import json
+from contextlib import contextmanager
+from itertools import groupby
+
+from django.apps import apps
+from django.core.management.color import no_style
+from django.core.serializers.python import Deserializer
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import changelog, product_cache
+from .models import Cart, PriceHistory, Product
+
+CHUNK_SIZE = 64 * 1024
+
+
+def iter_json_array(path, chunk_size=CHUNK_SIZE):
+    """Элементы JSON-массива верхнего уровня по одному, без чтения файла целиком"""
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8') as f:
+        buffer = ''
+        pos = 0
+        started = False
+        eof = False
+        while True:
+            # Пропускаем пробелы и разделители между элементами
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos < len(buffer) and not started:
+                if buffer[pos] != '[':
+                    raise ValueError(f"{path}: ожидался JSON-массив")
+                started = True
+                pos += 1
+                continue
+            if pos < len(buffer) and buffer[pos] == ']':
+                return
+            try:
+                if pos >= len(buffer):
+                    raise ValueError
+                item, end = decoder.raw_decode(buffer, pos)
+            except ValueError:
+                # Элемент не дочитан: подгружаем следующий кусок
+                if eof:
+                    if buffer[pos:].strip():
+                        raise ValueError(f"{path}: некорректный JSON около позиции {pos}")
+                    raise ValueError(f"{path}: массив не закрыт")
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                continue
+            yield item
+            pos = end
+
+
+def dependency_rank(models):
+    """{модель: ранг}; модели, на которые ссылаются внешние ключи, получают меньший ранг"""
+    rank = {}
+
+    def visit(model, path=()):
+        if model in rank:
+            return rank[model]
+        if model in path:
+            return 0
+        targets = [
+            field.related_model for field in model._meta.concrete_fields
+            if field.is_relation and field.related_model in models and field.related_model is not model
+        ]
+        rank[model] = 1 + max((visit(target, path + (model,)) for target in targets), default=-1)
+        return rank[model]
+
+    for model in models:
+        visit(model)
+    return rank
+
+
+def _file_model(path):
+    """Модель первого объекта в файле (файлы фикстур однородны)"""
+    for item in iter_json_array(path):
+        return apps.get_model(item['model'])
+    return None
+
+
+def iter_batches(paths, batch_size=1000):
+    """
+    Пачки (модель, [несохраненные объекты]) из файлов в порядке зависимостей.
+
+    Файлы сортируются по зависимостям их моделей. Внешние ключи в SQLite и
+    PostgreSQL проверяются при коммите, поэтому файлы со смешанными
+    моделями тоже загружаются, просто без выигрыша от порядка.
+    """
+    file_models = {path: _file_model(path) for path in paths}
+    rank = dependency_rank({model for model in file_models.values() if model is not None})
+    ordered = sorted((path for path, model in file_models.items() if model is not None),
+                     key=lambda path: rank[file_models[path]])
+    for path in ordered:
+        objects = (deserialized.object for deserialized in Deserializer(iter_json_array(path)))
+        for model, group in groupby(objects, key=type):
+            batch = []
+            for obj in group:
+                batch.append(obj)
+                if len(batch) >= batch_size:
+                    yield model, batch
+                    batch = []
+            if batch:
+                yield model, batch
+
+
+@contextmanager
+def _raw_timestamps(model):
+    """
+    Отключает auto_now/auto_now_add полей модели: bulk_create вызывает pre_save,
+    а даты из фикстуры должны сохраниться как есть (как при raw-сохранении loaddata)
+    """
+    fields = [field for field in model._meta.concrete_fields
+              if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def _record_prices(objects, old_prices):
+    """
+    Новые товары и товары с другой ценой: дописывает PriceHistory и
+    пересчитывает итоги корзин с ними (как bulk_update_prices)
+    """
+    changes = {obj.pk: obj.price for obj in objects
+               if obj.pk is not None and old_prices.get(obj.pk) != obj.price}
+    if not changes:
+        return
+    now = timezone.now()
+    PriceHistory.objects.bulk_create(
+        PriceHistory(product_id=pk, price=price, valid_from=now) for pk, price in changes.items()
+    )
+    Cart.objects.with_products(changes).update_totals()
+
+
+def insert_batches(batches):
+    """Вставляет пачки из iter_batches; возвращает {модель: [pk]}"""
+    loaded_ids = {}
+    for model, objects in batches:
+        if model is Product:
+            old_prices = dict(Product.objects.filter(
+                pk__in=[obj.pk for obj in objects if obj.pk is not None]
+            ).values_list('pk', 'price'))
+        fields = [field.name for field in model._meta.concrete_fields if not field.primary_key]
+        with _raw_timestamps(model):
+            model.objects.bulk_create(
+                objects, update_conflicts=True, unique_fields=[model._meta.pk.name], update_fields=fields,
+            )
+        if model is Product:
+            _record_prices(objects, old_prices)
+        loaded_ids.setdefault(model, []).extend(obj.pk for obj in objects)
+    return loaded_ids
+
+
+def load_fixtures(paths, batch_size=1000):
+    """Загружает файлы фикстур; возвращает {метка модели: число объектов}"""
+    with transaction.atomic():
+        loaded_ids = insert_batches(iter_batches(paths, batch_size))
+        
+        # Явные pk не сдвигают последовательности (PostgreSQL): выравниваем как loaddata
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), list(loaded_ids)):
+                cursor.execute(sql)
+        
+        # Сигналы не отправлялись: журнал изменений и кэш обновляем сами
+        for model, ids in loaded_ids.items():
+            kind = changelog.KINDS.get(model)
+            if kind is not None:
+                changelog.record(kind, ids)
+        product_cache.invalidate(loaded_ids.get(Product, []))
+        product_cache.invalidate_category_tree()
+    return {model._meta.label_lower: len(ids) for model, ids in loaded_ids.items()}
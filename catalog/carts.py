@@ -0,0 +1,91 @@
+import time
+
+from django.db import transaction
+from django.db.models import Exists, F, Max, Min, OuterRef
+from django.db.models.signals import post_delete, pre_delete
+from django.dispatch import receiver
+
+from .inventory import release
+from .models import Cart, CartItem, Product, StockReservation
+
+
+def stale_carts(cutoff):
+    """Корзины без активности после cutoff: ни сама корзина, ни ее позиции не менялись"""
+    recent_items = CartItem.objects.filter(cart=OuterRef('pk'), updated_at__gt=cutoff)
+    return Cart.objects.filter(updated_at__lte=cutoff).exclude(Exists(recent_items))
+
+
+def purge_carts(cutoff, batch_size=500, pause=0):
+    """
+    Удаляет пустые и брошенные корзины диапазонами id по batch_size.
+    
+    Каждый диапазон — отдельная короткая транзакция, в которой условие
+    перепроверяется, поэтому корзина, оживленная покупателем во время
+    очистки, не удаляется. Резервы позиций возвращаются на остаток.
+    Возвращает счетчики: empty, abandoned, items, released.
+    """
+    counts = {'empty': 0, 'abandoned': 0, 'items': 0, 'released': 0}
+    bounds = Cart.objects.aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is None:
+        return counts
+    
+    for start in range(bounds['low'], bounds['high'] + 1, batch_size):
+        with transaction.atomic():
+            ids = list(
+                stale_carts(cutoff)
+                .select_for_update()
+                .filter(pk__gte=start, pk__lt=start + batch_size)
+                .values_list('pk', flat=True)
+            )
+            if not ids:
+                continue
+            counts['released'] += release(StockReservation.objects.filter(cart_item__cart_id__in=ids))
+            with_items = set(
+                CartItem.objects.filter(cart_id__in=ids).values_list('cart_id', flat=True).distinct()
+            )
+            counts['items'] += CartItem.objects.filter(cart_id__in=ids).delete()[0]
+            Cart.objects.filter(pk__in=ids).delete()
+            counts['abandoned'] += len(with_items)
+            counts['empty'] += len(ids) - len(with_items)
+        if pause:
+            # Даем живым запросам занять блокировку записи между пачками
+            time.sleep(pause)
+    return counts
+
+
+def reconcile_totals(batch_size=500):
+    """
+    Исправляет расхождение total_items/total_price с позициями корзин.
+    
+    Идет диапазонами id; в каждом одним запросом находит корзины с
+    расхождением и пересчитывает только их. Возвращает (проверено, исправлено).
+    """
+    bounds = Cart.objects.aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is None:
+        return 0, 0
+    checked = fixed = 0
+    for start in range(bounds['low'], bounds['high'] + 1, batch_size):
+        with transaction.atomic():
+            carts = Cart.objects.filter(pk__gte=start, pk__lt=start + batch_size)
+            drifted = list(
+                carts.with_actual_totals()
+                .exclude(total_items=F('actual_items'), total_price=F('actual_price'))
+                .values_list('pk', flat=True)
+            )
+            checked += carts.count()
+            if drifted:
+                fixed += Cart.objects.filter(pk__in=drifted).update_totals()
+    return checked, fixed
+
+
+@receiver(pre_delete, sender=Product)
+def remember_product_carts(sender, instance, **kwargs):
+    """Позиции товара удаляются каскадом без update_totals: запоминаем их корзины"""
+    instance._cart_ids = list(Cart.objects.with_products([instance.pk]).values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    cart_ids = getattr(instance, '_cart_ids', None)
+    if cart_ids:
+        Cart.objects.filter(pk__in=cart_ids).update_totals()
@@ -0,0 +1,103 @@
+from django.db.models import Exists, OuterRef
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import CatalogChange, Category, Product, SubCategory
+
+KINDS = {Category: 'category', SubCategory: 'subcategory', Product: 'product'}
+
+
+def record(kind, ids, deleted=False):
+    CatalogChange.objects.bulk_create(
+        [CatalogChange(kind=kind, object_id=pk, deleted=deleted) for pk in ids]
+    )
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=SubCategory)
+@receiver(post_save, sender=Product)
+def record_save(sender, instance, **kwargs):
+    record(KINDS[sender], [instance.pk])
+    # Название категории и подкатегории входит в представление товара
+    if sender is Category:
+        record('product', Product.objects.filter(subcategory__category=instance).values_list('pk', flat=True))
+    elif sender is SubCategory:
+        record('product', Product.objects.filter(subcategory=instance).values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=SubCategory)
+@receiver(post_delete, sender=Product)
+def record_delete(sender, instance, **kwargs):
+    record(KINDS[sender], [instance.pk], deleted=True)
+
+
+def _querysets():
+    from .serializers import CategorySerializer, ProductSerializer, SubCategorySerializer
+    return {
+        'category': (Category.objects.prefetch_related('subcategories'), CategorySerializer),
+        'subcategory': (SubCategory.objects.all(), SubCategorySerializer),
+        'product': (Product.objects.select_related('subcategory__category'), ProductSerializer),
+    }
+
+
+def changes_since(after, limit, context=None):
+    """
+    Изменения с seq > after одной пачкой.
+    
+    Повторные изменения одного объекта в пачке схлопываются в последнее.
+    Для upsert отдается текущее состояние объекта; если объект уже удален,
+    запись превращается в tombstone.
+    """
+    entries = list(CatalogChange.objects.filter(seq__gt=after).order_by('seq')[:limit])
+    latest = {}
+    for entry in entries:
+        latest.pop((entry.kind, entry.object_id), None)
+        latest[(entry.kind, entry.object_id)] = entry
+    
+    ids_by_kind = {}
+    for kind, object_id in latest:
+        ids_by_kind.setdefault(kind, []).append(object_id)
+    querysets = _querysets()
+    objects = {
+        kind: querysets[kind][0].in_bulk(ids)
+        for kind, ids in ids_by_kind.items()
+    }
+    
+    changes = []
+    for (kind, object_id), entry in latest.items():
+        obj = objects[kind].get(object_id)
+        change = {'seq': entry.seq, 'type': kind, 'id': object_id}
+        if entry.deleted or obj is None:
+            change['op'] = 'delete'
+        else:
+            change['op'] = 'upsert'
+            change['data'] = querysets[kind][1](obj, context=context).data
+        changes.append(change)
+    
+    return {
+        'changes': changes,
+        'last_seq': entries[-1].seq if entries else after,
+        'has_more': len(entries) == limit,
+    }
+
+
+def compact(batch_size=1000):
+    """
+    Удаляет записи, перекрытые более поздней записью того же объекта.
+    
+    Ответ для upsert строится по текущему состоянию, а tombstone остается
+    последней записью удаленного объекта, поэтому клиент с любым seq
+    после компакции приходит к тому же результату. Возвращает число удаленных.
+    """
+    superseded = CatalogChange.objects.filter(Exists(
+        CatalogChange.objects.filter(
+            kind=OuterRef('kind'), object_id=OuterRef('object_id'), seq__gt=OuterRef('seq')
+        )
+    ))
+    total = 0
+    while True:
+        ids = list(superseded.order_by('seq').values_list('seq', flat=True)[:batch_size])
+        if not ids:
+            return total
+        total += CatalogChange.objects.filter(seq__in=ids).delete()[0]
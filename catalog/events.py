@@ -0,0 +1,147 @@
+"""
+Push-уведомления об изменениях корзины и цен.
+
+Каналы:
+    user:<id>     — у пользователя появилась или удалена корзина
+    cart:<id>     — изменились позиции корзины
+    product:<id>  — изменился товар (в том числе цена)
+
+Брокер задается настройкой EVENTS_BROKER. InProcessBroker доставляет
+сообщения только подписчикам этого же процесса; для нескольких воркеров
+его заменяют брокером с тем же интерфейсом (subscribe/publish) поверх
+Redis pub/sub или аналога.
+"""
+import asyncio
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .models import Cart, CartItem, Product
+from .signals import prices_changed
+
+
+class Subscription:
+    """Набор каналов одного подписчика с общей очередью в его event loop"""
+    
+    def __init__(self, broker, maxsize):
+        self.broker = broker
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+        self.channels = frozenset()
+    
+    def deliver(self, message):
+        """Вызывается брокером из любого потока"""
+        self.loop.call_soon_threadsafe(self._put, message)
+    
+    def _put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Подписчик все равно перечитает состояние по уже стоящим в очереди сообщениям
+            pass
+    
+    def update(self, channels):
+        self.broker.set_channels(self, frozenset(channels))
+    
+    async def wait(self, timeout):
+        """Ждет сообщение; False, если за timeout ничего не пришло"""
+        try:
+            await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+    
+    def drain(self):
+        """Забирает накопившиеся сообщения, чтобы ответить на пачку одним снимком"""
+        messages = []
+        while not self.queue.empty():
+            messages.append(self.queue.get_nowait())
+        return messages
+    
+    def close(self):
+        self.broker.set_channels(self, frozenset())
+
+
+class InProcessBroker:
+    """Pub/sub в памяти процесса; publish потокобезопасен"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+    
+    def subscribe(self, channels=(), maxsize=None):
+        subscription = Subscription(self, maxsize or settings.EVENTS_QUEUE_SIZE)
+        subscription.update(channels)
+        return subscription
+    
+    def set_channels(self, subscription, channels):
+        with self._lock:
+            for channel in subscription.channels - channels:
+                subscribers = self._subscribers[channel]
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[channel]
+            for channel in channels - subscription.channels:
+                self._subscribers.setdefault(channel, set()).add(subscription)
+            subscription.channels = channels
+    
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.deliver(message)
+            except RuntimeError:
+                # Event loop подписчика уже закрыт
+                self.set_channels(subscription, frozenset())
+    
+    @property
+    def subscription_count(self):
+        with self._lock:
+            return len({s for subscribers in self._subscribers.values() for s in subscribers})
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(settings.EVENTS_BROKER)()
+        return _broker
+
+
+def publish_on_commit(channel, message):
+    """Публикует после коммита, чтобы подписчик прочитал уже сохраненные данные"""
+    transaction.on_commit(lambda: get_broker().publish(channel, message))
+
+
+@receiver(post_save, sender=Cart)
+@receiver(post_delete, sender=Cart)
+def cart_changed(sender, instance, **kwargs):
+    publish_on_commit(f'user:{instance.user_id}', {'type': 'cart', 'id': instance.pk})
+
+
+@receiver(post_save, sender=CartItem)
+@receiver(post_delete, sender=CartItem)
+def cart_item_changed(sender, instance, **kwargs):
+    publish_on_commit(f'cart:{instance.cart_id}', {'type': 'cart', 'id': instance.cart_id})
+
+
+@receiver(post_save, sender=Product)
+def product_changed(sender, instance, **kwargs):
+    publish_on_commit(f'product:{instance.pk}', {'type': 'product', 'id': instance.pk})
+
+
+@receiver(prices_changed)
+def prices_updated(sender, product_ids, **kwargs):
+    # prices_changed уже отправляется после коммита
+    broker = get_broker()
+    for product_id in product_ids:
+        broker.publish(f'product:{product_id}', {'type': 'product', 'id': product_id})
@@ -0,0 +1,114 @@
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+# Сколько раз занимать ключ, если конкурирующий запрос с ним откатился
+CLAIM_ATTEMPTS = 3
+
+
+def request_fingerprint(request, kwargs):
+    """Хэш метода, пути и тела: один ключ нельзя использовать для другого запроса"""
+    body = json.dumps(request.data, sort_keys=True, default=str) if request.data else ''
+    raw = f"{request.method}:{request.path}:{sorted(kwargs.items())}:{body}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def idempotent(handler):
+    """
+    Декоратор метода DRF-представления: повтор запроса с тем же
+    Idempotency-Key возвращает сохраненный ответ без повторного выполнения.
+    
+    Занятие ключа, изменения обработчика и сохраненный ответ коммитятся
+    одной транзакцией: если процесс умер посередине, откатывается все, и
+    повтор выполняется заново без двойного изменения корзины. Параллельный
+    дубль ждет коммита первого запроса и получает его ответ (или 409, пока
+    ответ не записан). Ответы 5xx не сохраняются — такой запрос можно
+    повторить. Незавершенный ключ старше IDEMPOTENCY_CLAIM_TTL занимается заново.
+    """
+    @wraps(handler)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER, '').strip()
+        if not key or not request.user.is_authenticated:
+            return handler(self, request, *args, **kwargs)
+        if len(key) > 64:
+            return Response({"detail": f"{HEADER} длиннее 64 символов"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        fingerprint = request_fingerprint(request, kwargs)
+        now = timezone.now()
+        lease_start = now - timedelta(seconds=settings.IDEMPOTENCY_CLAIM_TTL)
+        abandoned = Q(status_code__isnull=True, claimed_at__lte=lease_start)
+        IdempotencyKey.objects.filter(Q(expires_at__lte=now) | abandoned, user=request.user, key=key).delete()
+        
+        for _ in range(CLAIM_ATTEMPTS):
+            with transaction.atomic():
+                try:
+                    with transaction.atomic():
+                        record = IdempotencyKey.objects.create(
+                            user=request.user, key=key, fingerprint=fingerprint, claimed_at=now,
+                            expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+                        )
+                except IntegrityError:
+                    existing = IdempotencyKey.objects.filter(user=request.user, key=key).first()
+                    if existing is None:
+                        # Первый запрос откатился (исключение или 5xx): занимаем ключ снова
+                        continue
+                    return replay(existing, fingerprint)
+                
+                response = handler(self, request, *args, **kwargs)
+                if response.status_code >= 500:
+                    record.delete()
+                    return response
+                # Сохраняем ровно то, что увидит клиент после рендеринга
+                IdempotencyKey.objects.filter(pk=record.pk).update(
+                    status_code=response.status_code,
+                    response_body=json.loads(JSONRenderer().render(response.data) or b'null'),
+                )
+                return response
+        return Response(
+            {"detail": "Запрос с этим ключом еще выполняется"},
+            status=status.HTTP_409_CONFLICT,
+            headers={'Retry-After': '1'},
+        )
+    return wrapper
+
+
+def replay(record, fingerprint):
+    if record.fingerprint != fingerprint:
+        return Response(
+            {"detail": f"{HEADER} уже использован для другого запроса"},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    if record.status_code is None:
+        return Response(
+            {"detail": "Запрос с этим ключом еще выполняется"},
+            status=status.HTTP_409_CONFLICT,
+            headers={'Retry-After': '1'},
+        )
+    return Response(record.response_body, status=record.status_code, headers={'Idempotent-Replayed': 'true'})
+
+
+def purge_expired(batch_size=1000, now=None):
+    """Удаляет просроченные ключи пачками по id; возвращает число удаленных"""
+    now = now or timezone.now()
+    total = 0
+    while True:
+        ids = list(
+            IdempotencyKey.objects.filter(expires_at__lte=now)
+            .order_by('pk')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return total
+        total += IdempotencyKey.objects.filter(pk__in=ids).delete()[0]
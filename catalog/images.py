@@ -0,0 +1,276 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+# Pillow импортируется внутри функций: он нужен только при обработке изображений,
+# а загрузка модуля заметно удлиняет старт воркеров и manage.py
+
+# Форматы Pillow и соответствующие им расширения/MIME-типы
+IMAGE_FORMATS = {
+    'jpeg': ('JPEG', 'jpg', 'image/jpeg'),
+    'png': ('PNG', 'png', 'image/png'),
+    'webp': ('WEBP', 'webp', 'image/webp'),
+}
+
+
+def _save_atomic(img, path):
+    """Сохраняет изображение через временный файл и rename, чтобы не оставлять битых файлов"""
+    from PIL import Image
+    ext = os.path.splitext(path)[1].lower()
+    pil_format = Image.registered_extensions().get(ext, 'JPEG')
+    if pil_format == 'JPEG' and img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        img.save(tmp_path, format=pil_format)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def derivative_paths(original_path, sizes):
+    """Пути производных файлов рядом с оригиналом: {size_name: абсолютный путь}"""
+    base_dir = os.path.dirname(original_path)
+    name, ext = os.path.splitext(os.path.basename(original_path))
+    name = name.replace('_original', '')
+    return {
+        size_name: os.path.join(base_dir, f"{name}_{size_name}{ext}")
+        for size_name in sizes
+    }
+
+
+def derivatives_up_to_date(original_path, sizes):
+    """Все производные существуют и не старше оригинала"""
+    original_mtime = os.stat(original_path).st_mtime
+    for path in derivative_paths(original_path, sizes).values():
+        if not os.path.exists(path) or os.stat(path).st_mtime < original_mtime:
+            return False
+    return True
+
+
+def relative_derivative_paths(original_path, sizes, media_root):
+    """Пути производных файлов относительно media_root — значения полей image_*"""
+    return {
+        size_name: os.path.relpath(path, media_root).replace('\\', '/')
+        for size_name, path in derivative_paths(original_path, sizes).items()
+    }
+
+
+def build_product_derivatives(original_path, sizes, media_root):
+    """
+    Создает производные размеры изображения товара рядом с оригиналом.
+    
+    Возвращает {size_name: путь относительно media_root}. Функция не
+    обращается к настройкам Django, поэтому ее можно вызывать в
+    дочерних процессах.
+    """
+    from PIL import Image
+    paths = derivative_paths(original_path, sizes)
+    with Image.open(original_path) as img:
+        img.load()
+        for size_name, (width, height) in sizes.items():
+            img_copy = img.copy()
+            img_copy.thumbnail((width, height), Image.Resampling.LANCZOS)
+            _save_atomic(img_copy, paths[size_name])
+    return relative_derivative_paths(original_path, sizes, media_root)
+
+
+def rebuild_derivatives(product_id, original_path, current, sizes, media_root, force):
+    """
+    Задача rebuild_product_images: (product_id, пути или None если пропущен, ошибка).
+
+    Выполняется в дочерних процессах, поэтому живет в модуле без моделей:
+    при запуске процессов через spawn (Windows, macOS) модуль импортируется
+    до настройки Django. current — значения полей image_* в БД. Актуальные
+    файлы пропускаются, только если поля уже на них указывают: иначе
+    (запуск прервался между записью файлов и bulk_update) пути возвращаются,
+    чтобы их записали.
+    """
+    try:
+        if not force and derivatives_up_to_date(original_path, sizes):
+            expected = relative_derivative_paths(original_path, sizes, media_root)
+            if current == expected:
+                return product_id, None, None
+            return product_id, expected, None
+        return product_id, build_product_derivatives(original_path, sizes, media_root), None
+    except Exception as e:
+        return product_id, None, f"{type(e).__name__}: {e}"
+
+
+def render_resized(source_path, width, height, fmt):
+    """Возвращает байты изображения, вписанного в width x height, в формате fmt"""
+    from PIL import Image
+    pil_format = IMAGE_FORMATS[fmt][0]
+    with Image.open(source_path) as img:
+        img = img.copy()
+    img.thumbnail((width, height), Image.Resampling.LANCZOS)
+    if pil_format == 'JPEG' and img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    buffer = io.BytesIO()
+    img.save(buffer, format=pil_format)
+    return buffer.getvalue()
+
+
+class _Pending:
+    """Генерация производного изображения, которую ждут параллельные запросы"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.error = None
+
+
+class DerivativeCache:
+    """
+    Дисковый кэш производных изображений с LRU-вытеснением по суммарному размеру.
+
+    Индекс у каждого процесса свой, поэтому воркеры могут вытеснять файлы
+    друг друга: отдавать файл нужно через open_or_create, который создает
+    пропавший файл заново.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index = None
+        self._total = 0
+        self._pending = {}
+
+    def path_for(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def get_or_create(self, key, render):
+        """
+        Возвращает путь к файлу производного изображения.
+
+        Если файла нет, вызывает render() ровно один раз, даже при
+        одновременных запросах одного и того же ключа.
+        """
+        path = self.path_for(key)
+        with self._lock:
+            self._load_index()
+            if key in self._index:
+                self._index.move_to_end(key)
+                return path
+            pending = self._pending.get(key)
+            owner = pending is None
+            if owner:
+                pending = self._pending[key] = _Pending()
+
+        if not owner:
+            pending.event.wait()
+            if pending.error is not None:
+                raise pending.error
+            return path
+
+        try:
+            data = render()
+            self._write(path, data)
+            with self._lock:
+                self._index[key] = len(data)
+                self._total += len(data)
+                self._evict()
+        except Exception as e:
+            pending.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending.event.set()
+        return path
+
+    def open_or_create(self, key, render, attempts=3):
+        """
+        Как get_or_create, но возвращает открытый файл.
+
+        Файл открывается под блокировкой, поэтому вытеснение в этом процессе
+        не удалит его между проверкой и открытием; файл, удаленный другим
+        процессом, создается заново.
+        """
+        for _ in range(attempts):
+            path = self.get_or_create(key, render)
+            with self._lock:
+                try:
+                    return open(path, 'rb')
+                except FileNotFoundError:
+                    self._forget(key)
+        raise FileNotFoundError(path)
+
+    def _write(self, path, data):
+        """Атомарная запись: временный файл + rename"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _load_index(self):
+        """Строит индекс по уже лежащим на диске файлам (старые по atime — первыми)"""
+        if self._index is not None:
+            return
+        entries = []
+        if os.path.isdir(self.root):
+            for dirpath, _, filenames in os.walk(self.root):
+                for filename in filenames:
+                    if filename.endswith('.tmp'):
+                        continue
+                    stat = os.stat(os.path.join(dirpath, filename))
+                    entries.append((stat.st_atime, filename, stat.st_size))
+        entries.sort()
+        self._index = OrderedDict((name, size) for _, name, size in entries)
+        self._total = sum(self._index.values())
+        self._evict()
+
+    def _forget(self, key):
+        size = self._index.pop(key, None)
+        if size is not None:
+            self._total -= size
+
+    def _evict(self):
+        while self._total > self.max_bytes and len(self._index) > 1:
+            key, size = self._index.popitem(last=False)
+            self._total -= size
+            try:
+                os.remove(self.path_for(key))
+            except FileNotFoundError:
+                pass
+
+    @property
+    def total_bytes(self):
+        with self._lock:
+            self._load_index()
+            return self._total
+
+
+_cache = None
+
+
+def get_derivative_cache():
+    """Возвращает общий для процесса кэш, пересоздавая его при смене настроек"""
+    global _cache
+    root = settings.IMAGE_RESIZE_CACHE_DIR
+    max_bytes = settings.IMAGE_RESIZE_CACHE_MAX_BYTES
+    if _cache is None or (_cache.root, _cache.max_bytes) != (root, max_bytes):
+        _cache = DerivativeCache(root, max_bytes)
+    return _cache
+
+
+def derivative_key(source_path, width, height, fmt):
+    """Ключ кэша учитывает mtime оригинала, чтобы замена файла сбрасывала производные"""
+    mtime = os.stat(source_path).st_mtime_ns
+    raw = f"{source_path}:{mtime}:{width}x{height}:{fmt}"
+    return f"{hashlib.sha1(raw.encode()).hexdigest()}.{IMAGE_FORMATS[fmt][1]}"
+
+
+def format_for(path):
+    """Формат производного изображения по умолчанию — по расширению оригинала"""
+    ext = os.path.splitext(path)[1].lower().lstrip('.')
+    for fmt, (_, format_ext, _) in IMAGE_FORMATS.items():
+        if ext == format_ext or (fmt == 'jpeg' and ext == 'jpeg'):
+            return fmt
+    return 'jpeg'
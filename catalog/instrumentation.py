@@ -0,0 +1,72 @@
+import contextvars
+import time
+from contextlib import contextmanager
+
+_current = contextvars.ContextVar('catalog_request_stats', default=None)
+
+
+class RequestStats:
+    """Счетчики производительности одного HTTP-запроса"""
+    
+    __slots__ = ('queries', 'db_time', 'serialize_time', '_serializing', '_untracked')
+    
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self._serializing = False
+        self._untracked = False
+    
+    def __call__(self, execute, sql, params, many, context):
+        """Обертка для connection.execute_wrapper: считает запросы и их время"""
+        if self._untracked:
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+
+
+def current_stats():
+    """Статистика текущего запроса или None вне PerformanceMiddleware"""
+    return _current.get()
+
+
+def activate(stats):
+    return _current.set(stats)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+@contextmanager
+def untracked():
+    """Служебные запросы блока (например, EXPLAIN) не учитываются в статистике запроса"""
+    stats = _current.get()
+    if stats is None or stats._untracked:
+        yield
+        return
+    stats._untracked = True
+    try:
+        yield
+    finally:
+        stats._untracked = False
+
+
+class TimedSerializerMixin:
+    """Учитывает время сериализации верхнего уровня в статистике запроса"""
+    
+    def to_representation(self, instance):
+        stats = _current.get()
+        if stats is None or stats._serializing:
+            return super().to_representation(instance)
+        stats._serializing = True
+        start = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            stats.serialize_time += time.perf_counter() - start
+            stats._serializing = False
@@ -0,0 +1,121 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Stock, StockReservation
+
+
+class InsufficientStock(Exception):
+    """Недостаточно остатка для резервирования"""
+    
+    def __init__(self, product_id, requested, available):
+        self.product_id = product_id
+        self.requested = requested
+        self.available = available
+        super().__init__(f"Товар {product_id}: запрошено {requested}, доступно {available}")
+
+
+def take(product_id, quantity):
+    """
+    Атомарно списывает quantity с остатка: UPDATE ... WHERE available >= quantity.
+    
+    Возвращает False, если у товара нет учета остатков (неограниченный товар).
+    """
+    if quantity <= 0:
+        return True
+    updated = Stock.objects.filter(product_id=product_id, available__gte=quantity).update(
+        available=F('available') - quantity
+    )
+    if updated:
+        return True
+    available = Stock.objects.filter(product_id=product_id).values_list('available', flat=True).first()
+    if available is None:
+        return False
+    raise InsufficientStock(product_id, quantity, available)
+
+
+def give_back(quantities):
+    """Возвращает остатки: quantities — {product_id: количество}"""
+    for product_id, quantity in quantities.items():
+        if quantity > 0:
+            Stock.objects.filter(product_id=product_id).update(available=F('available') + quantity)
+
+
+def reserve(cart_item, quantity):
+    """
+    Приводит резерв позиции корзины к quantity и продлевает его срок.
+    
+    Списывается или возвращается только разница с текущим резервом.
+    При нехватке остатка выбрасывает InsufficientStock, резерв не меняется.
+    """
+    expires_at = timezone.now() + timedelta(seconds=settings.STOCK_RESERVATION_TTL)
+    with transaction.atomic():
+        reservation = (
+            StockReservation.objects.select_for_update()
+            .filter(cart_item=cart_item)
+            .first()
+        )
+        reserved = reservation.quantity if reservation else 0
+        delta = quantity - reserved
+        if delta > 0:
+            if not take(cart_item.product_id, delta):
+                return None
+        elif delta < 0:
+            give_back({cart_item.product_id: -delta})
+        
+        if reservation is None:
+            return StockReservation.objects.create(
+                product_id=cart_item.product_id, cart_item=cart_item,
+                quantity=quantity, expires_at=expires_at,
+            )
+        reservation.quantity = quantity
+        reservation.expires_at = expires_at
+        reservation.save(update_fields=['quantity', 'expires_at'])
+        return reservation
+
+
+def release(reservations):
+    """Удаляет резервы и возвращает их количество на остаток одним UPDATE на товар"""
+    with transaction.atomic():
+        # Блокируем строки, чтобы параллельная очистка не вернула тот же резерв дважды
+        rows = list(reservations.select_for_update().values_list('pk', 'product_id', 'quantity'))
+        if not rows:
+            return 0
+        quantities = Counter()
+        for _, product_id, quantity in rows:
+            quantities[product_id] += quantity
+        StockReservation.objects.filter(pk__in=[pk for pk, _, _ in rows]).delete()
+        give_back(quantities)
+    return len(rows)
+
+
+def release_for_items(cart_items):
+    """Снимает резервы позиций корзины (перед их удалением)"""
+    return release(StockReservation.objects.filter(cart_item__in=cart_items))
+
+
+def release_expired(batch_size=500, now=None):
+    """Снимает просроченные и осиротевшие резервы пачками; возвращает их число"""
+    now = now or timezone.now()
+    total = 0
+    while True:
+        batch = list(
+            StockReservation.objects
+            .filter(expires_at__lte=now)
+            .order_by('pk')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        orphaned = list(
+            StockReservation.objects
+            .filter(cart_item__isnull=True)
+            .order_by('pk')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        ids = set(batch) | set(orphaned)
+        if not ids:
+            return total
+        total += release(StockReservation.objects.filter(pk__in=ids))
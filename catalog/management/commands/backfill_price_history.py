@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from catalog.models import Product, PriceHistory
+
+
+class Command(BaseCommand):
+    help = 'Создает начальную запись истории цен для товаров, у которых ее нет'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+    
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        queryset = (
+            Product.objects
+            .filter(~Exists(PriceHistory.objects.filter(product=OuterRef('pk'))))
+            .order_by('pk')
+            .values_list('pk', 'price', 'created_at')
+        )
+        created = 0
+        last_id = 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            with transaction.atomic():
+                PriceHistory.objects.bulk_create(
+                    PriceHistory(product_id=pk, price=price, valid_from=created_at)
+                    for pk, price, created_at in batch
+                )
+            created += len(batch)
+            last_id = batch[-1][0]
+        self.stdout.write(self.style.SUCCESS(f"Создано записей истории цен: {created}"))
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from catalog.recommendations import build_related
+
+
+class Command(BaseCommand):
+    help = ('Обновляет рекомендации «покупают вместе» по корзинам и заказам, '
+            'измененным с прошлого запуска (запускать по cron)')
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='пересчитать все с нуля')
+        parser.add_argument('--batch-size', type=int, default=500)
+    
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        stats = build_related(full=options['full'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Корзин: {stats['carts']}, заказов: {stats['orders']}, "
+            f"товаров с обновленными рекомендациями: {stats['products']} "
+            f"({time.perf_counter() - started:.2f} с)"
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from catalog.changelog import compact
+
+
+class Command(BaseCommand):
+    help = 'Оставляет в журнале изменений каталога только последнюю запись каждого объекта'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+    
+    def handle(self, *args, **options):
+        deleted = compact(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Удалено записей: {deleted}"))
@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.schema import generate_schema, render_schema
+
+
+class Command(BaseCommand):
+    help = 'Генерирует OpenAPI-схему API в файл (запускать при деплое и коммитить результат)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=str(settings.OPENAPI_SCHEMA_PATH))
+        parser.add_argument('--check', action='store_true',
+                            help='не писать файл, а завершиться с ошибкой, если он устарел')
+    
+    def handle(self, *args, **options):
+        content = render_schema(generate_schema())
+        path = options['output']
+        if options['check']:
+            try:
+                with open(path, 'rb') as f:
+                    current = f.read()
+            except FileNotFoundError:
+                current = None
+            if current != content:
+                raise CommandError(f"Схема {path} устарела: выполните manage.py export_schema")
+            self.stdout.write(self.style.SUCCESS(f"Схема {path} актуальна"))
+            return
+        with open(path, 'wb') as f:
+            f.write(content)
+        self.stdout.write(self.style.SUCCESS(f"Схема записана в {path} ({len(content)} байт)"))
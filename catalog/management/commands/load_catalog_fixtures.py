@@ -0,0 +1,30 @@
+import glob
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.bulk_load import load_fixtures
+
+
+class Command(BaseCommand):
+    help = ('Быстро загружает фикстуры каталога (bulk_create в одной транзакции, '
+            'без обработки изображений); по умолчанию catalog/fixtures/*.json')
+    
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*')
+        parser.add_argument('--batch-size', type=int, default=1000)
+    
+    def handle(self, *args, **options):
+        paths = options['paths'] or sorted(
+            glob.glob(os.path.join(settings.BASE_DIR, 'catalog', 'fixtures', '*.json'))
+        )
+        missing = [path for path in paths if not os.path.exists(path)]
+        if missing:
+            raise CommandError(f"Нет файлов: {', '.join(missing)}")
+        started = time.perf_counter()
+        counts = load_fixtures(paths, batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - started
+        summary = ', '.join(f"{label}: {count}" for label, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Загружено за {elapsed:.2f} с — {summary}"))
@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from catalog.profiling import make_token
+
+
+class Command(BaseCommand):
+    help = 'Выдает подписанный токен для заголовка X-Profile'
+    
+    def handle(self, *args, **options):
+        self.stdout.write(make_token())
+        self.stderr.write(
+            f"Токен действителен {settings.PROFILING_TOKEN_MAX_AGE} с. "
+            f"Пример: curl -H 'X-Profile: <токен>' http://127.0.0.1:8000/api/cart/"
+        )
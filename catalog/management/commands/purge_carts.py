@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from catalog.carts import purge_carts
+
+
+class Command(BaseCommand):
+    help = 'Удаляет пустые и брошенные корзины (можно запускать при живом трафике)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=30, help='дней без активности')
+        parser.add_argument('--batch-size', type=int, default=500, help='корзин в одной транзакции')
+        parser.add_argument('--pause', type=float, default=0.0, help='пауза между пачками, секунд')
+    
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['older_than'])
+        counts = purge_carts(cutoff, batch_size=options['batch_size'], pause=options['pause'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Удалено корзин: пустых {counts['empty']}, брошенных {counts['abandoned']}; "
+            f"позиций: {counts['items']}; снято резервов: {counts['released']}"
+        ))
@@ -0,0 +1,123 @@
+import logging
+import os
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from catalog import product_cache
+from catalog.images import rebuild_derivatives
+from catalog.models import Product
+
+logger = logging.getLogger('catalog.images')
+
+IMAGE_FIELDS = ['image_large', 'image_medium', 'image_small']
+
+
+class InlineExecutor:
+    """Исполнитель для --workers 1: без дочерних процессов (и их запуска)"""
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        return False
+    
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+
+class Command(BaseCommand):
+    help = 'Пересоздает производные размеры изображений товаров из image_original'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=200,
+                            help='Сколько товаров обрабатывать за одну пачку')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Количество процессов (по умолчанию — число ядер)')
+        parser.add_argument('--after-id', type=int, default=0,
+                            help='Продолжить с товаров, id которых больше указанного')
+        parser.add_argument('--force', action='store_true',
+                            help='Пересоздать даже актуальные изображения')
+    
+    def handle(self, *args, **options):
+        sizes = settings.PRODUCT_IMAGE_SIZES
+        media_root = settings.MEDIA_ROOT
+        chunk_size = options['chunk_size']
+        last_id = options['after_id']
+        stats = {'processed': 0, 'rebuilt': 0, 'skipped': 0, 'failed': 0}
+        started = time.monotonic()
+        
+        queryset = (
+            Product.objects
+            .exclude(image_original='')
+            .exclude(image_original__isnull=True)
+            .order_by('pk')
+            .only('pk', 'image_original', *IMAGE_FIELDS)
+        )
+        
+        workers = options['workers']
+        executor = InlineExecutor() if workers == 1 else ProcessPoolExecutor(max_workers=workers)
+        with executor:
+            while True:
+                products = list(queryset.filter(pk__gt=last_id)[:chunk_size])
+                if not products:
+                    break
+                
+                by_id = {product.pk: product for product in products}
+                futures = [
+                    executor.submit(rebuild_derivatives, product.pk, product.image_original.path,
+                                    {size_name: getattr(product, f'image_{size_name}').name
+                                     for size_name in sizes},
+                                    sizes, media_root, options['force'])
+                    for product in products
+                ]
+                
+                changed = []
+                for future in futures:
+                    product_id, paths, error = future.result()
+                    stats['processed'] += 1
+                    if error:
+                        stats['failed'] += 1
+                        logger.error(
+                            "Не удалось пересоздать изображения товара",
+                            extra={'event': 'product_images_failed',
+                                   'product_id': product_id, 'error': error},
+                        )
+                    elif paths is None:
+                        stats['skipped'] += 1
+                    else:
+                        stats['rebuilt'] += 1
+                        product = by_id[product_id]
+                        for size_name, relative_path in paths.items():
+                            getattr(product, f'image_{size_name}').name = relative_path
+                        changed.append(product)
+                
+                if changed:
+                    Product.objects.bulk_update(
+                        changed, [f'image_{size_name}' for size_name in sizes]
+                    )
+                    # bulk_update не отправляет сигналы: кэш карточек сбрасываем сами
+                    product_cache.invalidate(product.pk for product in changed)
+                
+                last_id = products[-1].pk
+                elapsed = time.monotonic() - started
+                logger.info(
+                    "Пачка изображений обработана",
+                    extra={'event': 'product_images_progress', 'last_id': last_id,
+                           'per_second': round(stats['processed'] / elapsed, 2) if elapsed else None,
+                           **stats},
+                )
+        
+        elapsed = time.monotonic() - started
+        logger.info(
+            "Пересоздание изображений завершено",
+            extra={'event': 'product_images_done', 'seconds': round(elapsed, 2), **stats},
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Обработано: {stats['processed']}, пересоздано: {stats['rebuilt']}, "
+            f"пропущено: {stats['skipped']}, ошибок: {stats['failed']}"
+        ))
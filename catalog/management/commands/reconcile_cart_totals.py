@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from catalog.carts import reconcile_totals
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает итоги корзин, разошедшиеся с их позициями'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+    
+    def handle(self, *args, **options):
+        checked, fixed = reconcile_totals(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Проверено корзин: {checked}, исправлено: {fixed}"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from catalog.inventory import release_expired
+
+
+class Command(BaseCommand):
+    help = 'Возвращает на остаток просроченные резервы корзин (запускать по расписанию)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+    
+    def handle(self, *args, **options):
+        released = release_expired(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Снято резервов: {released}"))
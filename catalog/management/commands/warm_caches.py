@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from catalog.product_cache import warm_caches
+
+
+class Command(BaseCommand):
+    help = 'Заполняет кэш деревом категорий и популярными товарами (после деплоя или сброса кэша)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=None,
+                            help='сколько товаров загрузить (по умолчанию WARM_CACHE_PRODUCTS)')
+    
+    def handle(self, *args, **options):
+        count = warm_caches(options['products'])
+        self.stdout.write(self.style.SUCCESS(f"Кэш прогрет: категории и {count} товаров"))
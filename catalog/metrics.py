@@ -0,0 +1,142 @@
+import threading
+
+# Границы по умолчанию (секунды) — как в клиентских библиотеках Prometheus
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Counter:
+    """Монотонный счетчик с метками"""
+    type_name = 'counter'
+    
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+    
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+    
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            yield self.name, _format_labels(self.labelnames, labels), value
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами корзин и метками"""
+    type_name = 'histogram'
+    
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, *labels, value):
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * len(self.buckets), 0.0, 0]
+            counts = state[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+    
+    def count(self, *labels):
+        state = self._values.get(labels)
+        return state[2] if state else 0
+    
+    def samples(self):
+        with self._lock:
+            items = [(labels, list(counts), total, n) for labels, (counts, total, n) in self._values.items()]
+        for labels, counts, total, n in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield (f'{self.name}_bucket',
+                       _format_labels(self.labelnames, labels, ('le', repr(float(bound)))),
+                       cumulative)
+            yield f'{self.name}_bucket', _format_labels(self.labelnames, labels, ('le', '+Inf')), n
+            yield f'{self.name}_sum', _format_labels(self.labelnames, labels), total
+            yield f'{self.name}_count', _format_labels(self.labelnames, labels), n
+
+
+class Registry:
+    """Набор метрик процесса, отдаваемый в текстовом формате Prometheus"""
+    
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+    
+    def register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+    
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+    
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+    
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type_name}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+REQUEST_LATENCY = registry.histogram(
+    'http_request_duration_seconds', 'Время обработки запроса', ['view', 'method', 'status'],
+)
+REQUEST_DB_QUERIES = registry.histogram(
+    'http_request_db_queries', 'Количество SQL-запросов на HTTP-запрос', ['view'],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200),
+)
+REQUEST_DB_TIME = registry.histogram(
+    'http_request_db_seconds', 'Суммарное время SQL-запросов на HTTP-запрос', ['view'],
+)
+REQUEST_SERIALIZE_TIME = registry.histogram(
+    'http_request_serialize_seconds', 'Время сериализации ответа', ['view'],
+)
+RESPONSE_SIZE = registry.histogram(
+    'http_response_size_bytes', 'Размер тела ответа', ['view'],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576),
+)
+THROTTLE_DECISIONS = registry.counter(
+    'http_throttle_decisions_total', 'Решения ограничителя запросов', ['scope', 'decision'],
+)
+REQUESTS_SHED = registry.counter(
+    'http_requests_shed_total', 'Запросы, отклоненные с 503 из-за перегрузки',
+)
@@ -0,0 +1,95 @@
+import logging
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import JsonResponse
+
+from . import instrumentation
+from .metrics import (
+    REQUEST_LATENCY, REQUEST_DB_QUERIES, REQUEST_DB_TIME,
+    REQUEST_SERIALIZE_TIME, RESPONSE_SIZE, REQUESTS_SHED,
+)
+
+logger = logging.getLogger('catalog.requests')
+
+
+class PerformanceMiddleware:
+    """
+    Замеряет время запроса, число и время SQL-запросов, время сериализации
+    и размер ответа. Результат отдается в заголовке Server-Timing, пишется
+    в лог и накапливается в гистограммах для /metrics.
+    """
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        stats = instrumentation.RequestStats()
+        token = instrumentation.activate(stats)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(stats))
+                response = self.get_response(request)
+        finally:
+            instrumentation.deactivate(token)
+        total = time.perf_counter() - start
+        
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        size = len(response.content) if not response.streaming else 0
+        
+        REQUEST_LATENCY.observe(view, request.method, response.status_code, value=total)
+        REQUEST_DB_QUERIES.observe(view, value=stats.queries)
+        REQUEST_DB_TIME.observe(view, value=stats.db_time)
+        REQUEST_SERIALIZE_TIME.observe(view, value=stats.serialize_time)
+        RESPONSE_SIZE.observe(view, value=size)
+        
+        response['Server-Timing'] = (
+            f'total;dur={total * 1000:.2f}, '
+            f'db;dur={stats.db_time * 1000:.2f};desc="{stats.queries} queries", '
+            f'serialize;dur={stats.serialize_time * 1000:.2f}'
+        )
+        logger.info(
+            "%s %s", request.method, request.path,
+            extra={
+                'event': 'request', 'view': view, 'status': response.status_code,
+                'duration_ms': round(total * 1000, 2), 'db_queries': stats.queries,
+                'db_ms': round(stats.db_time * 1000, 2),
+                'serialize_ms': round(stats.serialize_time * 1000, 2),
+                'response_bytes': size,
+            },
+        )
+        return response
+
+
+class ConcurrencyLimitMiddleware:
+    """
+    Сбрасывает нагрузку: если в процессе уже выполняется CONCURRENCY_LIMIT
+    запросов к путям CONCURRENCY_LIMIT_PATHS, новый сразу получает 503 с
+    Retry-After вместо ожидания в очереди. None отключает ограничение.
+    Потоки из CONCURRENCY_LIMIT_EXEMPT_PATHS (SSE) не занимают слоты.
+    """
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        limit = settings.CONCURRENCY_LIMIT
+        self.slots = threading.BoundedSemaphore(limit) if limit else None
+    
+    def __call__(self, request):
+        if (self.slots is None or not request.path.startswith(settings.CONCURRENCY_LIMIT_PATHS)
+                or request.path.startswith(settings.CONCURRENCY_LIMIT_EXEMPT_PATHS)):
+            return self.get_response(request)
+        if not self.slots.acquire(blocking=False):
+            REQUESTS_SHED.inc()
+            response = JsonResponse({"detail": "Сервер перегружен, повторите запрос позже"}, status=503)
+            response['Retry-After'] = str(settings.CONCURRENCY_LIMIT_RETRY_AFTER)
+            return response
+        try:
+            return self.get_response(request)
+        finally:
+            self.slots.release()
@@ -0,0 +1,19 @@
+# Generated by Django 6.0.2 on 2026-10-19 11:23
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0004_requestprofile'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='name',
+            field=models.CharField(db_index=True, max_length=200, validators=[django.core.validators.MinLengthValidator(3)], verbose_name='Наименование'),
+        ),
+    ]
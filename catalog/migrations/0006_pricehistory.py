@@ -0,0 +1,30 @@
+# Generated by Django 6.0.2 on 2026-10-19 11:25
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0005_product_name_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Цена')),
+                ('valid_from', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Действует с')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_history', to='catalog.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Цена товара',
+                'verbose_name_plural': 'История цен',
+                'ordering': ['-valid_from'],
+                'indexes': [models.Index(fields=['product', 'valid_from'], name='pricehistory_product_time')],
+            },
+        ),
+    ]
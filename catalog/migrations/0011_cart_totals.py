@@ -0,0 +1,35 @@
+# Generated by Django 6.0.2 on 2026-10-19 11:47
+
+from django.db import migrations, models
+
+
+def fill_totals(apps, schema_editor):
+    Cart = apps.get_model('catalog', 'Cart')
+    CartItem = apps.get_model('catalog', 'CartItem')
+    totals = {}
+    for cart_id, quantity, price in CartItem.objects.values_list('cart_id', 'quantity', 'product__price'):
+        items, total = totals.get(cart_id, (0, 0))
+        totals[cart_id] = (items + quantity, total + quantity * price)
+    for cart_id, (items, total) in totals.items():
+        Cart.objects.filter(pk=cart_id).update(total_items=items, total_price=total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0010_catalogchange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='total_items',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество товаров'),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='total_price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Сумма'),
+        ),
+        migrations.RunPython(fill_totals, migrations.RunPython.noop),
+    ]
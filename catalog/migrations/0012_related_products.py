@@ -0,0 +1,74 @@
+# Generated by Django 6.0.2 on 2026-10-19 12:03
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0011_cart_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CartSnapshot',
+            fields=[
+                ('cart_id', models.PositiveBigIntegerField(primary_key=True, serialize=False)),
+                ('product_ids', models.JSONField(default=list, verbose_name='Товары')),
+            ],
+            options={
+                'verbose_name': 'Снимок корзины',
+                'verbose_name_plural': 'Снимки корзин',
+            },
+        ),
+        migrations.CreateModel(
+            name='RecommendationState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('carts_synced_at', models.DateTimeField(null=True, verbose_name='Корзины учтены на')),
+                ('last_order_id', models.PositiveBigIntegerField(default=0, verbose_name='Последний учтенный заказ')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+            ],
+            options={
+                'verbose_name': 'Состояние рекомендаций',
+                'verbose_name_plural': 'Состояние рекомендаций',
+            },
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='contents_changed_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Состав изменен'),
+        ),
+        migrations.CreateModel(
+            name='ProductPair',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(verbose_name='Совместных покупок')),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='catalog.product', verbose_name='Другой товар')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='catalog.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Пара товаров',
+                'verbose_name_plural': 'Пары товаров',
+                'constraints': [models.UniqueConstraint(fields=('product', 'other'), name='productpair_product_other')],
+            },
+        ),
+        migrations.CreateModel(
+            name='RelatedProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField(verbose_name='Место')),
+                ('score', models.PositiveIntegerField(verbose_name='Совместных покупок')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='catalog.product', verbose_name='Товар')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='catalog.product', verbose_name='Связанный товар')),
+            ],
+            options={
+                'verbose_name': 'Связанный товар',
+                'verbose_name_plural': 'Связанные товары',
+                'ordering': ['product', 'rank'],
+                'constraints': [models.UniqueConstraint(fields=('product', 'rank'), name='relatedproduct_product_rank')],
+            },
+        ),
+    ]
@@ -1,10 +1,19 @@
 from django.db import models
+from django.db.models.functions import Coalesce, Now
+from django.utils import timezone
 from django.utils.text import slugify
 from django.core.validators import MinLengthValidator, MinValueValidator
 from django.conf import settings
-from PIL import Image
+from .images import build_product_derivatives
+from decimal import Decimal
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
+# Размеры изображений товара в порядке выдачи в API
+IMAGE_SIZES = ('small', 'medium', 'large', 'original')
+
 def category_image_path(instance, filename):
     """Генерирует путь для сохранения изображения категории"""
     return f'categories/{instance.slug}/{filename}'
@@ -96,10 +105,14 @@ class SubCategory(models.Model):
     
     def save(self, *args, **kwargs):
         if not self.slug:
+            # slug уникален глобально: занятые варианты берем одним запросом
             base_slug = slugify(self.name)
+            taken = set(
+                SubCategory.objects.filter(slug__startswith=base_slug).values_list('slug', flat=True)
+            )
             slug = base_slug
             counter = 1
-            while SubCategory.objects.filter(category=self.category, slug=slug).exists():
+            while slug in taken:
                 slug = f"{base_slug}-{counter}"
                 counter += 1
             self.slug = slug
@@ -116,6 +129,7 @@ class Product(models.Model):
     )
     name = models.CharField(
         max_length=200,
+        db_index=True,
         verbose_name='Наименование',
         validators=[MinLengthValidator(3)]
     )
@@ -172,60 +186,53 @@ class Product(models.Model):
     def __str__(self):
         return self.name
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'price' in field_names:
+            # Цена на момент загрузки: по ней save() понимает, что цена изменилась
+            instance._loaded_price = values[field_names.index('price')]
+        return instance
+    
     def save(self, *args, **kwargs):
-        """Переопределенный save для создания трех размеров изображения"""
+        """Переопределенный save для создания трех размеров изображения и истории цен"""
         if not self.slug:
             self.slug = slugify(self.name)        
         
+        adding = self._state.adding
+        price_changed = adding or self.price != getattr(self, '_loaded_price', None)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'price' not in update_fields:
+            price_changed = False
+        
         super().save(*args, **kwargs)        
         
+        if price_changed:
+            PriceHistory.objects.create(product=self, price=self.price)
+            self._loaded_price = self.price
+            if not adding:
+                Cart.objects.with_products([self.pk]).update_totals()
+        
         if self.image_original and not self.image_small:
             self.create_image_sizes()            
             super().save(*args, **kwargs)
     
     def create_image_sizes(self):
-        """Создает три размера изображения из оригинального"""
+        """Создает производные размеры изображения из оригинального"""
         if not self.image_original:
             return
         
-        try:            
-            img = Image.open(self.image_original.path)            
-            
-            base_path = self.image_original.path
-            base_name = os.path.basename(base_path)
-            base_dir = os.path.dirname(base_path)
-            name_without_ext = os.path.splitext(base_name)[0].replace('_original', '')
-            ext = os.path.splitext(base_name)[1]
-                        
-            os.makedirs(base_dir, exist_ok=True)
-            
-            # Размеры для ресайза
-            sizes = {
-                'large': (800, 800),
-                'medium': (400, 400),
-                'small': (200, 200)
-            }            
-            
-            for size_name, (width, height) in sizes.items():                
-                img_copy = img.copy()                
-                
-                img_copy.thumbnail((width, height), Image.Resampling.LANCZOS)                
-                
-                new_filename = f"{name_without_ext}_{size_name}{ext}"
-                new_path = os.path.join(base_dir, new_filename)                
-                
-                img_copy.save(new_path)                
-                
-                relative_path = os.path.relpath(new_path, settings.MEDIA_ROOT).replace('\\', '/')
-                if size_name == 'large':
-                    self.image_large.name = relative_path
-                elif size_name == 'medium':
-                    self.image_medium.name = relative_path
-                elif size_name == 'small':
-                    self.image_small.name = relative_path
-                    
-        except Exception as e:
-            print(f"Ошибка при создании изображений: {e}")
+        try:
+            paths = build_product_derivatives(
+                self.image_original.path, settings.PRODUCT_IMAGE_SIZES, settings.MEDIA_ROOT
+            )
+            for size_name, relative_path in paths.items():
+                getattr(self, f'image_{size_name}').name = relative_path
+        except Exception:
+            logger.exception(
+                "Ошибка при создании изображений",
+                extra={'event': 'product_images_failed', 'product_id': self.pk},
+            )
     
     @property
     def category(self):
@@ -235,18 +242,108 @@ class Product(models.Model):
     @property
     def images_list(self):
         """Возвращает словарь со всеми изображениями товара"""
+        return self.images_for(None)
+    
+    def images_for(self, sizes):
+        """Изображения только выбранных размеров (None — все)"""
         images = {}
-        if self.image_small:
-            images['small'] = self.image_small.url
-        if self.image_medium:
-            images['medium'] = self.image_medium.url
-        if self.image_large:
-            images['large'] = self.image_large.url
-        if self.image_original:
-            images['original'] = self.image_original.url
+        for size in IMAGE_SIZES:
+            if sizes is not None and size not in sizes:
+                continue
+            field = getattr(self, f'image_{size}')
+            if field:
+                images[size] = field.url
         return images
 
 
+class PriceHistoryQuerySet(models.QuerySet):
+    def price_at(self, when, product=models.OuterRef('pk')):
+        """
+        Подзапрос: цена товара, действовавшая в момент when.
+        
+        when и product могут быть OuterRef, например для позиций корзины:
+        PriceHistory.objects.price_at(OuterRef('created_at'), product=OuterRef('product'))
+        """
+        return models.Subquery(
+            self.filter(product=product, valid_from__lte=when)
+            .order_by('-valid_from')
+            .values('price')[:1]
+        )
+    
+    def prices_at(self, product_ids, when):
+        """Цены набора товаров на момент when одним запросом: {product_id: price}"""
+        return dict(
+            Product.objects.filter(pk__in=product_ids)
+            .annotate(price_at=self.price_at(when))
+            .values_list('pk', 'price_at')
+        )
+
+
+class PriceHistory(models.Model):
+    """История цен товара (только добавление записей)"""
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='price_history',
+        verbose_name='Товар'
+    )
+    price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Цена')
+    valid_from = models.DateTimeField(default=timezone.now, verbose_name='Действует с')
+    
+    objects = PriceHistoryQuerySet.as_manager()
+    
+    class Meta:
+        verbose_name = 'Цена товара'
+        verbose_name_plural = 'История цен'
+        ordering = ['-valid_from']
+        indexes = [models.Index(fields=['product', 'valid_from'], name='pricehistory_product_time')]
+    
+    def __str__(self):
+        return f"{self.product_id}: {self.price} с {self.valid_from}"
+
+
+class CartQuerySet(models.QuerySet):
+    def with_products(self, product_ids):
+        """Корзины, в которых лежит хотя бы один из товаров"""
+        return self.filter(pk__in=CartItem.objects.filter(product_id__in=product_ids).values('cart_id'))
+    
+    def with_actual_totals(self):
+        """Аннотирует actual_items и actual_price, посчитанные по позициям"""
+        items = CartItem.objects.filter(cart=models.OuterRef('pk')).order_by().values('cart')
+        return self.annotate(
+            actual_items=Coalesce(
+                models.Subquery(items.annotate(total=models.Sum('quantity')).values('total')), 0
+            ),
+            actual_price=Coalesce(
+                models.Subquery(items.annotate(total=models.Sum(
+                    models.F('quantity') * models.F('product__price'),
+                    output_field=models.DecimalField(max_digits=12, decimal_places=2),
+                )).values('total')),
+                models.Value(Decimal('0')),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2),
+            ),
+        )
+    
+    def update_totals(self):
+        """
+        Пересчитывает total_items и total_price по позициям одним UPDATE.
+        
+        Если число товаров изменилось, обновляется contents_changed_at (по нему
+        build_related_products находит корзины с новым составом); смена цен
+        его не трогает.
+        """
+        actual = self.model.objects.with_actual_totals().filter(pk=models.OuterRef('pk'))
+        actual_items = models.Subquery(actual.values('actual_items'))
+        return self.update(
+            total_items=actual_items,
+            total_price=models.Subquery(actual.values('actual_price')),
+            contents_changed_at=models.Case(
+                models.When(~models.Q(total_items=actual_items), then=Now()),
+                default=models.F('contents_changed_at'),
+            ),
+        )
+
+
 class Cart(models.Model):
     """Модель корзины пользователя"""
     user = models.OneToOneField(
@@ -255,8 +352,17 @@ class Cart(models.Model):
         related_name='cart',
         verbose_name='Пользователь'
     )
+    # Денормализованные итоги для /api/cart/summary/; пересчитываются в той же
+    # транзакции, что и изменение позиций или цен (CartQuerySet.update_totals)
+    total_items = models.PositiveIntegerField(default=0, verbose_name='Количество товаров')
+    total_price = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name='Сумма')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
+    contents_changed_at = models.DateTimeField(
+        default=timezone.now, db_index=True, verbose_name='Состав изменен'
+    )
+    
+    objects = CartQuerySet.as_manager()
     
     class Meta:
         verbose_name = 'Корзина'
@@ -264,16 +370,6 @@ class Cart(models.Model):
     
     def __str__(self):
         return f"Корзина {self.user.username}"
-    
-    @property
-    def total_price(self):
-        """Общая стоимость всех товаров в корзине"""
-        return sum(item.total_price for item in self.items.all())
-    
-    @property
-    def total_items(self):
-        """Общее количество товаров в корзине"""
-        return sum(item.quantity for item in self.items.all())
 
 
 class CartItem(models.Model):
@@ -307,4 +403,250 @@ class CartItem(models.Model):
     @property
     def total_price(self):
         """Стоимость товара в корзине"""
-        return self.product.price * self.quantity
\ No newline at end of file
+        return self.product.price * self.quantity
+
+class RequestProfile(models.Model):
+    """Профиль одного запроса, снятый ProfilingMiddleware"""
+    method = models.CharField(max_length=10, verbose_name='Метод')
+    path = models.CharField(max_length=500, verbose_name='Путь')
+    view_name = models.CharField(max_length=200, blank=True, verbose_name='Представление')
+    status_code = models.PositiveSmallIntegerField(verbose_name='Код ответа')
+    duration_ms = models.FloatField(db_index=True, verbose_name='Длительность, мс')
+    file_name = models.CharField(max_length=100, verbose_name='Файл профиля')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    
+    class Meta:
+        verbose_name = 'Профиль запроса'
+        verbose_name_plural = 'Профили запросов'
+        ordering = ['-duration_ms']
+    
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms} мс)"
+    
+    def file_path(self, ext):
+        """Путь к файлу профиля: ext — 'prof' или 'folded'"""
+        return os.path.join(settings.PROFILING_DIR, f"{self.file_name}.{ext}")
+    
+    def delete_files(self):
+        for ext in ('prof', 'folded'):
+            try:
+                os.remove(self.file_path(ext))
+            except FileNotFoundError:
+                pass
+
+
+class Stock(models.Model):
+    """Остаток товара, доступный для резервирования"""
+    product = models.OneToOneField(
+        Product,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stock',
+        verbose_name='Товар'
+    )
+    available = models.PositiveIntegerField(default=0, verbose_name='Доступно')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
+    
+    class Meta:
+        verbose_name = 'Остаток'
+        verbose_name_plural = 'Остатки'
+    
+    def __str__(self):
+        return f"{self.product_id}: {self.available}"
+
+
+class StockReservation(models.Model):
+    """Временный резерв остатка под позицию корзины"""
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='reservations',
+        verbose_name='Товар'
+    )
+    # SET_NULL: если позиция удалена в обход inventory, резерв вернет очистка просроченных
+    cart_item = models.OneToOneField(
+        CartItem,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='reservation',
+        verbose_name='Товар в корзине'
+    )
+    quantity = models.PositiveIntegerField(verbose_name='Количество')
+    expires_at = models.DateTimeField(db_index=True, verbose_name='Истекает')
+    
+    class Meta:
+        verbose_name = 'Резерв'
+        verbose_name_plural = 'Резервы'
+    
+    def __str__(self):
+        return f"{self.product_id} x{self.quantity} до {self.expires_at}"
+
+
+class Order(models.Model):
+    """Заказ, оформленный из корзины"""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='orders',
+        verbose_name='Пользователь'
+    )
+    idempotency_key = models.CharField(
+        max_length=64,
+        null=True,
+        blank=True,
+        verbose_name='Ключ идемпотентности'
+    )
+    total_price = models.DecimalField(max_digits=12, decimal_places=2, verbose_name='Сумма')
+    total_items = models.PositiveIntegerField(verbose_name='Количество товаров')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    
+    class Meta:
+        verbose_name = 'Заказ'
+        verbose_name_plural = 'Заказы'
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'idempotency_key'], name='order_user_idempotency_key'),
+        ]
+    
+    def __str__(self):
+        return f"Заказ №{self.pk}"
+
+
+class OrderItem(models.Model):
+    """Позиция заказа: снимок названия и цены товара на момент оформления"""
+    order = models.ForeignKey(
+        Order,
+        on_delete=models.CASCADE,
+        related_name='items',
+        verbose_name='Заказ'
+    )
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.SET_NULL,
+        null=True,
+        verbose_name='Товар'
+    )
+    product_name = models.CharField(max_length=200, verbose_name='Наименование')
+    price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Цена')
+    quantity = models.PositiveIntegerField(verbose_name='Количество')
+    
+    class Meta:
+        verbose_name = 'Товар в заказе'
+        verbose_name_plural = 'Товары в заказе'
+    
+    def __str__(self):
+        return f"{self.product_name} x{self.quantity}"
+    
+    @property
+    def total_price(self):
+        return self.price * self.quantity
+
+
+class IdempotencyKey(models.Model):
+    """Сохраненный ответ на запрос с заголовком Idempotency-Key"""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Пользователь'
+    )
+    key = models.CharField(max_length=64, verbose_name='Ключ')
+    fingerprint = models.CharField(max_length=64, verbose_name='Отпечаток запроса')
+    # NULL, пока первый запрос с этим ключом еще выполняется
+    status_code = models.PositiveSmallIntegerField(null=True, verbose_name='Код ответа')
+    response_body = models.JSONField(null=True, verbose_name='Тело ответа')
+    # Незавершенный запрос старше IDEMPOTENCY_CLAIM_TTL считается прерванным (воркер
+    # убит по таймауту, OOM, деплой), и ключ можно занять повторно
+    claimed_at = models.DateTimeField(default=timezone.now, verbose_name='Занят')
+    expires_at = models.DateTimeField(db_index=True, verbose_name='Истекает')
+    
+    class Meta:
+        verbose_name = 'Ключ идемпотентности'
+        verbose_name_plural = 'Ключи идемпотентности'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='idempotency_user_key'),
+        ]
+    
+    def __str__(self):
+        return self.key
+
+
+class CatalogChange(models.Model):
+    """Запись журнала изменений каталога (только добавление, упорядочена по seq)"""
+    KIND_CHOICES = [
+        ('category', 'Категория'),
+        ('subcategory', 'Подкатегория'),
+        ('product', 'Товар'),
+    ]
+    
+    seq = models.BigAutoField(primary_key=True)
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES, verbose_name='Тип объекта')
+    object_id = models.PositiveIntegerField(verbose_name='ID объекта')
+    deleted = models.BooleanField(default=False, verbose_name='Удален')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата изменения')
+    
+    class Meta:
+        verbose_name = 'Изменение каталога'
+        verbose_name_plural = 'Журнал изменений каталога'
+        ordering = ['seq']
+        indexes = [models.Index(fields=['kind', 'object_id', 'seq'], name='catalogchange_object')]
+    
+    def __str__(self):
+        return f"#{self.seq} {self.kind}:{self.object_id}{' (удален)' if self.deleted else ''}"
+
+
+class CartSnapshot(models.Model):
+    """
+    Состав корзины, учтенный в ProductPair при последнем запуске
+    build_related_products; нужен, чтобы вычесть старый вклад корзины.
+    """
+    # Не внешний ключ: снимок удаленной корзины нужен, чтобы вычесть ее вклад
+    cart_id = models.PositiveBigIntegerField(primary_key=True)
+    product_ids = models.JSONField(default=list, verbose_name='Товары')
+    
+    class Meta:
+        verbose_name = 'Снимок корзины'
+        verbose_name_plural = 'Снимки корзин'
+
+
+class ProductPair(models.Model):
+    """Разреженная матрица совместных покупок: в скольких корзинах и заказах товары встречались вместе"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+', verbose_name='Товар')
+    other = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+', verbose_name='Другой товар')
+    count = models.PositiveIntegerField(verbose_name='Совместных покупок')
+    
+    class Meta:
+        verbose_name = 'Пара товаров'
+        verbose_name_plural = 'Пары товаров'
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'other'], name='productpair_product_other'),
+        ]
+
+
+class RelatedProduct(models.Model):
+    """Top-K товаров, которые покупают вместе с товаром (для /api/products/<id>/related/)"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+', verbose_name='Товар')
+    rank = models.PositiveSmallIntegerField(verbose_name='Место')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+',
+                                verbose_name='Связанный товар')
+    score = models.PositiveIntegerField(verbose_name='Совместных покупок')
+    
+    class Meta:
+        verbose_name = 'Связанный товар'
+        verbose_name_plural = 'Связанные товары'
+        ordering = ['product', 'rank']
+        constraints = [
+            # Индекс под выборку top-K по товару
+            models.UniqueConstraint(fields=['product', 'rank'], name='relatedproduct_product_rank'),
+        ]
+
+
+class RecommendationState(models.Model):
+    """Докуда build_related_products уже обработал корзины и заказы (одна строка)"""
+    carts_synced_at = models.DateTimeField(null=True, verbose_name='Корзины учтены на')
+    last_order_id = models.PositiveBigIntegerField(default=0, verbose_name='Последний учтенный заказ')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
+    
+    class Meta:
+        verbose_name = 'Состояние рекомендаций'
+        verbose_name_plural = 'Состояние рекомендаций'
@@ -0,0 +1,73 @@
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Now
+
+from .inventory import reserve
+from .models import Cart, CartItem, Order, OrderItem, StockReservation
+
+
+class EmptyCart(Exception):
+    """В корзине нет товаров"""
+
+
+def checkout(user, idempotency_key=None):
+    """
+    Оформляет заказ из корзины пользователя в одной транзакции.
+    
+    Возвращает (order, created). Повтор с тем же idempotency_key возвращает
+    ранее созданный заказ и не трогает корзину. Резервы позиций переходят
+    в продажу; просроченные резервируются заново (InsufficientStock при
+    нехватке).
+    """
+    if idempotency_key:
+        existing = Order.objects.filter(user=user, idempotency_key=idempotency_key).first()
+        if existing:
+            return existing, False
+    
+    try:
+        with transaction.atomic():
+            cart = Cart.objects.select_for_update().filter(user=user).first()
+            # Параллельный повтор с тем же ключом мог оформить заказ, пока мы ждали
+            # блокировку корзины: корзина уже пуста, но ответ — тот же заказ
+            if idempotency_key:
+                existing = Order.objects.filter(user=user, idempotency_key=idempotency_key).first()
+                if existing:
+                    return existing, False
+            items = list(
+                CartItem.objects.filter(cart=cart)
+                .select_related('product', 'reservation')
+                .order_by('pk')
+            ) if cart else []
+            if not items:
+                raise EmptyCart()
+            
+            for item in items:
+                reservation = getattr(item, 'reservation', None)
+                if reservation is None or reservation.quantity != item.quantity:
+                    reserve(item, item.quantity)
+            
+            order = Order.objects.create(
+                user=user,
+                idempotency_key=idempotency_key or None,
+                total_price=sum(item.product.price * item.quantity for item in items),
+                total_items=sum(item.quantity for item in items),
+            )
+            OrderItem.objects.bulk_create(
+                OrderItem(
+                    order=order,
+                    product=item.product,
+                    product_name=item.product.name,
+                    price=item.product.price,
+                    quantity=item.quantity,
+                )
+                for item in items
+            )
+            # Зарезервированный остаток уже списан — резервы просто удаляются
+            StockReservation.objects.filter(cart_item__cart=cart).delete()
+            CartItem.objects.filter(cart=cart).delete()
+            Cart.objects.filter(pk=cart.pk).update(total_items=0, total_price=0, contents_changed_at=Now())
+    except IntegrityError:
+        # Параллельный повтор с тем же ключом успел создать заказ первым
+        if not idempotency_key:
+            raise
+        return Order.objects.get(user=user, idempotency_key=idempotency_key), False
+    return order, True
@@ -0,0 +1,116 @@
+import csv
+import io
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.core.validators import MinValueValidator
+from django.db import transaction
+from django.db.models import Case, DecimalField, When
+from django.utils import timezone
+
+from . import changelog
+from .models import Cart, Product, PriceHistory
+from .signals import prices_changed
+
+PRICE_FIELD = Product._meta.get_field('price')
+
+
+def clean_price(value):
+    """Приводит цену к Decimal с двумя знаками и проверяет так же, как поле Product.price"""
+    try:
+        price = Decimal(str(value)).quantize(Decimal('0.01'))
+    except (InvalidOperation, ValueError):
+        raise ValidationError(f"Некорректная цена: {value!r}")
+    # NaN и бесконечность проходят quantize, но не сравниваются с 0 в валидаторе
+    if not price.is_finite():
+        raise ValidationError(f"Некорректная цена: {value!r}")
+    MinValueValidator(0)(price)
+    if len(price.as_tuple().digits) > PRICE_FIELD.max_digits:
+        raise ValidationError(f"Слишком большая цена: {value!r}")
+    return price
+
+
+def parse_price_rows(text):
+    """
+    Разбирает строки вида «slug_или_id;цена» (разделитель ; , или таб).
+    
+    Возвращает список словарей {'id'|'slug': ..., 'price': ...} для bulk_update_prices.
+    """
+    rows = []
+    sample = text[:1024]
+    delimiter = ';' if ';' in sample else '\t' if '\t' in sample else ','
+    for number, parts in enumerate(csv.reader(io.StringIO(text), delimiter=delimiter), start=1):
+        parts = [part.strip() for part in parts]
+        if not any(parts):
+            continue
+        if len(parts) != 2:
+            raise ValidationError(f"Строка {number}: ожидается «slug_или_id{delimiter}цена»")
+        key, price = parts
+        # isdigit() пропускает надстрочные цифры («²»), на которых int() падает
+        rows.append({'id': int(key)} if key.isdecimal() else {'slug': key})
+        rows[-1]['price'] = price
+    return rows
+
+
+def bulk_update_prices(rows, batch_size=500):
+    """
+    Обновляет цены пачками, по одному UPDATE ... CASE на пачку, в одной транзакции,
+    и дописывает новые цены в PriceHistory и журнал изменений каталога.
+    
+    rows — итерируемое словарей с ключом 'id' или 'slug' и ключом 'price'.
+    Некорректная цена отменяет все изменения (ValidationError). Сигнал
+    prices_changed отправляется один раз после коммита.
+    """
+    by_id, by_slug = {}, {}
+    for row in rows:
+        price = clean_price(row['price'])
+        if row.get('id') is not None:
+            by_id[int(row['id'])] = price
+        else:
+            by_slug[row['slug']] = price
+    
+    result = {'received': len(by_id) + len(by_slug), 'updated': 0, 'unchanged': 0, 'not_found': []}
+    changed_ids = []
+    
+    with transaction.atomic():
+        slugs = list(by_slug)
+        for start in range(0, len(slugs), batch_size):
+            batch = slugs[start:start + batch_size]
+            found = dict(Product.objects.filter(slug__in=batch).values_list('slug', 'pk'))
+            for slug in batch:
+                if slug in found:
+                    by_id[found[slug]] = by_slug[slug]
+                else:
+                    result['not_found'].append(slug)
+        
+        ids = list(by_id)
+        now = timezone.now()
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            current = dict(Product.objects.filter(pk__in=batch).values_list('pk', 'price'))
+            result['not_found'].extend(pk for pk in batch if pk not in current)
+            changes = {pk: by_id[pk] for pk in batch if pk in current and current[pk] != by_id[pk]}
+            result['unchanged'] += len(current) - len(changes)
+            if not changes:
+                continue
+            result['updated'] += Product.objects.filter(pk__in=changes).update(
+                price=Case(
+                    *(When(pk=pk, then=price) for pk, price in changes.items()),
+                    output_field=DecimalField(max_digits=10, decimal_places=2),
+                ),
+                updated_at=now,
+            )
+            PriceHistory.objects.bulk_create(
+                PriceHistory(product_id=pk, price=price, valid_from=now)
+                for pk, price in changes.items()
+            )
+            changed_ids.extend(changes)
+            Cart.objects.with_products(changes).update_totals()
+        
+        if changed_ids:
+            # Журнал пишется в той же транзакции: после коммита он не отстает от цен
+            changelog.record('product', changed_ids)
+            transaction.on_commit(
+                lambda: prices_changed.send(sender=Product, product_ids=changed_ids)
+            )
+    return result
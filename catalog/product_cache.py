@@ -0,0 +1,152 @@
+"""
+Кэш сериализованных товаров для /api/products/<slug>/ и /api/products/?ids=
+и дерева категорий для /api/categories/.
+
+Ключ товара — его id; запись удаляется после коммита сохранения или удаления
+товара, пакетного обновления цен и переименования его категории или
+подкатегории (их названия входят в представление товара). Дерево категорий
+сбрасывается целиком при любом изменении категории или подкатегории.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import CartItem, Category, Product, SubCategory
+from .signals import prices_changed
+
+
+def product_key(product_id):
+    return f'product:v1:{product_id}'
+
+
+def slug_key(slug):
+    return f'product-slug:v1:{slug}'
+
+
+CATEGORY_TREE_KEY = 'category-tree:v1'
+
+
+def _serialize(products):
+    from .serializers import ProductSerializer
+    return {product.pk: dict(ProductSerializer(product).data) for product in products}
+
+
+def get_products(ids):
+    """
+    Представления товаров {id: data} для ids; отсутствующих в БД в ответе нет.
+    
+    Промахи кэша загружаются одним запросом через in_bulk.
+    """
+    cached = cache.get_many([product_key(pk) for pk in ids])
+    found = {pk: cached[product_key(pk)] for pk in ids if product_key(pk) in cached}
+    missing = [pk for pk in ids if pk not in found]
+    if missing:
+        products = Product.objects.select_related('subcategory__category').in_bulk(missing)
+        loaded = _serialize(products.values())
+        cache.set_many(
+            {product_key(pk): data for pk, data in loaded.items()}, settings.PRODUCT_CACHE_TTL
+        )
+        found.update(loaded)
+    return found
+
+
+def get_product_by_slug(slug):
+    """Представление товара по slug или None; slug -> id тоже кэшируется"""
+    product_id = cache.get(slug_key(slug))
+    if product_id is not None:
+        data = get_products([product_id]).get(product_id)
+        # После смены slug старая запись указывает на товар с другим slug
+        if data is not None and data['slug'] == slug:
+            return data
+    product = Product.objects.select_related('subcategory__category').filter(slug=slug).first()
+    if product is None:
+        return None
+    data = _serialize([product])[product.pk]
+    cache.set_many(
+        {product_key(product.pk): data, slug_key(slug): product.pk}, settings.PRODUCT_CACHE_TTL
+    )
+    return data
+
+
+def get_category_tree():
+    """
+    Все категории с подкатегориями (объекты моделей с prefetch).
+    
+    Кэшируются объекты, а не JSON: сериализатор строит абсолютные URL
+    изображений по запросу.
+    """
+    categories = cache.get(CATEGORY_TREE_KEY)
+    if categories is None:
+        categories = list(Category.objects.prefetch_related('subcategories'))
+        cache.set(CATEGORY_TREE_KEY, categories, settings.PRODUCT_CACHE_TTL)
+    return categories
+
+
+def hot_product_ids(limit):
+    """id товаров, которые чаще всего лежат в корзинах; остальные места — по порядку id"""
+    ids = list(
+        CartItem.objects.values('product_id').annotate(carts=Count('id'))
+        .order_by('-carts', 'product_id').values_list('product_id', flat=True)[:limit]
+    )
+    if len(ids) < limit:
+        ids += Product.objects.exclude(pk__in=ids).order_by('pk').values_list(
+            'pk', flat=True)[:limit - len(ids)]
+    return ids
+
+
+def warm_caches(products=None):
+    """
+    Заполняет кэш деревом категорий и популярными товарами; возвращает число товаров.
+    
+    Вызывается при старте сервера до fork воркеров (config/gunicorn.conf.py):
+    locmem-кэш мастера достается воркерам через copy-on-write, общий кэш
+    заполняется один раз.
+    """
+    get_category_tree()
+    ids = hot_product_ids(settings.WARM_CACHE_PRODUCTS if products is None else products)
+    found = get_products(ids)
+    # Ссылки slug -> id, чтобы и /api/products/<slug>/ обходился без БД
+    cache.set_many({slug_key(data['slug']): pk for pk, data in found.items()}, settings.PRODUCT_CACHE_TTL)
+    return len(found)
+
+
+def invalidate_category_tree():
+    transaction.on_commit(lambda: cache.delete(CATEGORY_TREE_KEY))
+
+
+def invalidate(ids):
+    ids = list(ids)
+    if ids:
+        transaction.on_commit(lambda: cache.delete_many([product_key(pk) for pk in ids]))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, instance, **kwargs):
+    invalidate([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=SubCategory)
+@receiver(post_delete, sender=SubCategory)
+def category_tree_changed(sender, **kwargs):
+    invalidate_category_tree()
+
+
+@receiver(post_save, sender=Category)
+def category_changed(sender, instance, **kwargs):
+    invalidate(Product.objects.filter(subcategory__category=instance).values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=SubCategory)
+def subcategory_changed(sender, instance, **kwargs):
+    invalidate(Product.objects.filter(subcategory=instance).values_list('pk', flat=True))
+
+
+@receiver(prices_changed)
+def prices_updated(sender, product_ids, **kwargs):
+    invalidate(product_ids)
@@ -0,0 +1,139 @@
+import cProfile
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core import signing
+
+SIGNING_SALT = 'catalog.profiling'
+
+
+def make_token():
+    """Подписанное значение для заголовка X-Profile"""
+    return signing.dumps({'profile': True}, salt=SIGNING_SALT)
+
+
+def token_is_valid(value):
+    try:
+        signing.loads(value, salt=SIGNING_SALT, max_age=settings.PROFILING_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+class StackSampler:
+    """Статистический профайлер: периодически снимает стек указанного потока"""
+    
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+    
+    def start(self):
+        self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+        if self._thread.ident is not None:
+            self._thread.join()
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+    
+    def folded(self):
+        """Стеки в формате flamegraph.pl / speedscope (collapsed stacks)"""
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class ProfilingMiddleware:
+    """
+    Профилирует отдельные запросы в продакшене без передеплоя.
+    
+    Запрос профилируется, если в нем есть заголовок X-Profile с токеном
+    из profiling_token, если сотрудник добавил ?_profile=1, либо случайно
+    с вероятностью PROFILING_SAMPLE_RATE. Сохраняются .prof (cProfile)
+    и .folded (стеки для flamegraph), в админке видны самые медленные.
+    """
+    
+    # cProfile допускает один активный профайлер на процесс (с Python 3.12
+    # второй enable() падает с ValueError): параллельные запросы не профилируются
+    lock = threading.Lock()
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+    
+    def should_profile(self, request):
+        header = request.headers.get('X-Profile')
+        if header and token_is_valid(header):
+            return True
+        user = getattr(request, 'user', None)
+        if request.GET.get('_profile') == '1' and user is not None and user.is_staff:
+            return True
+        rate = settings.PROFILING_SAMPLE_RATE
+        return rate > 0 and random.random() < rate
+    
+    def __call__(self, request):
+        if not self.should_profile(request) or not self.lock.acquire(blocking=False):
+            return self.get_response(request)
+        
+        profiler = cProfile.Profile()
+        sampler = StackSampler(threading.get_ident(), settings.PROFILING_SAMPLE_INTERVAL)
+        try:
+            sampler.start()
+            start = time.perf_counter()
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+                duration = time.perf_counter() - start
+        finally:
+            sampler.stop()
+            self.lock.release()
+        
+        record = save_profile(request, response, duration, profiler, sampler)
+        response['X-Profile-Id'] = str(record.pk)
+        return response
+
+
+def save_profile(request, response, duration, profiler, sampler):
+    """Сохраняет файлы профиля и запись о нем, удаляя самые старые сверх лимита"""
+    from .models import RequestProfile
+    
+    directory = settings.PROFILING_DIR
+    os.makedirs(directory, exist_ok=True)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    profiler.dump_stats(os.path.join(directory, f"{name}.prof"))
+    with open(os.path.join(directory, f"{name}.folded"), 'w') as f:
+        f.write(sampler.folded())
+    
+    match = request.resolver_match
+    record = RequestProfile.objects.create(
+        method=request.method,
+        path=request.get_full_path()[:500],
+        view_name=match.view_name if match else '',
+        status_code=response.status_code,
+        duration_ms=round(duration * 1000, 2),
+        file_name=name,
+    )
+    
+    stale = RequestProfile.objects.order_by('-created_at', '-pk')[settings.PROFILING_MAX_PROFILES:]
+    for old in stale:
+        old.delete_files()
+        old.delete()
+    return record
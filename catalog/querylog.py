@@ -0,0 +1,132 @@
+import logging
+import os
+import time
+import traceback
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+from .instrumentation import untracked
+
+logger = logging.getLogger('catalog.db')
+
+
+class NPlusOneQueryError(Exception):
+    """Один и тот же SQL выполнен в рамках запроса больше допустимого числа раз"""
+
+
+def _call_site(limit=6):
+    """Кадры стека из кода проекта (без Django, библиотек и этого модуля)"""
+    base_dir = str(settings.BASE_DIR)
+    frames = [
+        f"{os.path.relpath(frame.filename, base_dir)}:{frame.lineno} in {frame.name}"
+        for frame in traceback.extract_stack()
+        if frame.filename.startswith(base_dir)
+        and 'site-packages' not in frame.filename
+        and frame.filename != __file__
+    ]
+    return frames[-limit:]
+
+
+class QueryInspector:
+    """
+    Обертка для connection.execute_wrapper: логирует медленные запросы со
+    стеком вызова и планом выполнения и находит повторы одного SQL (N+1).
+    
+    EXPLAIN откладывается до explain_pending(), который вызывается после
+    снятия оберток: иначе его время попало бы в длительность медленного
+    запроса у внешних оберток (db_time в Server-Timing и /metrics).
+    """
+    
+    def __init__(self, slow_threshold_ms=None, n_plus_one_threshold=None, raise_errors=None, explain=None):
+        self.slow_threshold = (
+            slow_threshold_ms if slow_threshold_ms is not None else settings.SLOW_QUERY_THRESHOLD_MS
+        ) / 1000
+        self.n_plus_one_threshold = (
+            n_plus_one_threshold if n_plus_one_threshold is not None else settings.N_PLUS_ONE_THRESHOLD
+        )
+        self.raise_errors = raise_errors if raise_errors is not None else settings.QUERY_INSPECTOR_RAISE
+        self.explain = explain if explain is not None else settings.QUERY_INSPECTOR_EXPLAIN
+        self.counts = Counter()
+        self.slow_queries = []
+        self.repeated_queries = []
+        self._pending = []
+    
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration = time.perf_counter() - start
+        
+        if duration >= self.slow_threshold:
+            self._report_slow(context['connection'], sql, params, many, duration)
+        
+        if not many:
+            self.counts[sql] += 1
+            if self.counts[sql] == self.n_plus_one_threshold:
+                self._report_repeated(sql)
+        return result
+    
+    def _report_slow(self, connection, sql, params, many, duration):
+        entry = {
+            'sql': sql,
+            'duration_ms': round(duration * 1000, 2),
+            'stack': _call_site(),
+            'plan': None,
+        }
+        self.slow_queries.append(entry)
+        if self.explain and not many and sql.lstrip().upper().startswith('SELECT'):
+            # План и запись в лог — в explain_pending(), вне замера этого запроса
+            self._pending.append((connection, sql, params, entry))
+        else:
+            logger.warning("Медленный SQL-запрос", extra={'event': 'slow_query', **entry})
+    
+    def explain_pending(self):
+        """Получает планы отложенных медленных запросов и пишет их в лог"""
+        pending, self._pending = self._pending, []
+        for connection, sql, params, entry in pending:
+            entry['plan'] = self._explain(connection, sql, params)
+            logger.warning("Медленный SQL-запрос", extra={'event': 'slow_query', **entry})
+    
+    def _explain(self, connection, sql, params):
+        # EXPLAIN не должен попадать в число запросов и время БД (Server-Timing, /metrics)
+        try:
+            with untracked(), connection.cursor() as cursor:
+                cursor.execute(f"{connection.ops.explain_query_prefix()} {sql}", params)
+                return [' '.join(str(column) for column in row) for row in cursor.fetchall()]
+        except DatabaseError:
+            return None
+    
+    def _report_repeated(self, sql):
+        entry = {'sql': sql, 'count': self.counts[sql], 'stack': _call_site()}
+        self.repeated_queries.append(entry)
+        logger.warning("Повторяющийся SQL-запрос (возможен N+1)", extra={'event': 'n_plus_one', **entry})
+        if self.raise_errors:
+            raise NPlusOneQueryError(
+                f"SQL выполнен {self.counts[sql]} раз за запрос: {sql}\n" + '\n'.join(entry['stack'])
+            )
+
+
+@contextmanager
+def inspect_queries(**kwargs):
+    """Включает QueryInspector на всех подключениях; удобно в тестах"""
+    inspector = QueryInspector(**kwargs)
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(inspector))
+            yield inspector
+    finally:
+        inspector.explain_pending()
+
+
+class QueryInspectorMiddleware:
+    """Проверяет SQL-запросы каждого HTTP-запроса отдельным QueryInspector"""
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        with inspect_queries():
+            return self.get_response(request)
@@ -0,0 +1,217 @@
+"""
+Рекомендации «покупают вместе»: офлайн-подсчет совместных покупок.
+
+build_related_products ведет разреженную матрицу ProductPair (в скольких
+корзинах и заказах два товара встречались вместе) и по ней — top-K
+соседей каждого товара в RelatedProduct, откуда их одним индексным
+запросом отдает /api/products/<id>/related/.
+
+Запуск инкрементальный: учитываются только корзины, состав которых
+изменился с прошлого запуска (Cart.contents_changed_at), удаленные корзины
+и новые заказы. Для корзины вычитается вклад прошлого состава (CartSnapshot)
+и добавляется вклад нового, поэтому повторный запуск ничего не удваивает.
+"""
+from collections import Counter
+from datetime import timedelta
+from itertools import permutations
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .models import (
+    Cart, CartItem, CartSnapshot, OrderItem, Product, ProductPair, RecommendationState, RelatedProduct,
+)
+
+
+def basket_pairs(product_ids):
+    """
+    Упорядоченные пары (a, b) разных товаров корзины как Counter.
+
+    Корзина длиннее RELATED_PRODUCTS_MAX_BASKET обрезается: число пар растет
+    квадратично, а такие корзины мало говорят о связи товаров.
+    """
+    ids = sorted(set(product_ids))[:settings.RELATED_PRODUCTS_MAX_BASKET]
+    return Counter(permutations(ids, 2))
+
+
+def _chunks(values, size):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def apply_delta(delta, batch_size=500):
+    """
+    Прибавляет delta {(a, b): n} к ProductPair; возвращает товары, у которых
+    изменились пары. Пары с нулевым счетчиком удаляются.
+    """
+    delta = {pair: n for pair, n in delta.items() if n}
+    if not delta:
+        return set()
+    by_product = {}
+    for a, b in delta:
+        by_product.setdefault(a, set()).add(b)
+    # Товары могли быть удалены после того, как попали в корзину или снимок
+    alive = set(Product.objects.filter(
+        pk__in={pk for pair in delta for pk in pair}
+    ).values_list('pk', flat=True))
+
+    touched = set()
+    for chunk in _chunks(by_product, batch_size):
+        others = set().union(*(by_product[a] for a in chunk))
+        existing = {
+            (a, b): (pk, count)
+            for pk, a, b, count in ProductPair.objects.filter(
+                product_id__in=chunk, other_id__in=others
+            ).values_list('pk', 'product_id', 'other_id', 'count')
+            if (a, b) in delta
+        }
+        upsert, stale = [], []
+        for a in chunk:
+            for b in by_product[a]:
+                pk, count = existing.get((a, b), (None, 0))
+                count += delta[(a, b)]
+                if count > 0 and a in alive and b in alive:
+                    upsert.append(ProductPair(product_id=a, other_id=b, count=count))
+                elif pk is not None:
+                    stale.append(pk)
+        ProductPair.objects.filter(pk__in=stale).delete()
+        ProductPair.objects.bulk_create(
+            upsert, batch_size=batch_size,
+            update_conflicts=True, unique_fields=['product', 'other'], update_fields=['count'],
+        )
+        touched.update(a for a in chunk if a in alive)
+    return touched
+
+
+def refresh_related(product_ids, top_k=None, batch_size=500):
+    """Пересобирает top-K соседей товаров по ProductPair (ранжирование — оконной функцией в БД)"""
+    top_k = top_k or settings.RELATED_PRODUCTS_TOP_K
+    for chunk in _chunks(sorted(product_ids), batch_size):
+        top = (
+            ProductPair.objects.filter(product_id__in=chunk)
+            .annotate(position=Window(
+                RowNumber(), partition_by=[F('product_id')], order_by=[F('count').desc(), F('other_id').asc()],
+            ))
+            .filter(position__lte=top_k)
+            .values_list('product_id', 'other_id', 'count', 'position')
+        )
+        rows = [
+            RelatedProduct(product_id=product_id, related_id=other_id, score=count, rank=position)
+            for product_id, other_id, count, position in top
+        ]
+        with transaction.atomic():
+            RelatedProduct.objects.filter(product_id__in=chunk).delete()
+            RelatedProduct.objects.bulk_create(rows)
+
+
+def _sync_carts(cart_ids):
+    """
+    Учитывает новый состав корзин (и удаление корзин); возвращает (затронутые
+    товары, число корзин с изменившимся составом)
+    """
+    contents = {}
+    for cart_id, product_id in CartItem.objects.filter(cart_id__in=cart_ids).values_list('cart_id', 'product_id'):
+        contents.setdefault(cart_id, []).append(product_id)
+    snapshots = CartSnapshot.objects.in_bulk(cart_ids)
+    existing = set(Cart.objects.filter(pk__in=cart_ids).values_list('pk', flat=True))
+
+    delta = Counter()
+    changed, removed = [], []
+    count = 0
+    for cart_id in cart_ids:
+        old = snapshots[cart_id].product_ids if cart_id in snapshots else []
+        # У удаленной корзины позиций нет: вычитается весь ее вклад
+        new = sorted(set(contents.get(cart_id, [])))
+        if old == new:
+            continue
+        count += 1
+        delta.update(basket_pairs(new))
+        delta.subtract(basket_pairs(old))
+        if cart_id in existing and new:
+            changed.append(CartSnapshot(cart_id=cart_id, product_ids=new))
+        elif cart_id in snapshots:
+            removed.append(cart_id)
+
+    with transaction.atomic():
+        touched = apply_delta(delta)
+        CartSnapshot.objects.filter(cart_id__in=removed).delete()
+        CartSnapshot.objects.bulk_create(
+            changed, update_conflicts=True, unique_fields=['cart_id'], update_fields=['product_ids'],
+        )
+    return touched, count
+
+
+def _sync_orders(state, batch_size):
+    """
+    Добавляет заказы с id > state.last_order_id; возвращает (затронутые товары,
+    число заказов). Заказы не меняются, снимки им не нужны.
+    """
+    touched = set()
+    processed = 0
+    while True:
+        order_ids = list(
+            OrderItem.objects.filter(order_id__gt=state.last_order_id)
+            .order_by('order_id').values_list('order_id', flat=True).distinct()[:batch_size]
+        )
+        if not order_ids:
+            return touched, processed
+        baskets = {}
+        for order_id, product_id in OrderItem.objects.filter(
+            order_id__in=order_ids, product__isnull=False
+        ).values_list('order_id', 'product_id'):
+            baskets.setdefault(order_id, []).append(product_id)
+        delta = Counter()
+        for product_ids in baskets.values():
+            delta.update(basket_pairs(product_ids))
+        with transaction.atomic():
+            touched |= apply_delta(delta)
+            state.last_order_id = order_ids[-1]
+            state.save(update_fields=['last_order_id', 'updated_at'])
+        processed += len(order_ids)
+
+
+def build_related(full=False, batch_size=500):
+    """
+    Обновляет матрицу и top-K соседей; возвращает статистику запуска.
+
+    full пересчитывает все с нуля. Запуски не должны идти параллельно.
+    """
+    started = timezone.now()
+    if full:
+        with transaction.atomic():
+            ProductPair.objects.all().delete()
+            CartSnapshot.objects.all().delete()
+            RelatedProduct.objects.all().delete()
+            RecommendationState.objects.all().delete()
+    state, _ = RecommendationState.objects.get_or_create(pk=1)
+
+    carts = Cart.objects.order_by('pk')
+    if state.carts_synced_at is not None:
+        carts = carts.filter(contents_changed_at__gte=state.carts_synced_at)
+    cart_ids = list(carts.values_list('pk', flat=True))
+    # Удаленные корзины, чей вклад еще учтен
+    cart_ids += list(
+        CartSnapshot.objects.exclude(cart_id__in=Cart.objects.values('pk')).values_list('cart_id', flat=True)
+    )
+
+    touched = set()
+    changed_carts = 0
+    for chunk in _chunks(cart_ids, batch_size):
+        chunk_touched, chunk_changed = _sync_carts(chunk)
+        touched |= chunk_touched
+        changed_carts += chunk_changed
+    # Корзины, измененные во время запуска, попадут в следующий (>= started). Now()
+    # корзины вычисляется до коммита ее транзакции, поэтому запись, закоммиченная
+    # после чтения списка, может иметь время раньше started: отступаем на запас,
+    # повторный разбор таких корзин по снимкам ничего не удваивает
+    state.carts_synced_at = started - timedelta(seconds=settings.RELATED_PRODUCTS_SYNC_MARGIN)
+    state.save(update_fields=['carts_synced_at', 'updated_at'])
+    order_touched, orders = _sync_orders(state, batch_size)
+    touched |= order_touched
+
+    refresh_related(touched, batch_size=batch_size)
+    return {'carts': changed_carts, 'orders': orders, 'products': len(touched)}
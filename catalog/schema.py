@@ -0,0 +1,57 @@
+"""
+OpenAPI-схема API как статический артефакт.
+
+Схема генерируется командой export_schema при деплое и коммитится в
+OPENAPI_SCHEMA_PATH; /openapi.json отдает файл из памяти с ETag. Если файла
+нет, схема генерируется один раз при первом запросе. Тест
+SchemaDriftTestCase падает, если закоммиченная схема расходится с кодом.
+"""
+import hashlib
+import json
+from functools import lru_cache
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import etag
+
+
+def api_info():
+    from drf_yasg import openapi
+    return openapi.Info(
+        title="Grocery Store API",
+        default_version='v1',
+        description="API для магазина продуктов",
+        contact=openapi.Contact(email="admin@example.com"),
+    )
+
+
+def generate_schema():
+    """Полная схема API (словарь), как ее видит публичный клиент"""
+    from drf_yasg.generators import OpenAPISchemaGenerator
+    schema = OpenAPISchemaGenerator(api_info()).get_schema(request=None, public=True)
+    # Прогон через JSON превращает объекты drf-yasg в обычные словари и списки
+    return json.loads(json.dumps(schema))
+
+
+def render_schema(schema):
+    """Каноничное представление: стабильный порядок ключей, чтобы diff был читаемым"""
+    return (json.dumps(schema, indent=2, sort_keys=True, ensure_ascii=False) + '\n').encode()
+
+
+@lru_cache(maxsize=None)
+def load_schema():
+    """(байты схемы, ETag): файл OPENAPI_SCHEMA_PATH или, если его нет, генерация"""
+    try:
+        with open(settings.OPENAPI_SCHEMA_PATH, 'rb') as f:
+            content = f.read()
+    except FileNotFoundError:
+        content = render_schema(generate_schema())
+    return content, f'"{hashlib.sha256(content).hexdigest()[:32]}"'
+
+
+@etag(lambda request: load_schema()[1])
+@cache_control(public=True, max_age=300)
+def openapi_schema(request):
+    """Эндпоинт OpenAPI-схемы: готовый JSON из памяти, 304 по If-None-Match"""
+    return HttpResponse(load_schema()[0], content_type='application/json')
@@ -1,5 +1,29 @@
 from rest_framework import serializers
-from .models import Category, SubCategory, Product, Cart, CartItem
+from .models import IMAGE_SIZES, Category, SubCategory, Product, Cart, CartItem, Order, OrderItem
+from .instrumentation import TimedSerializerMixin
+
+
+def parse_list_param(request, name, allowed):
+    """?name=a,b -> множество значений; None, если параметр не задан"""
+    raw = request.query_params.get(name, '') if request is not None else ''
+    values = {value.strip() for value in raw.split(',') if value.strip()}
+    if not values:
+        return None
+    unknown = values - set(allowed)
+    if unknown:
+        raise serializers.ValidationError({name: f"Неизвестные значения: {', '.join(sorted(unknown))}"})
+    return values
+
+
+class SparseFieldsMixin:
+    """Оставляет только поля из context['fields'] (?fields=), если они заданы"""
+    
+    def get_fields(self):
+        fields = super().get_fields()
+        wanted = self.context.get('fields')
+        if wanted is None:
+            return fields
+        return {name: field for name, field in fields.items() if name in wanted}
 
 class SubCategorySerializer(serializers.ModelSerializer):
     """Сериализатор для подкатегорий"""
@@ -7,7 +31,7 @@ class SubCategorySerializer(serializers.ModelSerializer):
         model = SubCategory
         fields = ['id', 'name', 'slug', 'image']
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор для категорий с вложенными подкатегориями"""
     subcategories = SubCategorySerializer(many=True, read_only=True)
     
@@ -15,7 +39,7 @@ class CategorySerializer(serializers.ModelSerializer):
         model = Category
         fields = ['id', 'name', 'slug', 'image', 'subcategories']
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
     """Сериализатор для продуктов"""
     category = serializers.CharField(source='subcategory.category.name', read_only=True)
     subcategory = serializers.CharField(source='subcategory.name', read_only=True)
@@ -34,10 +58,10 @@ class ProductSerializer(serializers.ModelSerializer):
         ]
     
     def get_images(self, obj):
-        """Возвращает словарь со всеми изображениями товара"""
-        return obj.images_list
+        """Возвращает словарь изображений товара (размеры из ?images=, по умолчанию все)"""
+        return obj.images_for(self.context.get('images'))
 
-class CartItemSerializer(serializers.ModelSerializer):
+class CartItemSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Сериализатор для товара в корзине"""
     product_name = serializers.CharField(source='product.name', read_only=True)
     product_price = serializers.DecimalField(source='product.price', read_only=True, max_digits=10, decimal_places=2)
@@ -54,10 +78,10 @@ class CartItemSerializer(serializers.ModelSerializer):
         return obj.product.price * obj.quantity
     
     def get_product_images(self, obj):
-        """Изображения товара"""
-        return obj.product.images_list
+        """Изображения товара (размеры из ?images=, по умолчанию все)"""
+        return obj.product.images_for(self.context.get('images'))
 
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор для корзины"""
     items = CartItemSerializer(many=True, read_only=True)
     total_price = serializers.SerializerMethodField()
@@ -77,6 +101,22 @@ class CartSerializer(serializers.ModelSerializer):
         """Общее количество товаров в корзине"""
         return sum(item.quantity for item in obj.items.all())
 
+class OrderItemSerializer(serializers.ModelSerializer):
+    """Сериализатор для позиции заказа"""
+    total_price = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+    
+    class Meta:
+        model = OrderItem
+        fields = ['id', 'product', 'product_name', 'price', 'quantity', 'total_price']
+
+class OrderSerializer(serializers.ModelSerializer):
+    """Сериализатор для заказа"""
+    items = OrderItemSerializer(many=True, read_only=True)
+    
+    class Meta:
+        model = Order
+        fields = ['id', 'items', 'total_price', 'total_items', 'created_at']
+
 class AddToCartSerializer(serializers.Serializer):
     """Сериализатор для добавления товара в корзину"""
     product_id = serializers.IntegerField(
@@ -92,4 +132,21 @@ class AddToCartSerializer(serializers.Serializer):
 
 class UpdateCartItemSerializer(serializers.Serializer):
     """Сериализатор для изменения количества товара"""
-    quantity = serializers.IntegerField(min_value=0)
\ No newline at end of file
+    quantity = serializers.IntegerField(min_value=0)
+
+
+class PriceUpdateItemSerializer(serializers.Serializer):
+    """Новая цена товара, найденного по id или slug"""
+    id = serializers.IntegerField(required=False, help_text="ID товара")
+    slug = serializers.SlugField(required=False, help_text="Slug товара")
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+    
+    def validate(self, attrs):
+        if ('id' in attrs) == ('slug' in attrs):
+            raise serializers.ValidationError("Укажите либо id, либо slug")
+        return attrs
+
+
+class BulkPriceUpdateSerializer(serializers.Serializer):
+    """Сериализатор для пакетного обновления цен"""
+    prices = PriceUpdateItemSerializer(many=True, allow_empty=False)
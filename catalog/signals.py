@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Цены товаров изменены пакетно (QuerySet.update, сигналы save не отправляются).
+# Аргументы: product_ids — список id товаров с новой ценой.
+prices_changed = Signal()
@@ -0,0 +1,32 @@
+import json
+import os
+import time
+
+from django.test.runner import DiscoverRunner
+from django.utils import timezone
+
+
+class TimedTestRunner(DiscoverRunner):
+    """
+    DiscoverRunner, который печатает общее время прогона.
+    
+    Если задан TEST_TIMINGS_FILE, дописывает в него строку JSON с числом
+    тестов, процессов и временем, чтобы следить за ростом времени прогона.
+    """
+    
+    def run_suite(self, suite, **kwargs):
+        started = time.perf_counter()
+        result = super().run_suite(suite, **kwargs)
+        seconds = round(time.perf_counter() - started, 2)
+        self.log(f"Время тестов: {seconds} с, тестов: {result.testsRun}, процессов: {self.parallel or 1}")
+        path = os.environ.get('TEST_TIMINGS_FILE')
+        if path:
+            with open(path, 'a') as f:
+                f.write(json.dumps({
+                    'finished': timezone.now().isoformat(),
+                    'tests': result.testsRun,
+                    'failures': len(result.failures) + len(result.errors),
+                    'parallel': self.parallel or 1,
+                    'seconds': seconds,
+                }) + '\n')
+        return result
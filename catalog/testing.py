@@ -0,0 +1,121 @@
+"""
+Общие заготовки для тестов.
+
+Данные, которые тесты только читают, создаются один раз на класс в
+setUpTestData: транзакция класса откатывает их после его тестов. Фабрики
+ниже создают типовые объекты; массовые — одним bulk_create.
+"""
+import copy
+import glob
+import os
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from .bulk_load import insert_batches, iter_batches
+from .models import Cart, CartItem, Category, Product, SubCategory
+
+CATALOG_FIXTURES = tuple(sorted(glob.glob(os.path.join(settings.BASE_DIR, 'catalog', 'fixtures', '*.json'))))
+TEST_PASSWORD = 'testpass123'
+
+
+def create_user(username='testuser', password=TEST_PASSWORD, **fields):
+    return User.objects.create_user(username=username, password=password, **fields)
+
+
+def create_users(count, prefix='buyer'):
+    """count пользователей без пароля одним запросом"""
+    return User.objects.bulk_create(User(username=f'{prefix}-{i}') for i in range(count))
+
+
+def create_category(name="Тестовая категория", slug="test-category",
+                    subcategory="Тестовая подкатегория", subcategory_slug="test-subcategory"):
+    """(категория, подкатегория)"""
+    category = Category.objects.create(name=name, slug=slug)
+    return category, SubCategory.objects.create(name=subcategory, slug=subcategory_slug, category=category)
+
+
+def create_product(subcategory, name="Тестовый продукт", slug="test-product", price=100, **fields):
+    return Product.objects.create(name=name, slug=slug, price=price, subcategory=subcategory, **fields)
+
+
+def create_products(subcategory, count, name="Товар", slug="product", price=100, **fields):
+    """count товаров «{name} {i}» одним bulk_create: без save(), история цен не пишется"""
+    return Product.objects.bulk_create(
+        Product(name=f"{name} {i}", slug=f"{slug}-{i}", price=price, subcategory=subcategory, **fields)
+        for i in range(count)
+    )
+
+
+def create_carts(users, product, quantity=1):
+    """По корзине с одной позицией на пользователя; возвращает позиции"""
+    carts = Cart.objects.bulk_create(Cart(user=user) for user in users)
+    return CartItem.objects.bulk_create(
+        CartItem(cart=cart, product=product, quantity=quantity) for cart in carts
+    )
+
+
+class CleanCacheTestCase(TestCase):
+    """
+    TestCase с APIClient и пустым кэшем в каждом тесте.
+    
+    Инвалидация кэша выполняется после коммита, которого в TestCase нет, а
+    id объектов повторяются между тестами и классами — без очистки тест мог
+    бы получить чужие данные (особенно при --parallel, где порядок классов другой).
+    """
+    client_class = APIClient
+    
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+
+class CatalogTestCase(CleanCacheTestCase):
+    """
+    Категория, подкатегория и товар (и пользователь testuser при with_user),
+    созданные один раз на класс. authenticate входит пользователем в клиент.
+    """
+    with_user = False
+    authenticate = False
+    
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.category, cls.subcategory = create_category()
+        cls.product = create_product(cls.subcategory)
+        if cls.with_user or cls.authenticate:
+            cls.user = create_user()
+    
+    def setUp(self):
+        super().setUp()
+        if self.authenticate:
+            self.client.force_authenticate(self.user)
+
+
+@lru_cache(maxsize=None)
+def fixture_batches(paths):
+    """Разобранные фикстуры [(модель, [объекты])] — шаблон, общий для всех тестов"""
+    return list(iter_batches(paths))
+
+
+class CatalogFixturesTestCase(CleanCacheTestCase):
+    """
+    TestCase с данными из catalog/fixtures, без повторного разбора JSON.
+    
+    Фикстуры разбираются один раз на процесс и вставляются пачками.
+    """
+    catalog_fixtures = CATALOG_FIXTURES
+    
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Копии: bulk_create меняет состояние объектов, а шаблон переиспользуется
+        insert_batches(
+            (model, [copy.copy(obj) for obj in objects])
+            for model, objects in fixture_batches(tuple(cls.catalog_fixtures))
+        )
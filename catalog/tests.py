@@ -1,24 +1,63 @@
-from django.test import TestCase
+import asyncio
+import functools
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
+from asgiref.sync import sync_to_async
+from PIL import Image
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection
+from django.db.models import OuterRef
+from django.conf import settings
+from django.http import HttpResponse
+from django.test.utils import CaptureQueriesContext
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
 from django.contrib.auth.models import User
+from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient
 from rest_framework import status
-from .models import Category, SubCategory, Product, Cart, CartItem
+from .models import (
+    Category, SubCategory, Product, Cart, CartItem, PriceHistory, RequestProfile,
+    Stock, StockReservation, Order, IdempotencyKey, CatalogChange, RecommendationState, RelatedProduct,
+)
+from .admin import EstimatedCountPaginator
+from .bulk_load import iter_json_array, load_fixtures
+from .events import get_broker
+from .images import DerivativeCache
+from .instrumentation import RequestStats
+from .inventory import InsufficientStock, reserve
+from .orders import checkout
+from .metrics import REQUEST_LATENCY, REQUESTS_SHED, THROTTLE_DECISIONS
+from .middleware import ConcurrencyLimitMiddleware
+from .pricing import bulk_update_prices, parse_price_rows
+from .profiling import ProfilingMiddleware, make_token
+from .querylog import NPlusOneQueryError, QueryInspector, inspect_queries
+from .recommendations import build_related
+from .product_cache import warm_caches
+from .schema import generate_schema, load_schema, render_schema
+from .signals import prices_changed
+from .testing import (
+    CATALOG_FIXTURES, CatalogFixturesTestCase, CatalogTestCase, CleanCacheTestCase,
+    create_carts, create_category, create_product, create_products, create_user, create_users,
+)
+from .views import cart_event_stream
 
-class CategoryAPITestCase(TestCase):
+class CategoryAPITestCase(CatalogTestCase):
     """Тесты для API категорий"""
     
-    def setUp(self):
-        self.client = APIClient()
-        self.category = Category.objects.create(
-            name="Тестовая категория",
-            slug="test-category"
-        )
-        self.subcategory = SubCategory.objects.create(
-            name="Тестовая подкатегория",
-            slug="test-subcategory",
-            category=self.category
-        )
-    
     def test_get_categories(self):
         """Тест GET запроса к /api/categories/"""
         response = self.client.get('/api/categories/')
@@ -28,27 +67,9 @@ class CategoryAPITestCase(TestCase):
         self.assertEqual(len(response.data['results'][0]['subcategories']), 1)
 
 
-class ProductAPITestCase(TestCase):
+class ProductAPITestCase(CatalogTestCase):
     """Тесты для API продуктов"""
     
-    def setUp(self):
-        self.client = APIClient()
-        self.category = Category.objects.create(
-            name="Тестовая категория",
-            slug="test-category"
-        )
-        self.subcategory = SubCategory.objects.create(
-            name="Тестовая подкатегория",
-            slug="test-subcategory",
-            category=self.category
-        )
-        self.product = Product.objects.create(
-            name="Тестовый продукт",
-            slug="test-product",
-            price=100.00,
-            subcategory=self.subcategory
-        )
-    
     def test_get_products(self):
         """Тест GET запроса к /api/products/"""
         response = self.client.get('/api/products/')
@@ -59,13 +80,7 @@ class ProductAPITestCase(TestCase):
     
     def test_get_products_pagination(self):
         """Тест пагинации продуктов"""        
-        for i in range(15):
-            Product.objects.create(
-                name=f"Тестовый продукт {i}",
-                slug=f"test-product-{i}",
-                price=100.00 + i,
-                subcategory=self.subcategory
-            )
+        create_products(self.subcategory, 15)
         
         response = self.client.get('/api/products/')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -73,30 +88,9 @@ class ProductAPITestCase(TestCase):
         self.assertIsNotNone(response.data['next'])
 
 
-class CartAPITestCase(TestCase):
+class CartAPITestCase(CatalogTestCase):
     """Тесты для API корзины"""
-    
-    def setUp(self):
-        self.client = APIClient()
-        self.user = User.objects.create_user(
-            username='testuser',
-            password='testpass123'
-        )
-        self.category = Category.objects.create(
-            name="Тестовая категория",
-            slug="test-category"
-        )
-        self.subcategory = SubCategory.objects.create(
-            name="Тестовая подкатегория",
-            slug="test-subcategory",
-            category=self.category
-        )
-        self.product = Product.objects.create(
-            name="Тестовый продукт",
-            slug="test-product",
-            price=100.00,
-            subcategory=self.subcategory
-        )
+    with_user = True
     
     def test_login_post(self):
         """Тест POST запроса к /api/login/ (получение токена)"""
@@ -193,4 +187,1249 @@ class CartAPITestCase(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)        
         
         cart_response = self.client.get('/api/cart/')
-        self.assertEqual(cart_response.data['total_items'], 0)
\ No newline at end of file
+        self.assertEqual(cart_response.data['total_items'], 0)
+
+class ResizedImageTestCase(TestCase):
+    """Тесты ресайза изображений по запросу"""
+    
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.media_root,
+            IMAGE_RESIZE_CACHE_DIR=os.path.join(self.media_root, 'resized'),
+        )
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        
+        os.makedirs(os.path.join(self.media_root, 'products', 'apple'))
+        Image.new('RGB', (1000, 500), 'red').save(
+            os.path.join(self.media_root, 'products', 'apple', 'apple_original.jpg')
+        )
+    
+    def test_resize_whitelisted_size(self):
+        """Разрешенный размер отдается с сохранением пропорций"""
+        response = self.client.get('/media/resize/400x400/products/apple/apple_original.jpg')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        img = Image.open(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(img.size, (400, 200))
+    
+    def test_resize_rejects_unknown_size_and_format(self):
+        """Неразрешенные размеры и форматы, а также выход из MEDIA_ROOT дают 404"""
+        url = '/media/resize/{}/products/apple/apple_original.jpg'
+        self.assertEqual(self.client.get(url.format('123x45')).status_code, 404)
+        self.assertEqual(self.client.get(url.format('400x400') + '?format=gif').status_code, 404)
+        self.assertEqual(self.client.get('/media/resize/400x400/../settings.py').status_code, 404)
+    
+    def test_cache_evicts_least_recently_used(self):
+        """Кэш вытесняет давно не использованные файлы при превышении лимита"""
+        cache = DerivativeCache(os.path.join(self.media_root, 'cache'), max_bytes=25)
+        cache.get_or_create('aa', lambda: b'x' * 10)
+        cache.get_or_create('bb', lambda: b'x' * 10)
+        cache.get_or_create('aa', lambda: b'unused')
+        cache.get_or_create('cc', lambda: b'x' * 10)
+        
+        self.assertTrue(os.path.exists(cache.path_for('aa')))
+        self.assertFalse(os.path.exists(cache.path_for('bb')))
+        self.assertEqual(cache.total_bytes, 20)
+    
+    def test_file_removed_by_other_process_is_rendered_again(self):
+        """Файл, вытесненный другим воркером после попадания в индекс, создается заново"""
+        cache = DerivativeCache(os.path.join(self.media_root, 'cache'), max_bytes=1024)
+        cache.get_or_create('key', lambda: b'data')
+        os.remove(cache.path_for('key'))
+        
+        with cache.open_or_create('key', lambda: b'again') as f:
+            self.assertEqual(f.read(), b'again')
+        self.assertEqual(cache.total_bytes, 5)
+    
+    def test_cache_coalesces_concurrent_requests(self):
+        """Параллельные запросы одного ключа запускают генерацию один раз"""
+        cache = DerivativeCache(os.path.join(self.media_root, 'cache'), max_bytes=1024)
+        calls = []
+        started = threading.Event()
+        
+        def render():
+            calls.append(1)
+            started.set()
+            time.sleep(0.1)
+            return b'data'
+        
+        threads = [threading.Thread(target=cache.get_or_create, args=('key', render)) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(len(calls), 1)
+        with open(cache.path_for('key'), 'rb') as f:
+            self.assertEqual(f.read(), b'data')
+
+
+class RebuildProductImagesTestCase(TestCase):
+    """Тесты команды rebuild_product_images"""
+    
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        
+        category = Category.objects.create(name="Тестовая категория", slug="test-category")
+        subcategory = SubCategory.objects.create(
+            name="Тестовая подкатегория", slug="test-subcategory", category=category
+        )
+        os.makedirs(os.path.join(self.media_root, 'products', 'apple'))
+        Image.new('RGB', (1000, 1000), 'green').save(
+            os.path.join(self.media_root, 'products', 'apple', 'apple_original.jpg')
+        )
+        self.product = Product.objects.create(
+            name="Яблоко", slug="apple", price=10, subcategory=subcategory
+        )
+        Product.objects.filter(pk=self.product.pk).update(
+            image_original='products/apple/apple_original.jpg'
+        )
+    
+    def test_rebuild_creates_derivatives_and_is_idempotent(self):
+        """Команда создает файлы, обновляет поля и пропускает актуальные изображения"""
+        out = io.StringIO()
+        with self.assertLogs('catalog.images', level='INFO') as logs:
+            call_command('rebuild_product_images', workers=1, stdout=out)
+        self.assertIn('пересоздано: 1', out.getvalue())
+        self.assertEqual(logs.records[-1].event, 'product_images_done')
+        
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.image_small.name, 'products/apple/apple_small.jpg')
+        self.assertEqual(Image.open(self.product.image_medium.path).size, (400, 400))
+        
+        out = io.StringIO()
+        with self.assertLogs('catalog.images', level='INFO'):
+            call_command('rebuild_product_images', workers=1, stdout=out)
+        self.assertIn('пропущено: 1', out.getvalue())
+    
+    def test_rebuild_resumes_after_files_written(self):
+        """Файлы созданы, а поля не записаны (прерванный запуск): следующий запуск их записывает"""
+        with self.assertLogs('catalog.images', level='INFO'):
+            call_command('rebuild_product_images', workers=1, stdout=io.StringIO())
+        Product.objects.filter(pk=self.product.pk).update(image_small='', image_medium='', image_large='')
+        
+        out = io.StringIO()
+        with self.assertLogs('catalog.images', level='INFO'):
+            call_command('rebuild_product_images', workers=1, stdout=out)
+        self.assertIn('пропущено: 0', out.getvalue())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.image_large.name, 'products/apple/apple_large.jpg')
+    
+    def test_rebuild_with_spawned_workers(self):
+        """Пул процессов работает и при запуске через spawn (Windows, macOS)"""
+        # Проверяется во время запуска: воркеры --parallel форкаются уже после импорта модуля
+        if multiprocessing.current_process().daemon:
+            self.skipTest("в воркере параллельных тестов нельзя запускать процессы")
+        spawn_pool = functools.partial(ProcessPoolExecutor, mp_context=multiprocessing.get_context('spawn'))
+        out = io.StringIO()
+        with mock.patch('catalog.management.commands.rebuild_product_images.ProcessPoolExecutor', spawn_pool), \
+                self.assertLogs('catalog.images', level='INFO'):
+            call_command('rebuild_product_images', workers=2, stdout=out)
+        self.assertIn('пересоздано: 1', out.getvalue())
+    
+    def test_rebuild_invalidates_product_cache(self):
+        """Карточка товара из кэша получает новые пути изображений"""
+        cache.clear()
+        self.assertNotIn('small', self.client.get('/api/products/apple/').data['images'])
+        with self.assertLogs('catalog.images', level='INFO'), self.captureOnCommitCallbacks(execute=True):
+            call_command('rebuild_product_images', workers=1, stdout=io.StringIO())
+        self.assertTrue(self.client.get('/api/products/apple/').data['images']['small'].endswith('apple_small.jpg'))
+
+
+class PerformanceMiddlewareTestCase(CatalogTestCase):
+    """Тесты инструментирования запросов"""
+    
+    def test_server_timing_header(self):
+        """Ответ содержит Server-Timing с числом запросов и временем сериализации"""
+        response = self.client.get('/api/products/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'total;dur=[\d.]+')
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="[1-9]\d* queries"')
+        self.assertRegex(timing, r'serialize;dur=[\d.]+')
+    
+    def test_metrics_endpoint(self):
+        """Гистограммы попадают в /metrics в формате Prometheus"""
+        before = REQUEST_LATENCY.count('product-list', 'GET', 200)
+        self.client.get('/api/products/')
+        self.assertEqual(REQUEST_LATENCY.count('product-list', 'GET', 200), before + 1)
+        
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = response.content.decode()
+        self.assertIn('# TYPE http_request_duration_seconds histogram', body)
+        self.assertIn('http_request_db_queries_count{view="product-list"}', body)
+
+
+class ProfilingMiddlewareTestCase(TestCase):
+    """Тесты профилирования отдельных запросов"""
+    
+    def setUp(self):
+        self.profiles_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.profiles_dir, ignore_errors=True)
+        self.settings_override = override_settings(PROFILING_DIR=self.profiles_dir, PROFILING_MAX_PROFILES=2)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+    
+    def test_signed_header_enables_profiling(self):
+        """Запрос с подписанным X-Profile профилируется и сохраняет файлы"""
+        response = self.client.get('/api/categories/', HTTP_X_PROFILE=make_token())
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        profile = RequestProfile.objects.get(pk=response['X-Profile-Id'])
+        self.assertEqual(profile.view_name, 'category-list')
+        self.assertTrue(os.path.exists(profile.file_path('prof')))
+        self.assertTrue(os.path.exists(profile.file_path('folded')))
+    
+    def test_invalid_header_is_ignored(self):
+        """Неподписанный заголовок не включает профилирование"""
+        response = self.client.get('/api/categories/', HTTP_X_PROFILE='1')
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertFalse(RequestProfile.objects.exists())
+    
+    def test_retention_keeps_latest_profiles(self):
+        """Старые профили сверх PROFILING_MAX_PROFILES удаляются вместе с файлами"""
+        token = make_token()
+        for _ in range(3):
+            self.client.get('/api/categories/', HTTP_X_PROFILE=token)
+        
+        self.assertEqual(RequestProfile.objects.count(), 2)
+        self.assertEqual(len(os.listdir(self.profiles_dir)), 4)
+    
+    def test_concurrent_request_is_not_profiled(self):
+        """Пока профилируется другой запрос, следующий выполняется без профиля"""
+        with ProfilingMiddleware.lock:
+            response = self.client.get('/api/categories/', HTTP_X_PROFILE=make_token())
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertFalse(RequestProfile.objects.exists())
+        
+        response = self.client.get('/api/categories/', HTTP_X_PROFILE=make_token())
+        self.assertIn('X-Profile-Id', response)
+
+
+class QueryInspectorTestCase(TestCase):
+    """Тесты журнала медленных запросов и поиска N+1"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.category, cls.subcategory = create_category()
+        create_products(cls.subcategory, 10, name="Тестовый продукт", slug="test-product")
+    
+    def test_product_list_has_no_n_plus_one(self):
+        """Список товаров не выполняет запрос на каждый товар"""
+        with inspect_queries(n_plus_one_threshold=3, raise_errors=True):
+            response = self.client.get('/api/products/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+    
+    def test_repeated_query_raises(self):
+        """Повтор одного SQL сверх порога приводит к NPlusOneQueryError"""
+        with self.assertLogs('catalog.db', level='WARNING'):
+            with self.assertRaises(NPlusOneQueryError):
+                with inspect_queries(n_plus_one_threshold=3, raise_errors=True):
+                    for product in Product.objects.all():
+                        product.subcategory.category.name
+    
+    def test_slow_query_captures_plan_and_call_site(self):
+        """Медленный запрос логируется с планом выполнения и местом вызова"""
+        with self.assertLogs('catalog.db', level='WARNING'):
+            with inspect_queries(slow_threshold_ms=0) as inspector:
+                list(Product.objects.filter(slug='test-product-1'))
+        
+        entry = inspector.slow_queries[0]
+        self.assertTrue(entry['plan'])
+        self.assertTrue(any('tests.py' in frame for frame in entry['stack']))
+    
+    def test_explain_not_counted_in_request_stats(self):
+        """EXPLAIN медленных запросов не меняет число запросов в Server-Timing"""
+        def queries(response):
+            return response['Server-Timing'].split('desc=')[1].split(',')[0]
+        
+        expected = queries(self.client.get('/api/products/'))
+        with override_settings(SLOW_QUERY_THRESHOLD_MS=0), self.assertLogs('catalog.db', level='WARNING') as logs:
+            response = self.client.get('/api/products/')
+        self.assertTrue(any(record.plan for record in logs.records))
+        self.assertEqual(queries(response), expected)
+    
+    def test_explain_not_counted_in_query_time(self):
+        """Время EXPLAIN не попадает в длительность медленного запроса у внешних оберток"""
+        def slow_explain(*args):
+            time.sleep(0.2)
+            return ['plan']
+        
+        stats = RequestStats()
+        with mock.patch.object(QueryInspector, '_explain', side_effect=slow_explain), \
+                self.assertLogs('catalog.db', level='WARNING'):
+            with connection.execute_wrapper(stats), inspect_queries(slow_threshold_ms=0) as inspector:
+                list(Product.objects.filter(slug='test-product-1'))
+        self.assertEqual(inspector.slow_queries[0]['plan'], ['plan'])
+        self.assertLess(stats.db_time, 0.2)
+    
+    def test_subcategory_slug_deduplication(self):
+        """Повторяющиеся имена подкатегорий получают уникальные slug"""
+        first = SubCategory.objects.create(name="Fresh Fruits", category=self.category)
+        second = SubCategory.objects.create(name="Fresh Fruits", category=self.category)
+        self.assertNotEqual(first.slug, second.slug)
+        self.assertEqual(second.slug, "fresh-fruits-1")
+
+
+class ProductAdminTestCase(TestCase):
+    """Тесты списка товаров в админке"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin123')
+        category, subcategory = create_category()
+        products = create_products(subcategory, 20, price=10)
+        for i, product in enumerate(products):
+            product.image_small = f"products/p{i}/p{i}_small.jpg"
+        Product.objects.bulk_update(products, ['image_small'])
+        create_product(subcategory, name="Яблоки", slug="apples", price=10)
+    
+    def setUp(self):
+        self.client.force_login(self.admin)
+    
+    def test_changelist_without_n_plus_one(self):
+        """Список товаров не делает запрос на каждую строку и показывает миниатюры"""
+        with inspect_queries(n_plus_one_threshold=3, raise_errors=True):
+            response = self.client.get('/admin/catalog/product/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertContains(response, 'p1_small.jpg')
+    
+    def test_search_by_slug_and_name_prefix(self):
+        """Поиск находит товар по точному slug и по началу названия"""
+        response = self.client.get('/admin/catalog/product/', {'q': 'apples'})
+        self.assertEqual(list(response.context['cl'].result_list), [Product.objects.get(slug='apples')])
+        response = self.client.get('/admin/catalog/product/', {'q': 'ябл'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+    
+    def test_paginator_uses_estimate_for_large_tables(self):
+        """Для больших таблиц без фильтров используется оценка числа строк"""
+        with mock.patch.object(EstimatedCountPaginator, 'exact_count_limit', 1):
+            paginator = EstimatedCountPaginator(Product.objects.order_by('pk'), 10)
+            with self.assertNumQueries(1):
+                self.assertGreaterEqual(paginator.count, 21)
+
+
+class BulkPriceUpdateTestCase(TestCase):
+    """Тесты пакетного обновления цен"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin123')
+        category, subcategory = create_category()
+        cls.products = [
+            create_product(subcategory, name=f"Товар {i}", slug=f"product-{i}", price=10)
+            for i in range(3)
+        ]
+    
+    def setUp(self):
+        self.client = APIClient()
+    
+    def test_bulk_update_by_id_and_slug(self):
+        """Цены обновляются по id и slug, в ответе — число измененных строк"""
+        self.client.force_authenticate(self.admin)
+        received = []
+        prices_changed.connect(lambda sender, product_ids, **kwargs: received.append(product_ids),
+                               weak=False, dispatch_uid='test-prices-changed')
+        self.addCleanup(prices_changed.disconnect, dispatch_uid='test-prices-changed')
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/products/prices/', {'prices': [
+                {'id': self.products[0].id, 'price': '15.50'},
+                {'slug': 'product-1', 'price': '10.00'},
+                {'slug': 'missing', 'price': '1.00'},
+            ]}, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual(response.data['unchanged'], 1)
+        self.assertEqual(response.data['not_found'], ['missing'])
+        self.products[0].refresh_from_db()
+        self.assertEqual(str(self.products[0].price), '15.50')
+        self.assertEqual(received, [[self.products[0].id]])
+    
+    def test_negative_price_rejected(self):
+        """Отрицательная цена отклоняется, цены не меняются"""
+        self.client.force_authenticate(self.admin)
+        response = self.client.post('/api/products/prices/', {'prices': [
+            {'id': self.products[0].id, 'price': '5.00'},
+            {'id': self.products[1].id, 'price': '-1.00'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].price, 10)
+    
+    def test_requires_admin(self):
+        """Обычный пользователь не может менять цены"""
+        self.client.force_authenticate(create_user())
+        response = self.client.post('/api/products/prices/', {'prices': [
+            {'id': self.products[0].id, 'price': '5.00'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+    
+    def test_admin_bulk_prices_form(self):
+        """Форма в админке принимает строки «slug;цена»"""
+        self.client.force_login(self.admin)
+        response = self.client.post('/admin/catalog/product/bulk-prices/', {
+            'rows': f"product-2;99.90\n{self.products[0].id};12",
+        })
+        self.assertRedirects(response, '/admin/catalog/product/')
+        self.products[2].refresh_from_db()
+        self.assertEqual(str(self.products[2].price), '99.90')
+    
+    def test_admin_bulk_prices_form_rejects_nan(self):
+        """NaN и бесконечность — ошибка формы, а не 500"""
+        self.client.force_login(self.admin)
+        for value in ('NaN', 'sNaN', 'Infinity'):
+            response = self.client.post('/admin/catalog/product/bulk-prices/', {'rows': f"product-2;{value}"})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertContains(response, 'Некорректная цена')
+        self.products[2].refresh_from_db()
+        self.assertEqual(self.products[2].price, 10)
+    
+    def test_parse_price_rows_superscript_key(self):
+        """«²» — не id, а slug (int() на нем падал бы ValueError)"""
+        self.assertEqual(parse_price_rows("²;10\n12;5"),
+                         [{'slug': '²', 'price': '10'}, {'id': 12, 'price': '5'}])
+
+
+class PriceHistoryTestCase(CatalogTestCase):
+    """Тесты истории цен"""
+    
+    def test_price_change_appends_history(self):
+        """Изменение цены добавляет запись, сохранение без изменения — нет"""
+        product = Product.objects.get(pk=self.product.pk)
+        product.save()
+        product.price = Decimal('120.00')
+        product.save()
+        self.assertEqual(
+            list(self.product.price_history.order_by('valid_from').values_list('price', flat=True)),
+            [Decimal('100.00'), Decimal('120.00')],
+        )
+    
+    def test_prices_at_point_in_time(self):
+        """Цены набора товаров на момент времени берутся одним запросом"""
+        other = Product.objects.create(name="Другой продукт", slug="other", price=50, subcategory=self.subcategory)
+        before_change = timezone.now()
+        bulk_update_prices([{'id': self.product.id, 'price': '130.00'}, {'id': other.id, 'price': '55.00'}])
+        
+        with self.assertNumQueries(1):
+            old_prices = PriceHistory.objects.prices_at([self.product.id, other.id], before_change)
+        self.assertEqual(old_prices, {self.product.id: Decimal('100.00'), other.id: Decimal('50.00')})
+        new_prices = PriceHistory.objects.prices_at([self.product.id, other.id], timezone.now())
+        self.assertEqual(new_prices, {self.product.id: Decimal('130.00'), other.id: Decimal('55.00')})
+    
+    def test_cart_items_priced_at_add_time(self):
+        """Позиции корзины можно переоценить по цене на момент добавления"""
+        cart = Cart.objects.create(user=create_user())
+        CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+        bulk_update_prices([{'id': self.product.id, 'price': '150.00'}])
+        
+        item = cart.items.annotate(
+            added_price=PriceHistory.objects.price_at(OuterRef('created_at'), product=OuterRef('product'))
+        ).get()
+        self.assertEqual(item.added_price, Decimal('100.00'))
+    
+    def test_backfill_command(self):
+        """Команда создает начальные записи для товаров без истории"""
+        PriceHistory.objects.all().delete()
+        call_command('backfill_price_history', stdout=io.StringIO())
+        call_command('backfill_price_history', stdout=io.StringIO())
+        self.assertEqual(self.product.price_history.count(), 1)
+
+
+class StockReservationTestCase(CatalogTestCase):
+    """Тесты резервирования остатков в корзине"""
+    authenticate = True
+    
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Stock.objects.create(product=cls.product, available=5)
+    
+    def available(self):
+        return Stock.objects.get(product=self.product).available
+    
+    def test_add_reserves_and_rejects_oversell(self):
+        """Добавление резервирует остаток, при нехватке — 409 без изменений"""
+        response = self.client.post('/api/cart/add/', {'product_id': self.product.id, 'quantity': 3})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.available(), 2)
+        
+        response = self.client.post('/api/cart/add/', {'product_id': self.product.id, 'quantity': 3})
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['available'], 2)
+        self.assertEqual(CartItem.objects.get().quantity, 3)
+        self.assertEqual(self.available(), 2)
+    
+    def test_rejected_first_add_leaves_no_cart(self):
+        """Отказ в резерве откатывает и создание корзины"""
+        self.assertFalse(Cart.objects.filter(user=self.user).exists())
+        response = self.client.post('/api/cart/add/', {'product_id': self.product.id, 'quantity': 6})
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(Cart.objects.filter(user=self.user).exists())
+    
+    def test_update_and_remove_return_stock(self):
+        """Уменьшение количества и удаление возвращают остаток"""
+        self.client.post('/api/cart/add/', {'product_id': self.product.id, 'quantity': 4})
+        item_id = CartItem.objects.get().id
+        
+        self.client.put(f'/api/cart/item/{item_id}/', {'quantity': 1})
+        self.assertEqual(self.available(), 4)
+        self.client.delete(f'/api/cart/item/{item_id}/remove/')
+        self.assertEqual(self.available(), 5)
+        self.assertFalse(StockReservation.objects.exists())
+    
+    def test_expired_reservations_are_released(self):
+        """Команда очистки возвращает просроченные резервы"""
+        self.client.post('/api/cart/add/', {'product_id': self.product.id, 'quantity': 2})
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        
+        call_command('release_expired_reservations', stdout=io.StringIO())
+        self.assertEqual(self.available(), 5)
+        self.assertFalse(StockReservation.objects.exists())
+
+
+class StockContentionTestCase(TransactionTestCase):
+    """Стресс-тест: много покупателей одновременно берут один товар"""
+    
+    def test_concurrent_buyers_never_oversell(self):
+        """Параллельные резервы не уводят остаток в минус и не теряют единицы"""
+        category, subcategory = create_category()
+        product = create_product(subcategory, name="Хит продаж", slug="hot", price=10)
+        Stock.objects.create(product=product, available=10)
+        items = create_carts(create_users(30), product)
+        
+        outcomes = []
+        barrier = threading.Barrier(len(items))
+        
+        def buy(item):
+            barrier.wait()
+            try:
+                while True:
+                    try:
+                        reserve(item, 1)
+                        outcomes.append('ok')
+                        return
+                    except InsufficientStock:
+                        outcomes.append('sold-out')
+                        return
+                    except OperationalError:
+                        # SQLite в памяти отвечает «table is locked» вместо ожидания
+                        time.sleep(0.001)
+            finally:
+                connection.close()
+        
+        threads = [threading.Thread(target=buy, args=(item,)) for item in items]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(outcomes.count('ok'), 10)
+        self.assertEqual(outcomes.count('sold-out'), 20)
+        self.assertEqual(Stock.objects.get(product=product).available, 0)
+        self.assertEqual(StockReservation.objects.count(), 10)
+
+
+class CheckoutTestCase(CatalogTestCase):
+    """Тесты оформления заказа"""
+    authenticate = True
+    
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Stock.objects.create(product=cls.product, available=5)
+    
+    def setUp(self):
+        super().setUp()
+        self.client.post('/api/cart/add/', {'product_id': self.product.id, 'quantity': 2})
+    
+    def test_checkout_snapshots_cart_and_clears_it(self):
+        """Заказ хранит название и цену на момент оформления, корзина очищается"""
+        response = self.client.post('/api/cart/checkout/')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['total_items'], 2)
+        self.assertEqual(response.data['items'][0]['product_name'], "Тестовый продукт")
+        
+        bulk_update_prices([{'id': self.product.id, 'price': '1.00'}])
+        order = Order.objects.get()
+        self.assertEqual(order.items.get().price, Decimal('100.00'))
+        self.assertFalse(CartItem.objects.exists())
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual(Stock.objects.get(product=self.product).available, 3)
+    
+    def test_idempotency_key_prevents_duplicate_orders(self):
+        """Повтор с тем же Idempotency-Key возвращает тот же заказ"""
+        first = self.client.post('/api/cart/checkout/', HTTP_IDEMPOTENCY_KEY='order-1')
+        second = self.client.post('/api/cart/checkout/', HTTP_IDEMPOTENCY_KEY='order-1')
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(first.data['id'], second.data['id'])
+        self.assertEqual(Order.objects.count(), 1)
+    
+    def test_concurrent_retry_with_same_key(self):
+        """Повтор, ждавший блокировку корзины, пока первый запрос оформлял заказ, получает тот же заказ"""
+        select_for_update = Cart.objects.select_for_update
+        first = []
+        
+        def first_request_wins(*args, **kwargs):
+            # Первый запрос держал блокировку и закоммитил заказ, пока повтор ждал
+            if not first:
+                first.append(None)
+                first[0] = checkout(self.user, 'order-1')
+            return select_for_update(*args, **kwargs)
+        
+        with mock.patch.object(Cart.objects, 'select_for_update', side_effect=first_request_wins):
+            order, created = checkout(self.user, 'order-1')
+        
+        self.assertEqual(first[0], (order, True))
+        self.assertFalse(created)
+        self.assertEqual(Order.objects.count(), 1)
+    
+    def test_empty_cart(self):
+        """Пустую корзину оформить нельзя"""
+        self.client.delete('/api/cart/clear/')
+        response = self.client.post('/api/cart/checkout/')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CartIdempotencyTestCase(CatalogTestCase):
+    """Тесты заголовка Idempotency-Key на изменяющих корзину эндпоинтах"""
+    authenticate = True
+    
+    def test_retry_replays_stored_response(self):
+        """Повтор добавления не увеличивает количество и возвращает тот же ответ"""
+        data = {'product_id': self.product.id, 'quantity': 2}
+        first = self.client.post('/api/cart/add/', data, format='json', HTTP_IDEMPOTENCY_KEY='add-1')
+        second = self.client.post('/api/cart/add/', data, format='json', HTTP_IDEMPOTENCY_KEY='add-1')
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(CartItem.objects.get().quantity, 2)
+    
+    def test_key_reused_for_other_request(self):
+        """Тот же ключ с другим телом запроса отклоняется"""
+        self.client.post('/api/cart/add/', {'product_id': self.product.id, 'quantity': 1},
+                         format='json', HTTP_IDEMPOTENCY_KEY='add-1')
+        response = self.client.post('/api/cart/add/', {'product_id': self.product.id, 'quantity': 3},
+                                    format='json', HTTP_IDEMPOTENCY_KEY='add-1')
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(CartItem.objects.get().quantity, 1)
+    
+    def test_abandoned_claim_is_reclaimed(self):
+        """Ключ прерванного запроса дает 409, пока не истечет аренда, затем запрос выполняется"""
+        data = {'product_id': self.product.id, 'quantity': 2}
+        first = self.client.post('/api/cart/add/', data, format='json', HTTP_IDEMPOTENCY_KEY='add-1')
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        # Воркер убит после того, как занял ключ: ответа нет, транзакция обработчика откатилась
+        IdempotencyKey.objects.update(status_code=None, response_body=None, claimed_at=timezone.now())
+        CartItem.objects.all().delete()
+        
+        response = self.client.post('/api/cart/add/', data, format='json', HTTP_IDEMPOTENCY_KEY='add-1')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        
+        IdempotencyKey.objects.update(
+            claimed_at=timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_CLAIM_TTL + 1)
+        )
+        response = self.client.post('/api/cart/add/', data, format='json', HTTP_IDEMPOTENCY_KEY='add-1')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(CartItem.objects.get().quantity, 2)
+        self.assertEqual(IdempotencyKey.objects.get().status_code, status.HTTP_201_CREATED)
+    
+    def test_crash_before_storing_response_rolls_back_cart(self):
+        """Сбой между изменением корзины и записью ответа откатывает и то и другое: повтор не удваивает"""
+        data = {'product_id': self.product.id, 'quantity': 2}
+        with mock.patch('catalog.idempotency.JSONRenderer.render', side_effect=RuntimeError('worker killed')):
+            with self.assertRaises(RuntimeError):
+                self.client.post('/api/cart/add/', data, format='json', HTTP_IDEMPOTENCY_KEY='add-1')
+        self.assertFalse(CartItem.objects.exists())
+        self.assertFalse(IdempotencyKey.objects.exists())
+        
+        response = self.client.post('/api/cart/add/', data, format='json', HTTP_IDEMPOTENCY_KEY='add-1')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(CartItem.objects.get().quantity, 2)
+    
+    def test_claim_retried_when_conflicting_request_rolled_back(self):
+        """Ключ, занятый запросом, который затем откатился, занимается снова вместо 500"""
+        create = IdempotencyKey.objects.create
+        calls = []
+        
+        def conflict_once(**kwargs):
+            calls.append(1)
+            if len(calls) == 1:
+                raise IntegrityError('idempotency_user_key')
+            return create(**kwargs)
+        
+        with mock.patch.object(IdempotencyKey.objects, 'create', side_effect=conflict_once):
+            response = self.client.post('/api/cart/add/', {'product_id': self.product.id, 'quantity': 1},
+                                        format='json', HTTP_IDEMPOTENCY_KEY='add-1')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(calls), 2)
+    
+    def test_purge_removes_expired_keys(self):
+        """Команда очистки удаляет только просроченные ключи"""
+        self.client.post('/api/cart/add/', {'product_id': self.product.id, 'quantity': 1},
+                         format='json', HTTP_IDEMPOTENCY_KEY='fresh')
+        IdempotencyKey.objects.create(
+            user=self.user, key='old', fingerprint='x', status_code=200,
+            expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        call_command('purge_idempotency_keys', stdout=io.StringIO())
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['fresh'])
+
+
+class CartCleanupTestCase(CatalogTestCase):
+    """Тесты очистки пустых и брошенных корзин"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Stock.objects.create(product=cls.product, available=10)
+    
+    def make_cart(self, username, quantity=0, days_ago=0):
+        cart = Cart.objects.create(user=create_user(username))
+        if quantity:
+            item = CartItem.objects.create(cart=cart, product=self.product, quantity=quantity)
+            reserve(item, quantity)
+        stamp = timezone.now() - timedelta(days=days_ago)
+        Cart.objects.filter(pk=cart.pk).update(updated_at=stamp)
+        CartItem.objects.filter(cart=cart).update(updated_at=stamp)
+        return cart
+    
+    def test_view_does_not_create_cart(self):
+        """Просмотр корзины не создает пустую запись"""
+        self.client.force_authenticate(create_user('viewer'))
+        response = self.client.get('/api/cart/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['items'], [])
+        self.assertEqual(response.data['total_items'], 0)
+        self.assertFalse(Cart.objects.exists())
+    
+    def test_purge_removes_only_stale_carts(self):
+        """Удаляются старые корзины, их резервы возвращаются на остаток"""
+        self.make_cart('empty', days_ago=40)
+        self.make_cart('abandoned', quantity=3, days_ago=40)
+        active = self.make_cart('active', quantity=2, days_ago=1)
+        self.assertEqual(Stock.objects.get(product=self.product).available, 5)
+        
+        out = io.StringIO()
+        call_command('purge_carts', '--older-than', '30', '--batch-size', '1', stdout=out)
+        
+        self.assertEqual(list(Cart.objects.values_list('pk', flat=True)), [active.pk])
+        self.assertEqual(Stock.objects.get(product=self.product).available, 8)
+        self.assertIn('пустых 1, брошенных 1', out.getvalue())
+
+
+class CatalogChangesTestCase(CatalogTestCase):
+    """Тесты журнала изменений каталога"""
+    
+    def setUp(self):
+        super().setUp()
+        self.start = CatalogChange.objects.latest('seq').seq
+    
+    def changes(self, after):
+        response = self.client.get('/api/catalog/changes/', {'after': after})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+    
+    def test_upserts_and_tombstones(self):
+        """Изменение цены пакетом и удаление видны в журнале, повторы схлопываются"""
+        other = Product.objects.create(
+            name="Другой продукт", slug="other-product", price=50, subcategory=self.subcategory
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_update_prices([{'id': self.product.id, 'price': '120.00'}])
+        other_id = other.id
+        other.delete()
+        
+        data = self.changes(self.start)
+        ops = {(change['type'], change['id']): change for change in data['changes']}
+        self.assertEqual(len(ops), 2)
+        self.assertEqual(ops[('product', self.product.id)]['data']['price'], '120.00')
+        self.assertEqual(ops[('product', other_id)]['op'], 'delete')
+        self.assertFalse(data['has_more'])
+        self.assertEqual(self.changes(data['last_seq'])['changes'], [])
+    
+    def test_bulk_prices_recorded_in_same_transaction(self):
+        """Записи журнала появляются вместе с ценами, без ожидания on_commit, и ровно по одной"""
+        with self.captureOnCommitCallbacks() as callbacks:
+            bulk_update_prices([{'id': self.product.id, 'price': '130.00'}])
+        self.assertEqual(
+            CatalogChange.objects.filter(seq__gt=self.start, kind='product', object_id=self.product.id).count(), 1
+        )
+        for callback in callbacks:
+            callback()
+        self.assertEqual(CatalogChange.objects.filter(seq__gt=self.start).count(), 1)
+    
+    def test_compaction_keeps_latest_entry(self):
+        """После компакции клиент с нуля получает то же состояние"""
+        self.product.name = "Новое имя"
+        self.product.save()
+        before = self.changes(0)['changes']
+        
+        call_command('compact_catalog_changes', stdout=io.StringIO())
+        
+        self.assertEqual(CatalogChange.objects.filter(kind='product', object_id=self.product.id).count(), 1)
+        self.assertEqual(self.changes(0)['changes'], before)
+
+
+class CartEventsTestCase(CatalogTestCase):
+    """Тесты push-уведомлений корзины"""
+    with_user = True
+    
+    def add_item(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            cart = Cart.objects.create(user=self.user)
+            CartItem.objects.create(cart=cart, product=self.product, quantity=2)
+    
+    def change_price(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_update_prices([{'id': self.product.id, 'price': '80.00'}])
+    
+    async def next_event(self, stream):
+        chunk = await asyncio.wait_for(anext(stream), timeout=5)
+        return json.loads(chunk.split('data: ', 1)[1])
+    
+    async def test_stream_pushes_cart_and_price_changes(self):
+        """Снимок приходит сразу, после изменения корзины и после смены цены ее товара"""
+        stream = cart_event_stream(self.user, heartbeat=5)
+        self.assertEqual((await self.next_event(stream))['items'], [])
+        
+        await sync_to_async(self.add_item)()
+        self.assertEqual((await self.next_event(stream))['total_items'], 2)
+        
+        await sync_to_async(self.change_price)()
+        self.assertEqual((await self.next_event(stream))['total_price'], 160.0)
+        
+        await stream.aclose()
+        self.assertEqual(get_broker().subscription_count, 0)
+    
+    async def test_requires_token(self):
+        """Без токена поток не открывается"""
+        response = await self.async_client.get('/api/cart/events/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+    
+    def test_not_served_under_wsgi(self):
+        """Под WSGI поток не открывается и не занимает поток воркера"""
+        token = Token.objects.create(user=self.user)
+        response = self.client.get('/api/cart/events/', {'token': token.key})
+        self.assertEqual(response.status_code, status.HTTP_501_NOT_IMPLEMENTED)
+
+
+def throttle_rates(**rates):
+    return override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': rates})
+
+
+class ThrottlingTestCase(CleanCacheTestCase):
+    """Тесты ограничения частоты запросов и сброса нагрузки"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        create_user()
+    
+    @throttle_rates(login='2/min')
+    def test_login_throttled_per_ip(self):
+        """Третья попытка входа за минуту получает 429 с Retry-After"""
+        before = THROTTLE_DECISIONS.value('login', 'throttled')
+        for _ in range(2):
+            response = self.client.post('/api/login/', {'username': 'testuser', 'password': 'wrong'})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post('/api/login/', {'username': 'testuser', 'password': 'testpass123'})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        self.assertEqual(THROTTLE_DECISIONS.value('login', 'throttled'), before + 1)
+        
+        other_ip = self.client.post('/api/login/', {'username': 'testuser', 'password': 'testpass123'},
+                                    REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(other_ip.status_code, status.HTTP_200_OK)
+    
+    @throttle_rates(login='2/min')
+    def test_login_throttle_ignores_spoofed_forwarded_for(self):
+        """Новый X-Forwarded-For на каждый запрос не дает нового ведра"""
+        for i in range(2):
+            self.client.post('/api/login/', {'username': 'testuser', 'password': 'wrong'},
+                             HTTP_X_FORWARDED_FOR=f'203.0.113.{i}')
+        response = self.client.post('/api/login/', {'username': 'testuser', 'password': 'wrong'},
+                                    HTTP_X_FORWARDED_FOR='203.0.113.99')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+    
+    @throttle_rates(products='10/min')
+    def test_large_pages_cost_more(self):
+        """Страница из 100 товаров расходует все ведро"""
+        self.assertEqual(self.client.get('/api/products/', {'page_size': 100}).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get('/api/products/').status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+    
+    @override_settings(CONCURRENCY_LIMIT=1)
+    def test_concurrency_limit_sheds_load(self):
+        """Запрос сверх лимита одновременных получает 503, слот освобождается"""
+        before = REQUESTS_SHED.value()
+        middleware = ConcurrencyLimitMiddleware(lambda request: middleware(request))
+        response = middleware(RequestFactory().get('/api/products/'))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(REQUESTS_SHED.value(), before + 1)
+        self.assertTrue(middleware.slots.acquire(blocking=False))
+    
+    @override_settings(CONCURRENCY_LIMIT=1)
+    def test_concurrency_limit_skips_event_stream(self):
+        """Открытый SSE-поток не занимает слот и не получает 503"""
+        middleware = ConcurrencyLimitMiddleware(lambda request: HttpResponse())
+        self.assertTrue(middleware.slots.acquire(blocking=False))
+        self.assertEqual(middleware(RequestFactory().get('/api/cart/events/')).status_code, 200)
+        self.assertEqual(middleware(RequestFactory().get('/api/products/')).status_code, 503)
+
+
+class SparseFieldsTestCase(CatalogTestCase):
+    """Тесты ?fields= и ?images= для товаров и корзины"""
+    with_user = True
+    
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Product.objects.filter(pk=cls.product.pk).update(
+            image_small='products/test-product/test-product_small.jpg',
+            image_large='products/test-product/test-product_large.jpg',
+        )
+    
+    def test_product_fields_and_images(self):
+        """Лишние поля и колонки не выбираются"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/products/', {'fields': 'id,name,images', 'images': 'small'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        item = response.data['results'][0]
+        self.assertEqual(set(item), {'id', 'name', 'images'})
+        self.assertEqual(list(item['images']), ['small'])
+        select = queries[-1]['sql']
+        self.assertNotIn('image_large', select)
+        self.assertNotIn('catalog_category', select)
+        
+        full = self.client.get('/api/products/')
+        self.assertLess(len(response.content), len(full.content))
+    
+    def test_cart_fields_and_images(self):
+        """Позиции корзины сокращаются, сумма считается как прежде"""
+        self.client.force_authenticate(self.user)
+        self.client.post('/api/cart/add/', {'product_id': self.product.id, 'quantity': 2})
+        response = self.client.get('/api/cart/', {'fields': 'product,quantity,product_images', 'images': 'small'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data['items'][0]), {'product', 'quantity', 'product_images'})
+        self.assertEqual(list(response.data['items'][0]['product_images']), ['small'])
+        self.assertEqual(response.data['total_price'], Decimal('200.00'))
+    
+    def test_unknown_field(self):
+        """Неизвестное поле — 400"""
+        response = self.client.get('/api/products/', {'fields': 'id,secret'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ProductCacheTestCase(CleanCacheTestCase):
+    """Тесты карточки товара и выборки по id через кэш"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        category, subcategory = create_category()
+        cls.products = [
+            create_product(subcategory, name=f"Продукт {i}", slug=f"product-{i}", price=100 + i)
+            for i in range(3)
+        ]
+    
+    def test_detail_by_slug(self):
+        """Карточка по slug; повторный запрос не обращается к БД"""
+        response = self.client.get('/api/products/product-1/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['id'], self.products[1].id)
+        with self.assertNumQueries(0):
+            self.client.get('/api/products/product-1/')
+        self.assertEqual(self.client.get('/api/products/missing/').status_code, status.HTTP_404_NOT_FOUND)
+    
+    def test_multi_get_fetches_misses_in_one_query(self):
+        """Промахи загружаются одним запросом, порядок ответа — порядок ids"""
+        first, second, third = self.products
+        self.client.get(f'/api/products/?ids={first.id}')
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/products/?ids={third.id},{first.id},{second.id},999')
+        self.assertEqual([item['id'] for item in response.data['results']], [third.id, first.id, second.id])
+        self.assertEqual(response.data['not_found'], [999])
+    
+    def test_invalidated_on_save_and_bulk_price_update(self):
+        """Изменение товара сбрасывает запись кэша"""
+        product = self.products[0]
+        self.client.get('/api/products/product-0/')
+        with self.captureOnCommitCallbacks(execute=True):
+            product.name = "Новое имя"
+            product.save()
+        self.assertEqual(self.client.get('/api/products/product-0/').data['name'], "Новое имя")
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_update_prices([{'id': product.id, 'price': '55.00'}])
+        response = self.client.get(f'/api/products/?ids={product.id}')
+        self.assertEqual(response.data['results'][0]['price'], '55.00')
+
+
+class CartSummaryTestCase(CatalogTestCase):
+    """Тесты денормализованных итогов корзины"""
+    authenticate = True
+    
+    def summary(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/cart/summary/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['total_items'], Decimal(response.data['total_price'])
+    
+    def test_totals_follow_cart_and_price_changes(self):
+        """Итоги меняются вместе с позициями и ценами"""
+        self.assertEqual(self.summary(), (0, Decimal('0')))
+        item_id = self.client.post(
+            '/api/cart/add/', {'product_id': self.product.id, 'quantity': 2}
+        ).data['items'][0]['id']
+        self.assertEqual(self.summary(), (2, Decimal('200')))
+        
+        self.client.put(f'/api/cart/item/{item_id}/', {'quantity': 3})
+        self.assertEqual(self.summary(), (3, Decimal('300')))
+        
+        bulk_update_prices([{'id': self.product.id, 'price': '10.00'}])
+        self.assertEqual(self.summary(), (3, Decimal('30')))
+        
+        self.product.refresh_from_db()
+        self.product.price = Decimal('20.00')
+        self.product.save()
+        self.assertEqual(self.summary(), (3, Decimal('60')))
+        
+        self.client.delete('/api/cart/clear/')
+        self.assertEqual(self.summary(), (0, Decimal('0')))
+    
+    def test_totals_follow_product_delete(self):
+        """Удаление товара (и каскадом его позиций) пересчитывает итоги корзин"""
+        other = create_product(self.subcategory, name='Другой товар', slug='other', price='10.00')
+        self.client.post('/api/cart/add/', {'product_id': self.product.id, 'quantity': 2})
+        self.client.post('/api/cart/add/', {'product_id': other.id, 'quantity': 1})
+        self.assertEqual(self.summary(), (3, Decimal('210')))
+        
+        Product.objects.filter(pk=self.product.pk).delete()
+        self.assertEqual(self.summary(), (1, Decimal('10')))
+        self.assertEqual(self.client.get('/api/cart/').data['total_items'], 1)
+        
+        self.subcategory.delete()
+        self.assertEqual(self.summary(), (0, Decimal('0')))
+    
+    def test_reconcile_fixes_drift(self):
+        """Команда пересчитывает только разошедшиеся корзины"""
+        self.client.post('/api/cart/add/', {'product_id': self.product.id, 'quantity': 2})
+        Cart.objects.update(total_items=7)
+        out = io.StringIO()
+        call_command('reconcile_cart_totals', stdout=out)
+        self.assertIn('исправлено: 1', out.getvalue())
+        self.assertEqual(self.summary(), (2, Decimal('200')))
+
+
+class StartupTestCase(TestCase):
+    """Тесты ленивой загрузки тяжелых модулей и кэширования главной страницы"""
+    
+    def test_heavy_modules_not_imported_at_startup(self):
+        """Старт приложения и загрузка URLconf не импортируют Pillow и drf-yasg"""
+        code = (
+            "import sys, config.wsgi; from django.urls import get_resolver; get_resolver().url_patterns; "
+            "print(','.join(m for m in ('PIL.Image', 'drf_yasg.views') if m in sys.modules))"
+        )
+        result = subprocess.run(
+            [sys.executable, '-c', code], cwd=settings.BASE_DIR, capture_output=True, text=True,
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'config.settings'}, check=True,
+        )
+        self.assertEqual(result.stdout.strip(), '')
+    
+    def test_home_page_etag(self):
+        """Повторный запрос главной с If-None-Match получает 304"""
+        response = self.client.get('/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        again = self.client.get('/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+class SchemaDriftTestCase(TestCase):
+    """Тесты готовой OpenAPI-схемы"""
+    
+    def test_committed_schema_matches_code(self):
+        """config/openapi.json совпадает со схемой, сгенерированной из кода"""
+        with open(settings.OPENAPI_SCHEMA_PATH, 'rb') as f:
+            committed = f.read()
+        self.assertTrue(committed == render_schema(generate_schema()),
+                        "OpenAPI-схема устарела: выполните python manage.py export_schema")
+    
+    def test_schema_served_with_etag(self):
+        """/openapi.json отдает файл без генерации и отвечает 304 на If-None-Match"""
+        response = self.client.get('/openapi.json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, load_schema()[0])
+        self.assertIn('/products/', json.loads(response.content)['paths'])
+        again = self.client.get('/openapi.json', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, status.HTTP_304_NOT_MODIFIED)
+        legacy = self.client.get('/swagger/?format=openapi')
+        self.assertEqual(legacy.content, response.content)
+
+
+class WarmCacheTestCase(CatalogTestCase):
+    """Тесты прогрева кэша и кэша дерева категорий"""
+    
+    def test_warm_caches_serves_categories_without_queries(self):
+        """После прогрева список категорий и товар отдаются без обращений к БД"""
+        self.assertEqual(warm_caches(products=10), 1)
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/categories/')
+            self.client.get(f'/api/products/{self.product.slug}/')
+        self.assertEqual(response.data['results'][0]['subcategories'][0]['name'], "Тестовая подкатегория")
+    
+    def test_category_tree_invalidated_on_change(self):
+        """Переименование подкатегории сбрасывает дерево категорий"""
+        self.client.get('/api/categories/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.subcategory.name = "Новое имя"
+            self.subcategory.save()
+        response = self.client.get('/api/categories/')
+        self.assertEqual(response.data['results'][0]['subcategories'][0]['name'], "Новое имя")
+
+
+class BulkFixtureLoadTestCase(TestCase):
+    """Тесты быстрой загрузки фикстур"""
+    
+    def test_matches_loaddata(self):
+        """Загрузчик дает те же строки, что и loaddata, и повторно загружается без ошибок"""
+        call_command('loaddata', *CATALOG_FIXTURES, verbosity=0)
+        expected = list(Product.objects.order_by('pk').values())
+        Product.objects.all().delete()
+        SubCategory.objects.all().delete()
+        Category.objects.all().delete()
+        
+        counts = load_fixtures(reversed(CATALOG_FIXTURES), batch_size=2)
+        self.assertEqual(counts, {'catalog.category': 2, 'catalog.subcategory': 3, 'catalog.product': 3})
+        self.assertEqual(list(Product.objects.order_by('pk').values()), expected)
+        self.assertEqual(PriceHistory.objects.count(), 3)
+        self.assertEqual(load_fixtures(CATALOG_FIXTURES)['catalog.product'], 3)
+        self.assertEqual(Product.objects.count(), 3)
+        self.assertEqual(PriceHistory.objects.count(), 3)
+    
+    def test_reload_records_changed_prices(self):
+        """Повторная загрузка с другой ценой пишет историю и пересчитывает корзины"""
+        load_fixtures(CATALOG_FIXTURES)
+        product = Product.objects.order_by('pk').first()
+        fixture_price = product.price
+        cart = Cart.objects.create(user=create_user())
+        CartItem.objects.create(cart=cart, product=product, quantity=2)
+        bulk_update_prices([{'id': product.pk, 'price': fixture_price + 1}])
+        
+        load_fixtures(CATALOG_FIXTURES)
+        
+        self.assertEqual(
+            list(product.price_history.order_by('-pk').values_list('price', flat=True)[:2]),
+            [fixture_price, fixture_price + 1],
+        )
+        cart.refresh_from_db()
+        self.assertEqual((cart.total_items, cart.total_price), (2, fixture_price * 2))
+    
+    def test_streams_large_array(self):
+        """Разбор массива по кускам, меньшим одного элемента"""
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+            json.dump([{'n': i, 'text': 'x' * 50} for i in range(100)], f)
+        self.addCleanup(os.remove, f.name)
+        items = list(iter_json_array(f.name, chunk_size=16))
+        self.assertEqual([item['n'] for item in items], list(range(100)))
+
+
+class CatalogFixturesTestCaseTestCase(CatalogFixturesTestCase):
+    """Данные фикстур доступны тестам класса"""
+    
+    def test_fixtures_loaded(self):
+        response = self.client.get('/api/products/yabloki-krasnye/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Category.objects.count(), 2)
+
+
+class RelatedProductsTestCase(CleanCacheTestCase):
+    """Тесты рекомендаций «покупают вместе»"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        category, subcategory = create_category()
+        cls.products = create_products(subcategory, 4)
+        cls.users = [create_user(f'buyer-{i}') for i in range(2)]
+    
+    def add(self, user, *products):
+        self.client.force_authenticate(user)
+        for product in products:
+            self.client.post('/api/cart/add/', {'product_id': product.id, 'quantity': 1})
+    
+    def related(self, product):
+        response = self.client.get(f'/api/products/{product.id}/related/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item['id'] for item in response.data['results']]
+    
+    def scores(self, product):
+        return dict(RelatedProduct.objects.filter(product=product).values_list('related_id', 'score'))
+    
+    def test_build_and_serve(self):
+        """Соседи упорядочены по числу совместных покупок, повторный запрос — один SQL"""
+        p0, p1, p2, p3 = self.products
+        self.add(self.users[0], p0, p1, p2)
+        self.add(self.users[1], p0, p1)
+        call_command('build_related_products', stdout=io.StringIO())
+        
+        self.assertEqual(self.related(p0), [p1.id, p2.id])
+        self.assertEqual(self.scores(p0), {p1.id: 2, p2.id: 1})
+        with self.assertNumQueries(1):
+            self.related(p0)
+        self.assertEqual(self.related(p3), [])
+        self.assertEqual(self.client.get('/api/products/999999/related/').status_code,
+                         status.HTTP_404_NOT_FOUND)
+    
+    def test_incremental_runs(self):
+        """Учитываются только измененные корзины, удаление и оформление не удваивают счетчики"""
+        p0, p1, p2, p3 = self.products
+        self.add(self.users[0], p0, p1, p2)
+        self.add(self.users[1], p0, p1)
+        build_related()
+        self.assertEqual(build_related()['carts'], 0)
+        
+        # Удаление позиции вычитает ее пары
+        self.client.force_authenticate(self.users[0])
+        item = CartItem.objects.get(cart__user=self.users[0], product=p1)
+        self.client.delete(f'/api/cart/item/{item.id}/remove/')
+        self.assertEqual(build_related()['carts'], 1)
+        self.assertEqual(self.scores(p0), {p1.id: 1, p2.id: 1})
+        
+        # Заказ заменяет корзину, из которой оформлен
+        self.client.force_authenticate(self.users[1])
+        self.client.post('/api/cart/checkout/')
+        stats = build_related()
+        self.assertEqual((stats['carts'], stats['orders']), (1, 1))
+        self.assertEqual(self.scores(p0), {p1.id: 1, p2.id: 1})
+        
+        # Удаленная корзина перестает учитываться
+        Cart.objects.filter(user=self.users[0]).delete()
+        build_related()
+        self.assertEqual(self.scores(p0), {p1.id: 1})
+        self.assertEqual(self.scores(p2), {})
+        
+        self.assertEqual(build_related(full=True)['orders'], 1)
+        self.assertEqual(self.scores(p0), {p1.id: 1})
+    
+    def test_late_commit_is_not_lost(self):
+        """Корзина с временем изменения до начала прошлого запуска, закоммиченная позже, учитывается"""
+        p0, p1, p2, p3 = self.products
+        build_related()
+        run_started = RecommendationState.objects.get().carts_synced_at + timedelta(
+            seconds=settings.RELATED_PRODUCTS_SYNC_MARGIN
+        )
+        self.add(self.users[0], p0, p1)
+        Cart.objects.update(contents_changed_at=run_started - timedelta(seconds=1))
+        
+        self.assertEqual(build_related()['carts'], 1)
+        self.assertEqual(self.scores(p0), {p1.id: 1})
@@ -0,0 +1,82 @@
+import math
+import threading
+import time
+
+from django.core.cache import cache
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from .metrics import THROTTLE_DECISIONS
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'120/min' -> (емкость 120, пополнение 2 токена в секунду)"""
+    num, period = rate.split('/')
+    capacity = int(num)
+    return capacity, capacity / PERIODS[period[0]]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Ограничение «ведро токенов» по view.throttle_scope.
+    
+    Скорость берется из DEFAULT_THROTTLE_RATES[scope] в формате DRF:
+    '120/min' — до 120 запросов подряд, затем 2 в секунду. Ведро ведется
+    на пользователя (по токену) или на IP и хранится в кэше по умолчанию,
+    поэтому при общем кэше (Redis, Memcached) лимит общий для всех воркеров.
+    Страница большего размера стоит пропорционально больше токенов.
+    """
+    cache = cache
+    # Чтение и запись ведра не атомарны в кэше; блокировка защищает хотя бы в пределах процесса
+    lock = threading.Lock()
+    
+    def __init__(self):
+        self._wait = None
+    
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = f'user:{request.user.pk}'
+        else:
+            ident = f'ip:{self.get_ident(request)}'
+        return f'throttle:{view.throttle_scope}:{ident}'
+    
+    def get_cost(self, request, view):
+        paginator = getattr(view, 'pagination_class', None)
+        param = getattr(paginator, 'page_size_query_param', None)
+        if not param:
+            return 1
+        try:
+            size = int(request.query_params.get(param, 0))
+        except ValueError:
+            return 1
+        if size <= 0:
+            return 1
+        size = min(size, paginator.max_page_size or size)
+        return max(1, math.ceil(size / paginator.page_size))
+    
+    def allow_request(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope) if scope else None
+        if rate is None:
+            return True
+        capacity, refill = parse_rate(rate)
+        cost = min(self.get_cost(request, view), capacity)
+        key = self.get_cache_key(request, view)
+        
+        with self.lock:
+            now = time.time()
+            tokens, updated = self.cache.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * refill)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self.cache.set(key, (tokens, now), timeout=math.ceil(capacity / refill))
+        
+        self._wait = None if allowed else (cost - tokens) / refill
+        THROTTLE_DECISIONS.inc(scope, 'allowed' if allowed else 'throttled')
+        return allowed
+    
+    def wait(self):
+        return self._wait
@@ -6,13 +6,28 @@ urlpatterns = [
     path('categories/', views.CategoryListView.as_view(), name='category-list'),
     path('products/', views.ProductListView.as_view(), name='product-list'),
     
+    # Журнал изменений каталога для инкрементальной синхронизации
+    path('catalog/changes/', views.CatalogChangesView.as_view(), name='catalog-changes'),
+    
+    # Пакетное обновление цен (только для администраторов)
+    path('products/prices/', views.BulkPriceUpdateView.as_view(), name='product-prices-bulk'),
+    
+    # «Покупают вместе» (считается командой build_related_products)
+    path('products/<int:pk>/related/', views.RelatedProductsView.as_view(), name='product-related'),
+    
+    # Товар по slug (после products/prices/, чтобы не перехватить этот путь)
+    path('products/<slug:slug>/', views.ProductDetailView.as_view(), name='product-detail'),
+    
     # Авторизация
     path('login/', views.LoginView.as_view(), name='login'),
     
     # Эндпоинты корзины (только для авторизованных)
     path('cart/', views.CartView.as_view(), name='cart-detail'),
+    path('cart/summary/', views.CartSummaryView.as_view(), name='cart-summary'),
     path('cart/add/', views.AddToCartView.as_view(), name='cart-add'),
     path('cart/item/<int:item_id>/', views.UpdateCartItemView.as_view(), name='cart-item-update'),
     path('cart/item/<int:item_id>/remove/', views.RemoveFromCartView.as_view(), name='cart-item-remove'),
     path('cart/clear/', views.ClearCartView.as_view(), name='cart-clear'),
+    path('cart/checkout/', views.CheckoutView.as_view(), name='cart-checkout'),
+    path('cart/events/', views.cart_events, name='cart-events'),
 ]
\ No newline at end of file
@@ -1,20 +1,44 @@
-from django.http import HttpResponse
+import hashlib
+import json
+import os
+from decimal import Decimal
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import etag
+from django.http import HttpResponse, FileResponse, Http404, JsonResponse, StreamingHttpResponse
 from rest_framework import generics, status
 from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework.utils.encoders import JSONEncoder
 from rest_framework.pagination import PageNumberPagination
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.authtoken.models import Token
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from django.db.models.functions import Now
 from django.shortcuts import get_object_or_404
-from .models import Category, Product, Cart, CartItem
+from .models import IMAGE_SIZES, Category, Product, Cart, CartItem, RelatedProduct
+from .metrics import registry
+from .images import IMAGE_FORMATS, get_derivative_cache, derivative_key, format_for, render_resized
 from .serializers import (
-    CategorySerializer, ProductSerializer, CartSerializer,
-    AddToCartSerializer, UpdateCartItemSerializer
+    CategorySerializer, ProductSerializer, CartSerializer, CartItemSerializer, parse_list_param,
+    AddToCartSerializer, UpdateCartItemSerializer, BulkPriceUpdateSerializer,
+    OrderSerializer
 )
+from .pricing import bulk_update_prices
+from .inventory import InsufficientStock, reserve, release_for_items
+from .orders import EmptyCart, checkout
+from .idempotency import idempotent
+from .changelog import changes_since
+from .events import get_broker
+from .throttling import TokenBucketThrottle
+from .product_cache import get_category_tree, get_product_by_slug, get_products
 
-def home(request):
-    """Главная страница с ссылками на все эндпоинты"""
-    html = """
+# Главная страница статична: строится и кодируется один раз при импорте
+HOME_PAGE = """
     <!DOCTYPE html>
     <html lang="ru">
     <head>
@@ -274,8 +298,51 @@ def home(request):
         </div>
     </body>
     </html>
-    """
-    return HttpResponse(html)
+    """.encode()
+HOME_ETAG = f'"{hashlib.sha1(HOME_PAGE).hexdigest()}"'
+
+
+@etag(lambda request: HOME_ETAG)
+@cache_control(public=True, max_age=300)
+def home(request):
+    """Главная страница с ссылками на все эндпоинты"""
+    return HttpResponse(HOME_PAGE)
+
+
+def resized_image(request, width, height, path):
+    """Отдает оригинал изображения, уменьшенный до разрешенного размера (с кэшированием на диске)"""
+    if (width, height) not in settings.IMAGE_RESIZE_SIZES:
+        raise Http404("Размер не разрешен")
+    
+    fmt = request.GET.get('format') or format_for(path)
+    if fmt not in settings.IMAGE_RESIZE_FORMATS or fmt not in IMAGE_FORMATS:
+        raise Http404("Формат не поддерживается")
+    
+    media_root = os.path.realpath(settings.MEDIA_ROOT)
+    cache_root = os.path.realpath(settings.IMAGE_RESIZE_CACHE_DIR)
+    source_path = os.path.realpath(os.path.join(media_root, path))
+    if (not source_path.startswith(media_root + os.sep)
+            or source_path.startswith(cache_root + os.sep)
+            or not os.path.isfile(source_path)):
+        raise Http404("Изображение не найдено")
+    
+    cache = get_derivative_cache()
+    key = derivative_key(source_path, width, height, fmt)
+    try:
+        cached_file = cache.open_or_create(
+            key, lambda: render_resized(source_path, width, height, fmt)
+        )
+    except OSError:
+        raise Http404("Не удалось обработать изображение")
+    
+    response = FileResponse(cached_file, content_type=IMAGE_FORMATS[fmt][2])
+    response['Cache-Control'] = 'public, max-age=86400'
+    return response
+
+
+def metrics(request):
+    """Метрики процесса в текстовом формате Prometheus"""
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 
 class StandardPagination(PageNumberPagination):
@@ -285,24 +352,289 @@ class StandardPagination(PageNumberPagination):
     max_page_size = 100
 
 
+# Колонки товара, которые нужны полям ProductSerializer (id загружается всегда)
+PRODUCT_FIELD_COLUMNS = {
+    'name': ['name'],
+    'slug': ['slug'],
+    'price': ['price'],
+    'category': ['subcategory__category__name'],
+    'subcategory': ['subcategory__name'],
+}
+
+
+def image_columns(images, prefix=''):
+    return [f'{prefix}image_{size}' for size in IMAGE_SIZES if images is None or size in images]
+
+
+def sparse_products(fields, images):
+    """Товары с загрузкой только колонок, нужных полям ?fields= и размерам ?images="""
+    queryset = Product.objects.all()
+    if 'category' in fields:
+        queryset = queryset.select_related('subcategory__category')
+    elif 'subcategory' in fields:
+        queryset = queryset.select_related('subcategory')
+    columns = [column for name in fields for column in PRODUCT_FIELD_COLUMNS.get(name, [])]
+    if 'images' in fields:
+        columns += image_columns(images)
+    return queryset.only('id', *columns)
+
+
+def trim_product(data, fields, images):
+    """Применяет ?fields= и ?images= к готовому (закэшированному) представлению товара"""
+    if images is not None and 'images' in data:
+        data = {**data, 'images': {size: url for size, url in data['images'].items() if size in images}}
+    if fields is not None:
+        data = {name: value for name, value in data.items() if name in fields}
+    return data
+
+
+def prefetch_cart(cart, fields=None, images=None):
+    """
+    Загружает позиции корзины вместе с товарами одним запросом.
+    
+    fields и images (из ?fields= и ?images=) сужают набор колонок товара;
+    цена загружается всегда — по ней считается сумма корзины.
+    """
+    queryset = CartItem.objects.select_related('product')
+    if fields is not None or images is not None:
+        columns = ['cart', 'product', 'quantity', 'created_at', 'product__price']
+        if fields is None or 'product_name' in fields:
+            columns.append('product__name')
+        if fields is None or 'product_images' in fields:
+            columns += image_columns(images, prefix='product__')
+        queryset = queryset.only(*columns)
+    prefetch_related_objects([cart], Prefetch('items', queryset=queryset))
+    return cart
+
+
+def serialize_cart(cart, fields=None, images=None):
+    return CartSerializer(
+        prefetch_cart(cart, fields, images), context={'fields': fields, 'images': images}
+    ).data
+
+
+def empty_cart_payload(user):
+    """Ответ корзины для пользователя, у которого ее еще нет"""
+    return {
+        'id': None, 'user': user.pk, 'username': user.username, 'items': [],
+        'total_price': 0, 'total_items': 0, 'created_at': None, 'updated_at': None,
+    }
+
+
+def insufficient_stock_response(error):
+    return Response(
+        {
+            "detail": "Недостаточно товара на складе",
+            "product_id": error.product_id,
+            "available": error.available,
+        },
+        status=status.HTTP_409_CONFLICT,
+    )
+
+
+def cart_snapshot(user):
+    """Текущее состояние корзины и каналы, на которые нужно подписаться"""
+    channels = {f'user:{user.pk}'}
+    cart = Cart.objects.filter(user=user).first()
+    if cart is None:
+        return empty_cart_payload(user), channels
+    payload = serialize_cart(cart)
+    channels.add(f'cart:{cart.pk}')
+    channels.update(f"product:{item['product']}" for item in payload['items'])
+    return payload, channels
+
+
+async def cart_event_stream(user, heartbeat):
+    """
+    SSE-поток снимков корзины: первый сразу, затем после каждой пачки уведомлений.
+    
+    Каналы обновляются по составу корзины; если добавились новые, снимок
+    берется повторно, чтобы не пропустить изменение между чтением и подпиской.
+    """
+    subscription = get_broker().subscribe({f'user:{user.pk}'})
+    try:
+        while True:
+            payload, channels = await sync_to_async(cart_snapshot)(user)
+            if channels != subscription.channels:
+                added = channels - subscription.channels
+                subscription.update(channels)
+                if added:
+                    payload, _ = await sync_to_async(cart_snapshot)(user)
+            yield f"event: cart\ndata: {json.dumps(payload, cls=JSONEncoder, ensure_ascii=False)}\n\n"
+            while not await subscription.wait(heartbeat):
+                yield ": ping\n\n"
+            subscription.drain()
+    finally:
+        subscription.close()
+
+
+async def _event_user(request):
+    """Пользователь по токену (заголовок или ?token= для EventSource) или по сессии"""
+    key = request.GET.get('token', '')
+    auth = request.headers.get('Authorization', '')
+    if auth.startswith('Token '):
+        key = auth[len('Token '):].strip()
+    if key:
+        token = await Token.objects.select_related('user').filter(key=key).afirst()
+        return token.user if token and token.user.is_active else None
+    user = await request.auser()
+    return user if user.is_authenticated else None
+
+
+async def cart_events(request):
+    """Эндпоинт SSE: push снимков корзины при ее изменении и изменении цен ее товаров"""
+    if not isinstance(request, ASGIRequest):
+        # Под WSGI бесконечный поток собирается в память целиком и навсегда занимает
+        # поток воркера, а клиент не получает ни байта
+        return JsonResponse({"detail": "Поток событий доступен только под ASGI."}, status=501)
+    user = await _event_user(request)
+    if user is None:
+        return JsonResponse({"detail": "Учетные данные не были предоставлены."}, status=401)
+    response = StreamingHttpResponse(
+        cart_event_stream(user, settings.EVENTS_HEARTBEAT), content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Отключает буферизацию ответа в nginx
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 class CategoryListView(generics.ListAPIView):
     """Эндпоинт для просмотра всех категорий с подкатегориями"""
     permission_classes = [AllowAny]
-    queryset = Category.objects.all()
+    queryset = Category.objects.prefetch_related('subcategories')
     serializer_class = CategorySerializer
     pagination_class = StandardPagination
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'categories'
+    
+    def list(self, request, *args, **kwargs):
+        # Дерево категорий меняется редко и берется из кэша целиком
+        page = self.paginate_queryset(get_category_tree())
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
 
 
 class ProductListView(generics.ListAPIView):
     """Эндпоинт для просмотра всех продуктов с пагинацией"""
     permission_classes = [AllowAny]
-    queryset = Product.objects.all()
+    queryset = Product.objects.select_related('subcategory__category')
     serializer_class = ProductSerializer
     pagination_class = StandardPagination
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'products'
+    
+    def get_queryset(self):
+        # ?fields=id,name,price&images=small сужают и ответ, и SELECT
+        fields = parse_list_param(self.request, 'fields', ProductSerializer.Meta.fields)
+        images = parse_list_param(self.request, 'images', IMAGE_SIZES)
+        if fields is None and images is None:
+            return self.queryset.all()
+        return sparse_products(fields or ProductSerializer.Meta.fields, images)
+    
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'] = parse_list_param(self.request, 'fields', ProductSerializer.Meta.fields)
+        context['images'] = parse_list_param(self.request, 'images', IMAGE_SIZES)
+        return context
+    
+    def list(self, request, *args, **kwargs):
+        if 'ids' not in request.query_params:
+            return super().list(request, *args, **kwargs)
+        # ?ids=1,2,3 — выборка по id из кэша товаров, без пагинации
+        try:
+            ids = list(dict.fromkeys(
+                int(value) for value in request.query_params['ids'].split(',') if value.strip()
+            ))
+        except ValueError:
+            return Response({"ids": "Ожидается список целых чисел через запятую"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > settings.PRODUCT_MULTI_GET_MAX:
+            return Response(
+                {"ids": f"Не больше {settings.PRODUCT_MULTI_GET_MAX} id за запрос"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        context = self.get_serializer_context()
+        products = get_products(ids)
+        return Response({
+            'results': [trim_product(products[pk], context['fields'], context['images'])
+                        for pk in ids if pk in products],
+            'not_found': [pk for pk in ids if pk not in products],
+        })
+
+
+class ProductDetailView(generics.GenericAPIView):
+    """Эндпоинт для просмотра товара по slug (из кэша товаров)"""
+    permission_classes = [AllowAny]
+    serializer_class = ProductSerializer
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'products'
+    
+    def get(self, request, slug):
+        data = get_product_by_slug(slug)
+        if data is None:
+            raise Http404
+        fields = parse_list_param(request, 'fields', ProductSerializer.Meta.fields)
+        images = parse_list_param(request, 'images', IMAGE_SIZES)
+        return Response(trim_product(data, fields, images))
+
+
+class RelatedProductsView(generics.GenericAPIView):
+    """Эндпоинт «покупают вместе»: top-K соседей товара из RelatedProduct"""
+    permission_classes = [AllowAny]
+    # queryset нужен только генератору схемы (тип параметра pk)
+    queryset = Product.objects.all()
+    serializer_class = ProductSerializer
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'products'
+    
+    def get(self, request, pk):
+        # Одна выборка по индексу (product, rank), данные товаров — из кэша
+        ids = list(RelatedProduct.objects.filter(product_id=pk).values_list('related_id', flat=True))
+        if not ids and not Product.objects.filter(pk=pk).exists():
+            raise Http404
+        fields = parse_list_param(request, 'fields', ProductSerializer.Meta.fields)
+        images = parse_list_param(request, 'images', IMAGE_SIZES)
+        products = get_products(ids)
+        return Response({
+            'product_id': pk,
+            'results': [trim_product(products[related_id], fields, images)
+                        for related_id in ids if related_id in products],
+        })
+
+
+class BulkPriceUpdateView(generics.GenericAPIView):
+    """Эндпоинт для пакетного обновления цен (только для администраторов)"""
+    permission_classes = [IsAdminUser]
+    serializer_class = BulkPriceUpdateSerializer
+    
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        result = bulk_update_prices(serializer.validated_data['prices'])
+        return Response(result)
+
+
+class CatalogChangesView(APIView):
+    """Эндпоинт журнала изменений каталога: upsert и tombstone после ?after=<seq>"""
+    permission_classes = [AllowAny]
+    max_limit = 1000
+    
+    def get(self, request, *args, **kwargs):
+        try:
+            after = int(request.query_params.get('after', 0))
+            limit = min(int(request.query_params.get('limit', 500)), self.max_limit)
+        except ValueError:
+            return Response({"detail": "after и limit должны быть целыми"}, status=status.HTTP_400_BAD_REQUEST)
+        if after < 0 or limit < 1:
+            return Response({"detail": "after >= 0, limit >= 1"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(changes_since(after, limit, context={'request': request}))
 
 
 class LoginView(ObtainAuthToken):
     """Эндпоинт для получения токена авторизации"""
+    # Каждая попытка считает дорогой хэш пароля — ограничиваем перебор
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'login'
+    
     def post(self, request, *args, **kwargs):
         serializer = self.serializer_class(data=request.data, context={'request': request})
         serializer.is_valid(raise_exception=True)
@@ -320,9 +652,26 @@ class CartView(generics.RetrieveAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = CartSerializer
     
-    def get_object(self):
-        cart, created = Cart.objects.get_or_create(user=self.request.user)
-        return cart
+    def retrieve(self, request, *args, **kwargs):
+        # Корзина создается при первом добавлении товара, а не при просмотре
+        cart = Cart.objects.filter(user=request.user).first()
+        if cart is None:
+            return Response(empty_cart_payload(request.user))
+        # ?fields= выбирает поля позиций, ?images= — размеры изображений товара
+        fields = parse_list_param(request, 'fields', CartItemSerializer.Meta.fields)
+        images = parse_list_param(request, 'images', IMAGE_SIZES)
+        return Response(serialize_cart(cart, fields, images))
+
+
+class CartSummaryView(APIView):
+    """Эндпоинт итогов корзины для бейджа: одна строка Cart, без позиций"""
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request, *args, **kwargs):
+        summary = Cart.objects.filter(user=request.user).values('total_items', 'total_price').first()
+        if summary is None:
+            summary = {'total_items': 0, 'total_price': Decimal('0.00')}
+        return Response(summary)
 
 
 class AddToCartView(generics.CreateAPIView):
@@ -330,6 +679,7 @@ class AddToCartView(generics.CreateAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = AddToCartSerializer
     
+    @idempotent
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -337,19 +687,26 @@ class AddToCartView(generics.CreateAPIView):
         product = get_object_or_404(Product, id=serializer.validated_data['product_id'])
         quantity = serializer.validated_data['quantity']
         
-        cart, created = Cart.objects.get_or_create(user=request.user)
-        
-        cart_item, created = CartItem.objects.get_or_create(
-            cart=cart,
-            product=product,
-            defaults={'quantity': quantity}
-        )
-        
-        if not created:
-            cart_item.quantity += quantity
-            cart_item.save()
+        try:
+            # Корзина создается в той же транзакции: при отказе в резерве не остается пустой
+            with transaction.atomic():
+                cart, _ = Cart.objects.get_or_create(user=request.user)
+                cart_item, created = CartItem.objects.get_or_create(
+                    cart=cart,
+                    product=product,
+                    defaults={'quantity': quantity}
+                )
+                
+                if not created:
+                    cart_item.quantity += quantity
+                    cart_item.save()
+                
+                reserve(cart_item, cart_item.quantity)
+                Cart.objects.filter(pk=cart.pk).update_totals()
+        except InsufficientStock as e:
+            return insufficient_stock_response(e)
         
-        return Response(CartSerializer(cart).data, status=status.HTTP_201_CREATED)
+        return Response(serialize_cart(cart), status=status.HTTP_201_CREATED)
 
 
 class UpdateCartItemView(generics.UpdateAPIView):
@@ -361,6 +718,7 @@ class UpdateCartItemView(generics.UpdateAPIView):
         cart = get_object_or_404(Cart, user=self.request.user)
         return get_object_or_404(CartItem, cart=cart, id=self.kwargs['item_id'])
     
+    @idempotent
     def update(self, request, *args, **kwargs):
         cart_item = self.get_object()
         serializer = self.get_serializer(data=request.data)
@@ -368,14 +726,21 @@ class UpdateCartItemView(generics.UpdateAPIView):
         
         quantity = serializer.validated_data['quantity']
         
-        if quantity == 0:
-            cart_item.delete()
-        else:
-            cart_item.quantity = quantity
-            cart_item.save()
+        try:
+            with transaction.atomic():
+                if quantity == 0:
+                    release_for_items([cart_item])
+                    cart_item.delete()
+                else:
+                    cart_item.quantity = quantity
+                    cart_item.save()
+                    reserve(cart_item, quantity)
+                Cart.objects.filter(pk=cart_item.cart_id).update_totals()
+        except InsufficientStock as e:
+            return insufficient_stock_response(e)
         
         cart = get_object_or_404(Cart, user=request.user)
-        return Response(CartSerializer(cart).data)
+        return Response(serialize_cart(cart))
 
 
 class RemoveFromCartView(generics.DestroyAPIView):
@@ -386,11 +751,15 @@ class RemoveFromCartView(generics.DestroyAPIView):
         cart = get_object_or_404(Cart, user=self.request.user)
         return get_object_or_404(CartItem, cart=cart, id=self.kwargs['item_id'])
     
+    @idempotent
     def destroy(self, request, *args, **kwargs):
         cart_item = self.get_object()
-        cart_item.delete()
+        with transaction.atomic():
+            release_for_items([cart_item])
+            cart_item.delete()
+            Cart.objects.filter(pk=cart_item.cart_id).update_totals()
         cart = get_object_or_404(Cart, user=request.user)
-        return Response(CartSerializer(cart).data)
+        return Response(serialize_cart(cart))
 
 
 class ClearCartView(generics.DestroyAPIView):
@@ -400,10 +769,34 @@ class ClearCartView(generics.DestroyAPIView):
     def get_object(self):
         return get_object_or_404(Cart, user=self.request.user)
     
+    @idempotent
     def destroy(self, request, *args, **kwargs):
         cart = self.get_object()
-        cart.items.all().delete()
+        with transaction.atomic():
+            release_for_items(cart.items.all())
+            cart.items.all().delete()
+            Cart.objects.filter(pk=cart.pk).update(total_items=0, total_price=0, contents_changed_at=Now())
         return Response(
-            {"message": "Корзина успешно очищена", "cart": CartSerializer(cart).data}, 
+            {"message": "Корзина успешно очищена", "cart": serialize_cart(cart)}, 
             status=status.HTTP_200_OK
-        )
\ No newline at end of file
+        )
+
+
+class CheckoutView(generics.GenericAPIView):
+    """Эндпоинт для оформления заказа из корзины (заголовок Idempotency-Key защищает от повторов)"""
+    permission_classes = [IsAuthenticated]
+    serializer_class = OrderSerializer
+    
+    def post(self, request, *args, **kwargs):
+        key = request.headers.get('Idempotency-Key', '').strip()[:64] or None
+        try:
+            order, created = checkout(request.user, key)
+        except EmptyCart:
+            return Response({"detail": "Корзина пуста"}, status=status.HTTP_400_BAD_REQUEST)
+        except InsufficientStock as e:
+            return insufficient_stock_response(e)
+        
+        return Response(
+            OrderSerializer(order).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
@@ -0,0 +1,74 @@
+"""
+Профиль gunicorn для продакшена:
+
+    gunicorn -c config/gunicorn.conf.py
+
+Приложение загружается в мастере до fork (preload_app): код и прогретый
+кэш воркеры получают через copy-on-write, а не импортируют каждый сам.
+Число процессов и потоков по умолчанию считается от числа ядер и
+переопределяется переменными окружения (WEB_CONCURRENCY, GUNICORN_THREADS,
+GUNICORN_BIND, GUNICORN_WORKER_CLASS, GUNICORN_APP). SSE (/api/cart/events/)
+под WSGI отвечает 501; для него нужен ASGI-воркер:
+GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker GUNICORN_APP=config.asgi:application.
+
+Несколько воркеров требуют общего кэша (CACHE_BACKEND=redis|memcached|db|file):
+с locmem инвалидация доходит только до одного воркера, а лимиты частоты
+умножаются на число воркеров, поэтому такой профиль не запускается.
+GUNICORN_ALLOW_LOCAL_CACHE=1 снимает проверку (например, для замеров только чтения).
+"""
+import multiprocessing
+import os
+import sys
+
+cores = multiprocessing.cpu_count()
+
+wsgi_app = os.environ.get('GUNICORN_APP', 'config.wsgi:application')
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+# Запросы в основном ждут БД, поэтому процессов с запасом, а внутри — потоки
+workers = int(os.environ.get('WEB_CONCURRENCY', cores * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+preload_app = True
+# Перезапуск воркеров против утечек памяти; jitter, чтобы не все сразу
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 5000))
+max_requests_jitter = max_requests // 10
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG') or None
+
+
+def on_starting(server):
+    """Отказ от запуска нескольких воркеров с кэшем в памяти процесса"""
+    backend = os.environ.get('CACHE_BACKEND', 'locmem')
+    if server.cfg.workers > 1 and backend == 'locmem':
+        if os.environ.get('GUNICORN_ALLOW_LOCAL_CACHE') == '1':
+            server.log.warning("CACHE_BACKEND=locmem при %s воркерах: кэш и лимиты у каждого свои",
+                               server.cfg.workers)
+            return
+        server.log.error("CACHE_BACKEND=locmem при %s воркерах: инвалидация кэша не дойдет до "
+                         "остальных воркеров. Задайте общий CACHE_BACKEND или WEB_CONCURRENCY=1",
+                         server.cfg.workers)
+        sys.exit(1)
+
+
+def when_ready(server):
+    """Мастер загрузил приложение: прогреваем кэш до запуска воркеров"""
+    if os.environ.get('WARM_CACHES', '1') == '0':
+        return
+    from django.db import connections
+    from catalog.product_cache import warm_caches
+    try:
+        count = warm_caches()
+        server.log.info("Кэш прогрет: категории и %s товаров", count)
+    except Exception:
+        # Без прогрева сервер все равно работает, кэш заполнится запросами
+        server.log.exception("Не удалось прогреть кэш")
+    finally:
+        # Соединение мастера нельзя делить с воркерами после fork
+        connections.close_all()
+
+
+def post_fork(server, worker):
+    from django.db import connections
+    connections.close_all()
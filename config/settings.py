@@ -1,4 +1,5 @@
 import os
+import sys
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -7,6 +8,8 @@ SECRET_KEY = 'django-insecure-your-secret-key-here-change-it'
 
 DEBUG = True
 
+TESTING = 'test' in sys.argv
+
 ALLOWED_HOSTS = []
 
 INSTALLED_APPS = [
@@ -30,12 +33,16 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'catalog.middleware.ConcurrencyLimitMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'catalog.profiling.ProfilingMiddleware',
+    'catalog.middleware.PerformanceMiddleware',
+    'catalog.querylog.QueryInspectorMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -61,7 +68,17 @@ WSGI_APPLICATION = 'config.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        # Постоянные соединения: воркер не открывает БД на каждый запрос
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 0)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # BEGIN IMMEDIATE: транзакция сразу берет блокировку записи и ждет ее
+            # (timeout), а не падает с "database is locked" при попытке записи
+            # после чтения, когда параллельно пишет другой запрос
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
@@ -80,6 +97,13 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# В тестах хэш пароля не должен быть медленным: PBKDF2 — сотни миллисекунд на пользователя
+if TESTING:
+    PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+# Печатает время прогона тестов (и пишет его в TEST_TIMINGS_FILE, если задан)
+TEST_RUNNER = 'catalog.test_runner.TimedTestRunner'
+
 LANGUAGE_CODE = 'ru-ru'
 TIME_ZONE = 'UTC'
 USE_I18N = True
@@ -91,6 +115,24 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Производные размеры изображений товара (имя -> поле image_<имя>)
+PRODUCT_IMAGE_SIZES = {
+    'large': (800, 800),
+    'medium': (400, 400),
+    'small': (200, 200),
+}
+
+# Ресайз изображений по запросу (/media/resize/<w>x<h>/<path>)
+IMAGE_RESIZE_SIZES = [
+    (800, 800),
+    (400, 400),
+    (200, 200),
+    (100, 100),
+]
+IMAGE_RESIZE_FORMATS = ['jpeg', 'png', 'webp']
+IMAGE_RESIZE_CACHE_DIR = os.path.join(MEDIA_ROOT, 'resized')
+IMAGE_RESIZE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # REST Framework settings
@@ -103,8 +145,28 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
+    # Скорости для catalog.throttling.TokenBucketThrottle по throttle_scope представления.
+    # В тестах выключены; тесты ограничений задают их через override_settings.
+    'DEFAULT_THROTTLE_RATES': {} if TESTING or os.environ.get('DISABLE_THROTTLING') else {
+        'categories': '120/min',
+        'products': '120/min',
+        'login': '10/min',
+    },
+    # Сколько доверенных прокси перед приложением. При 0 IP для ограничений берется
+    # из REMOTE_ADDR: X-Forwarded-For задает клиент, и по нему лимит обходится подменой
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
 }
 
+# Сброс нагрузки: запросов в обработке на процесс, сверх которых отвечаем 503
+CONCURRENCY_LIMIT = int(os.environ.get('CONCURRENCY_LIMIT', 64)) or None
+CONCURRENCY_LIMIT_PATHS = ('/api/',)
+# Долгие потоки держали бы слот все время подключения
+CONCURRENCY_LIMIT_EXEMPT_PATHS = ('/api/cart/events/',)
+CONCURRENCY_LIMIT_RETRY_AFTER = 1
+
+# Сколько секунд кэшируются страницы /swagger/ и /redoc/
+SCHEMA_CACHE_TIMEOUT = 60 * 60
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True
 
@@ -127,4 +189,108 @@ SWAGGER_SETTINGS = {
         'delete',
         'patch'
     ],
-}
\ No newline at end of file
+    # UI загружает готовую схему, а не генерирует ее при каждом открытии
+    'SPEC_URL': '/openapi.json',
+}
+REDOC_SETTINGS = {
+    'SPEC_URL': '/openapi.json',
+}
+
+# Сгенерированная схема API (manage.py export_schema), отдается по /openapi.json
+OPENAPI_SCHEMA_PATH = BASE_DIR / 'config' / 'openapi.json'
+
+# Сколько секунд держится резерв остатка под позицию корзины
+STOCK_RESERVATION_TTL = 30 * 60
+
+# Кэш. По умолчанию у каждого процесса свой (locmem); при нескольких воркерах
+# задайте общий: CACHE_BACKEND=redis|memcached|db|file и CACHE_LOCATION
+# (адрес сервера, имя таблицы для db — создается manage.py createcachetable,
+# или каталог для file). В тестах всегда locmem.
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'db': 'django.core.cache.backends.db.DatabaseCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+    'memcached': 'django.core.cache.backends.memcached.PyMemcacheCache',
+}
+CACHE_BACKEND = 'locmem' if TESTING else os.environ.get('CACHE_BACKEND', 'locmem')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': '' if TESTING else os.environ.get('CACHE_LOCATION', ''),
+        'TIMEOUT': 300,
+    }
+}
+
+# Кэш представлений товаров (/api/products/<slug>/, ?ids=) и дерева категорий:
+# запись сбрасывается при изменении, TTL — страховка от пропущенной инвалидации
+PRODUCT_CACHE_TTL = 300
+PRODUCT_MULTI_GET_MAX = 100
+# Сколько самых популярных товаров загружать в кэш при старте (manage.py warm_caches)
+WARM_CACHE_PRODUCTS = int(os.environ.get('WARM_CACHE_PRODUCTS', 500))
+
+# «Покупают вместе» (manage.py build_related_products): сколько соседей хранить
+# на товар и сколько товаров корзины учитывать (пар — квадрат этого числа)
+RELATED_PRODUCTS_TOP_K = 10
+RELATED_PRODUCTS_MAX_BASKET = 50
+# Насколько раньше начала запуска следующий запуск перечитывает корзины:
+# с запасом больше самой долгой транзакции, меняющей корзину
+RELATED_PRODUCTS_SYNC_MARGIN = 5 * 60
+
+# Сколько секунд хранится ответ на запрос с Idempotency-Key
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+# Через сколько секунд незавершенный запрос с ключом считается прерванным:
+# с запасом больше таймаута воркера gunicorn (GUNICORN_TIMEOUT)
+IDEMPOTENCY_CLAIM_TTL = 3 * int(os.environ.get('GUNICORN_TIMEOUT', 30))
+
+# Push-уведомления корзины (/api/cart/events/, только под ASGI).
+# InProcessBroker работает в пределах одного процесса; для нескольких
+# воркеров укажите брокер с тем же интерфейсом поверх Redis pub/sub.
+EVENTS_BROKER = 'catalog.events.InProcessBroker'
+EVENTS_QUEUE_SIZE = 100
+# Пустой комментарий раз в N секунд держит соединение и выявляет отключившихся клиентов
+EVENTS_HEARTBEAT = 15
+
+# Журнал медленных SQL-запросов и поиск N+1 (QueryInspectorMiddleware)
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', '100'))
+N_PLUS_ONE_THRESHOLD = 5
+QUERY_INSPECTOR_EXPLAIN = True
+QUERY_INSPECTOR_RAISE = False
+
+# Профилирование запросов (ProfilingMiddleware)
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', '0'))
+PROFILING_SAMPLE_INTERVAL = 0.005
+PROFILING_TOKEN_MAX_AGE = 60 * 60
+PROFILING_DIR = os.path.join(BASE_DIR, 'profiles')
+PROFILING_MAX_PROFILES = 200
+
+# Логирование: события catalog пишутся структурированными JSON-строками
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {
+            '()': 'catalog.log.JsonFormatter',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+        'json_console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'json',
+        },
+    },
+    'loggers': {
+        'catalog': {
+            'handlers': ['json_console'],
+            'level': os.environ.get('CATALOG_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+        # Строка на каждый запрос от PerformanceMiddleware; в тестах не нужна
+        'catalog.requests': {
+            'level': 'WARNING' if TESTING else os.environ.get('REQUEST_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
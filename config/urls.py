@@ -2,30 +2,54 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
-from rest_framework import permissions
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
-from catalog.views import home  
-
-schema_view = get_schema_view(
-    openapi.Info(
-        title="Grocery Store API",
-        default_version='v1',
-        description="API для магазина продуктов",
-        contact=openapi.Contact(email="admin@example.com"),
-    ),
-    public=True,
-    permission_classes=[permissions.AllowAny],
-)
+from functools import lru_cache
+from catalog.schema import openapi_schema
+from catalog.views import home, metrics, resized_image
+
+
+@lru_cache(maxsize=None)
+def schema_ui(renderer):
+    """
+    Представление документации drf-yasg, создаваемое при первом обращении.
+    
+    drf-yasg тяжелый и нужен только для /swagger/ и /redoc/, поэтому не
+    импортируется при старте. Сама схема для UI берется из /openapi.json
+    (SPEC_URL), страницы кэшируются на SCHEMA_CACHE_TIMEOUT секунд.
+    """
+    from rest_framework import permissions
+    from drf_yasg.views import get_schema_view
+    from catalog.schema import api_info
+    
+    schema_view = get_schema_view(api_info(), public=True, permission_classes=[permissions.AllowAny])
+    return schema_view.with_ui(renderer, cache_timeout=settings.SCHEMA_CACHE_TIMEOUT)
+
+
+def swagger(request, *args, **kwargs):
+    # Старый адрес схемы (?format=openapi) отдается из готового файла
+    if request.GET.get('format') == 'openapi':
+        return openapi_schema(request)
+    return schema_ui('swagger')(request, *args, **kwargs)
+
+
+def redoc(request, *args, **kwargs):
+    if request.GET.get('format') == 'openapi':
+        return openapi_schema(request)
+    return schema_ui('redoc')(request, *args, **kwargs)
+
 
 urlpatterns = [
     path('', home, name='home'), 
     path('admin/', admin.site.urls),
+    path('metrics', metrics, name='metrics'),
     path('api/', include('catalog.urls')),
     
+    # Изображения произвольных разрешенных размеров из image_original
+    path('media/resize/<int:width>x<int:height>/<path:path>', resized_image, name='image-resize'),
+    
     # Swagger документация
-    path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
-    path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
+    path('swagger/', swagger, name='schema-swagger-ui'),
+    path('redoc/', redoc, name='schema-redoc'),
+    path('openapi.json', openapi_schema, name='openapi-schema'),
 ]
 
 if settings.DEBUG: